@@ -0,0 +1,45 @@
+"""Add geocoded city id and coordinates to profiles
+
+Revision ID: 003
+Revises: 002
+Create Date: 2024-01-03 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('profiles', sa.Column('city_id', sa.Integer(), nullable=True))
+    op.add_column('profiles', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('profiles', sa.Column('longitude', sa.Float(), nullable=True))
+    op.create_index(op.f('ix_profiles_city_id'), 'profiles', ['city_id'], unique=False)
+    op.create_index('ix_profiles_lat_lon', 'profiles', ['latitude', 'longitude'], unique=False)
+
+    # Backfill from the bundled gazetteer, one UPDATE per distinct city
+    from app.geo import get_gazetteer
+    gazetteer = get_gazetteer()
+    conn = op.get_bind()
+    profiles = sa.table('profiles', sa.column('city', sa.String), sa.column('city_id', sa.Integer),
+                        sa.column('latitude', sa.Float), sa.column('longitude', sa.Float))
+    for (name,) in conn.execute(sa.select(profiles.c.city).where(profiles.c.city.isnot(None)).distinct()):
+        city = gazetteer.resolve(name)
+        if city is not None:
+            conn.execute(profiles.update().where(profiles.c.city == name).values(
+                city_id=city.id, latitude=city.latitude, longitude=city.longitude
+            ))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_profiles_lat_lon', table_name='profiles')
+    op.drop_index(op.f('ix_profiles_city_id'), table_name='profiles')
+    op.drop_column('profiles', 'longitude')
+    op.drop_column('profiles', 'latitude')
+    op.drop_column('profiles', 'city_id')
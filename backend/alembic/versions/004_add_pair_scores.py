@@ -0,0 +1,46 @@
+"""Add stored pair scores and their dirty set
+
+Revision ID: 004
+Revises: 003
+Create Date: 2024-01-04 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('pair_scores',
+        sa.Column('user_low_id', sa.Integer(), nullable=False),
+        sa.Column('user_high_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('computed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_low_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['user_high_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_low_id', 'user_high_id')
+    )
+    op.create_index('ix_pair_scores_low_score', 'pair_scores', ['user_low_id', 'score'], unique=False)
+    op.create_index('ix_pair_scores_high_score', 'pair_scores', ['user_high_id', 'score'], unique=False)
+
+    op.create_table('pair_score_dirty',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('marked_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_pair_score_dirty_user_id'), 'pair_score_dirty', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_pair_score_dirty_user_id'), table_name='pair_score_dirty')
+    op.drop_table('pair_score_dirty')
+    op.drop_index('ix_pair_scores_high_score', table_name='pair_scores')
+    op.drop_index('ix_pair_scores_low_score', table_name='pair_scores')
+    op.drop_table('pair_scores')
@@ -0,0 +1,55 @@
+"""Add the profile change feed; it replaces the pair score dirty set
+
+Revision ID: 005
+Revises: 004
+Create Date: 2024-01-05 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('profile_changes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('fields', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_profile_changes_user_id'), 'profile_changes', ['user_id'], unique=False)
+    op.create_index(op.f('ix_profile_changes_created_at'), 'profile_changes', ['created_at'], unique=False)
+
+    op.create_table('change_feed_checkpoints',
+        sa.Column('consumer', sa.String(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('consumer')
+    )
+
+    # Pending dirty marks are lost: run compute_pair_scores.py --full after upgrading
+    op.drop_index(op.f('ix_pair_score_dirty_user_id'), table_name='pair_score_dirty')
+    op.drop_table('pair_score_dirty')
+
+
+def downgrade() -> None:
+    op.create_table('pair_score_dirty',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('marked_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_pair_score_dirty_user_id'), 'pair_score_dirty', ['user_id'], unique=False)
+
+    op.drop_table('change_feed_checkpoints')
+    op.drop_index(op.f('ix_profile_changes_created_at'), table_name='profile_changes')
+    op.drop_index(op.f('ix_profile_changes_user_id'), table_name='profile_changes')
+    op.drop_table('profile_changes')
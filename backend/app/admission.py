@@ -0,0 +1,353 @@
+"""
+Admission control for the expensive endpoints (recommendations, filtered
+search, AI search), so a burst of them cannot starve cheap ones like chat.
+
+Each endpoint has its own AdmissionController, used as a dependency that is
+declared before the user and database dependencies:
+
+- a token bucket per user (RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST), shared
+  between workers through Redis when RATE_LIMIT_REDIS_URL / REDIS_URL is
+  set and reachable, per worker otherwise;
+- at most ADMISSION_MAX_INFLIGHT requests per worker past the dependency
+  (the rest wait there, holding no pooled connection), which bounds the
+  connections these endpoints hold at once;
+- at most ADMISSION_MAX_CONCURRENT calls running their work per worker, up
+  to ADMISSION_MAX_QUEUE more waiting at most ADMISSION_QUEUE_TIMEOUT
+  seconds for either.
+
+The handler passes its work to Admission.run. A result already in the
+search result cache is returned straight away, with no work slot and no
+threadpool hop, even to a rate-limited caller. Otherwise the work waits for
+a slot (the request's database sessions are released first) and runs in
+the threadpool. A call that is not admitted is degraded: it gets the last
+result the user got for the same key (marked with an X-Degraded header), or
+a fast 503 / 429 with Retry-After when there is none. A request that finds
+no in-flight place gets its 503 from the dependency itself, before a
+database session is used, unless the user has a saved result.
+
+Any setting can be overridden per endpoint by suffixing its name, e.g.
+ADMISSION_MAX_CONCURRENT_AI_SEARCH=1.
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.auth import user_id_from_request
+from app.database import get_db, get_read_db
+from app.profiling import run_profiled
+from app.result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", os.getenv("REDIS_URL", ""))
+# Last good results kept per endpoint for degraded calls: users, and keys
+# (distinct searches / pages) per user
+ADMISSION_FALLBACK_SIZE = int(os.getenv("ADMISSION_FALLBACK_SIZE", "2048"))
+ADMISSION_FALLBACK_KEYS = int(os.getenv("ADMISSION_FALLBACK_KEYS", "8"))
+ADMISSION_FALLBACK_TTL = float(os.getenv("ADMISSION_FALLBACK_TTL", "600"))
+DEGRADED_HEADER = "X-Degraded"
+
+def _setting(name, setting, default, cast):
+    """ADMISSION_* / RATE_LIMIT_* setting, overridden per endpoint by a _<NAME> suffix"""
+    value = os.getenv(f"{setting}_{name.upper()}", os.getenv(setting))
+    return cast(value) if value not in (None, "") else default
+
+class ConcurrencyLimiter:
+    """
+    At most max_concurrent holders, up to max_queue more waiting (FIFO) for
+    at most queue_timeout seconds. Used from the event loop only.
+    """
+
+    def __init__(self, max_concurrent, max_queue, queue_timeout):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waiters = deque()
+
+    def available(self) -> bool:
+        """True if acquire() would not wait"""
+        return self.active < self.max_concurrent and not self._waiters
+
+    async def acquire(self) -> bool:
+        """True once a slot is held, False if the queue is full or the wait timed out"""
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Client gone: give back a slot handed over meanwhile
+            if waiter.done():
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+        if waiter.done():
+            self.admitted += 1
+            return True
+        self._waiters.remove(waiter)
+        self.timed_out += 1
+        return False
+
+    def release(self):
+        # Hand the slot straight to the next waiter, if any
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def retry_after(self):
+        """Seconds a rejected client should wait: about one queue's worth of calls"""
+        return max(1, math.ceil(self.queue_timeout))
+
+    def stats(self):
+        return {
+            "active": self.active, "waiting": len(self._waiters),
+            "admitted": self.admitted, "rejected": self.rejected, "timed_out": self.timed_out,
+        }
+
+# Token bucket in a Redis hash, refilled and taken from atomically
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "at")
+local tokens = tonumber(bucket[1]) or burst
+local at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tokens, "at", now)
+redis.call("EXPIRE", KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+_redis_clients = {}
+_redis_lock = threading.Lock()
+
+def _redis_client(url):
+    with _redis_lock:
+        if url not in _redis_clients:
+            try:
+                import redis
+                _redis_clients[url] = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+            except ImportError:
+                logger.warning("redis is not installed; rate limits are per worker")
+                _redis_clients[url] = None
+        return _redis_clients[url]
+
+class RateLimiter:
+    """
+    Token buckets per key: `per_minute` tokens a minute, up to `burst` saved.
+    Kept in Redis when configured; if Redis is unreachable the buckets of
+    this worker are used and Redis is retried later.
+    """
+
+    def __init__(self, name, per_minute, burst, redis_url="", max_keys=100000):
+        self.name = name
+        self.rate = per_minute / 60
+        self.burst = max(1, burst)
+        self.max_keys = max_keys
+        self.limited = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._retry_at = 0.0
+        self._redis = _redis_client(redis_url) if redis_url and per_minute > 0 else None
+        self._script = self._redis.register_script(_TOKEN_BUCKET_SCRIPT) if self._redis is not None else None
+
+    async def take_async(self, key) -> float:
+        """take() without blocking the event loop on Redis"""
+        if self._script is not None and time.monotonic() >= self._retry_at:
+            return await run_in_threadpool(self.take, key)
+        return self.take(key)
+
+    def take(self, key) -> float:
+        """0 if a token was taken, else seconds until one is available"""
+        if self.rate <= 0 or key is None:
+            return 0.0
+        wait = self._take_shared(key)
+        if wait is None:
+            wait = self._take_local(key)
+        if wait > 0:
+            self.limited += 1
+        return wait
+
+    def _take_shared(self, key):
+        if self._script is None or time.monotonic() < self._retry_at:
+            return None
+        try:
+            return float(self._script(keys=[f"ratelimit:{self.name}:{key}"],
+                                      args=[self.rate, self.burst, time.time()]))
+        except Exception as e:
+            logger.warning("Rate limiter: Redis unavailable (%s)", e)
+            self._retry_at = time.monotonic() + 10
+            return None
+
+    def _take_local(self, key):
+        now = time.monotonic()
+        with self._lock:
+            tokens, at = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - at) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+def _turned_away(status_code, retry_after):
+    return HTTPException(
+        status_code=status_code,
+        detail="Too many requests, please retry shortly",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+class Admission:
+    """One request's admission: serve a cached result, run the work, or fall back to the last result"""
+
+    def __init__(self, controller, response: Response, user_id=None, status_code=None, retry_after=None,
+                 sessions=()):
+        self.controller = controller
+        self.response = response
+        self.user_id = user_id
+        # Set when the caller is already turned away (rate limited)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.sessions = sessions
+
+    async def run(self, key, fn, *args, cached=None):
+        """
+        cached() if it has a result; else fn(*args) in the threadpool once a
+        slot is free, remembered under `key`; when not admitted, the result
+        last remembered under `key` instead
+        """
+        if cached is not None:
+            result = cached()
+            if result is not None:
+                self.controller.cache_hits += 1
+                return result
+        if self.status_code is None:
+            limiter = self.controller.limiter
+            if not limiter.available():
+                # Give the connections back while waiting for a slot
+                for session in self.sessions:
+                    session.rollback()
+            if await limiter.acquire():
+                try:
+                    result = await run_in_threadpool(run_profiled, fn, *args)
+                finally:
+                    limiter.release()
+                self.controller.remember(self.user_id, key, result)
+                return result
+            self.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            self.retry_after = limiter.retry_after()
+        result = self.controller.recall(self.user_id, key)
+        if result is None:
+            raise _turned_away(self.status_code, self.retry_after)
+        self.controller.degraded += 1
+        self.response.headers[DEGRADED_HEADER] = "stale"
+        return result
+
+class AdmissionController:
+    """Rate limit, concurrency limit and fallback results of one endpoint"""
+
+    def __init__(self, name):
+        self.name = name
+        max_concurrent = _setting(name, "ADMISSION_MAX_CONCURRENT", 2, int)
+        max_queue = _setting(name, "ADMISSION_MAX_QUEUE", 8, int)
+        queue_timeout = _setting(name, "ADMISSION_QUEUE_TIMEOUT", 2.0, float)
+        # Work slots, and a larger number of requests in the handler so
+        # cache hits get through while the slots are busy
+        self.limiter = ConcurrencyLimiter(max_concurrent, max_queue, queue_timeout)
+        self.inflight = ConcurrencyLimiter(
+            _setting(name, "ADMISSION_MAX_INFLIGHT", 2 * max_concurrent, int), max_queue, queue_timeout
+        )
+        self.rate_limiter = RateLimiter(
+            name,
+            _setting(name, "RATE_LIMIT_PER_MINUTE", 60.0, float),
+            _setting(name, "RATE_LIMIT_BURST", 20, int),
+            RATE_LIMIT_REDIS_URL,
+        )
+        # user id -> {key: result}, most recent last
+        self.fallback = ResultCache(ADMISSION_FALLBACK_SIZE, ADMISSION_FALLBACK_TTL, None)
+        self.degraded = 0
+        self.cache_hits = 0
+
+    def remember(self, user_id, key, result):
+        # Only touched from the event loop
+        results = self.fallback.get(user_id) or OrderedDict()
+        results.pop(key, None)
+        results[key] = result
+        while len(results) > ADMISSION_FALLBACK_KEYS:
+            results.popitem(last=False)
+        self.fallback.set(user_id, results)
+
+    def recall(self, user_id, key):
+        results = self.fallback.get(user_id)
+        return results.get(key) if results else None
+
+    async def __call__(self, request: Request, response: Response,
+                       db: Session = Depends(get_db), read_db: Session = Depends(get_read_db)):
+        """
+        Dependency yielding the request's Admission (the in-flight place is
+        held until the response is sent). The sessions are the ones the
+        handler and its user dependency get (FastAPI resolves a dependency
+        once per request); they open no connection until used.
+        """
+        user_id = user_id_from_request(request)
+        sessions = (db, read_db)
+        wait = await self.rate_limiter.take_async(user_id)
+        if await self.inflight.acquire():
+            try:
+                if wait > 0:
+                    yield Admission(self, response, user_id, status.HTTP_429_TOO_MANY_REQUESTS,
+                                    math.ceil(wait), sessions)
+                else:
+                    yield Admission(self, response, user_id, sessions=sessions)
+            finally:
+                self.inflight.release()
+            return
+        status_code, retry_after = status.HTTP_503_SERVICE_UNAVAILABLE, self.inflight.retry_after()
+        if user_id is None or self.fallback.get(user_id) is None:
+            raise _turned_away(status_code, retry_after)
+        yield Admission(self, response, user_id, status_code, retry_after, sessions)
+
+    def stats(self):
+        return {**self.limiter.stats(), "inflight": self.inflight.stats(), "rate_limited": self.rate_limiter.limited,
+                "cache_hits": self.cache_hits, "degraded": self.degraded}
+
+admission_controllers = {
+    name: AdmissionController(name) for name in ("recommendations", "search", "ai_search")
+}
+
+def admission_stats():
+    return {name: controller.stats() for name, controller in admission_controllers.items()}
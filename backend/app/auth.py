@@ -1,29 +1,154 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from functools import lru_cache
+from typing import Optional, NamedTuple, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-import hashlib
-from fastapi import HTTPException, status, Depends
+import asyncio
+import os
+import threading
+import time
+from fastapi import HTTPException, status, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import User
+from app.models import User, Profile
 
 # Configuration
 SECRET_KEY = "your-secret-key-here"  # In production, use environment variable
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost: 2^rounds iterations (about 250 ms per hash at 12). Hashes
+# below it, and legacy unsalted SHA-256 hex digests, are replaced with a
+# hash at this cost on the user's next successful login.
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "12"))
+# Hashing runs on its own threads (bcrypt releases the GIL), never on the
+# event loop: this many at once, this many more waiting, 503 beyond that
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "64"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt", "hex_sha256"],
+    deprecated=["hex_sha256"],
+    bcrypt__default_rounds=PASSWORD_HASH_ROUNDS,
+    bcrypt__min_rounds=PASSWORD_HASH_ROUNDS,
+)
 security = HTTPBearer()
 
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
+
+# Seconds an authenticated user lookup is reused (per worker process)
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
+# Operators allowed to use the admin endpoints (comma-separated ids / emails)
+ADMIN_USER_IDS = {int(i) for i in os.getenv("ADMIN_USER_IDS", "").split(",") if i.strip()}
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+class UserPrincipal(NamedTuple):
+    """What most handlers need to know about the caller, without an ORM load"""
+    id: int
+    is_active: bool
+    profile_id: Optional[int]
+
+class PrincipalCache:
+    """Short-TTL user id -> UserPrincipal cache"""
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            principal, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            return principal
+
+    def set(self, principal):
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                # Drop the oldest entry (dicts keep insertion order)
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[principal.id] = (principal, time.monotonic() + self.ttl)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_SIZE)
+
+def invalidate_principal(user_id: int):
+    principal_cache.invalidate(user_id)
+
+# Keep cached principals in line with writes to the fields they hold
+@event.listens_for(User, "after_update")
+def _invalidate_on_user_update(mapper, connection, target):
+    invalidate_principal(target.id)
+
+@event.listens_for(Profile, "after_insert")
+@event.listens_for(Profile, "after_delete")
+def _invalidate_on_profile_change(mapper, connection, target):
+    if target.user_id is not None:
+        invalidate_principal(target.user_id)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    # Use simple hash verification for now
-    return hashlib.sha256(plain_password.encode()).hexdigest() == hashed_password
+    return verify_and_update_password(plain_password, hashed_password)[0]
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """(valid, replacement hash if the stored one is legacy or below the current cost)"""
+    try:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+    except ValueError:
+        # Not a hash of any known scheme
+        return False, None
 
 def get_password_hash(password: str) -> str:
-    # Use a simple hash for now to avoid bcrypt issues
-    return hashlib.sha256(password.encode()).hexdigest()
+    return pwd_context.hash(password)
+
+@lru_cache(maxsize=1)
+def _dummy_hash() -> str:
+    return pwd_context.hash("not a password")
+
+def _verify_unknown(plain_password: str) -> Tuple[bool, Optional[str]]:
+    # Same work as a real check so response times don't reveal unknown emails
+    pwd_context.verify(plain_password, _dummy_hash())
+    return False, None
+
+async def _run_hashing(fn, *args):
+    """Run fn on the password hashing threads; 503 when they are saturated"""
+    if not _hash_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-ins in progress, please retry",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+    finally:
+        _hash_slots.release()
+
+async def hash_password_async(password: str) -> str:
+    return await _run_hashing(get_password_hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """verify_and_update_password off the event loop; None (no such user) costs the same"""
+    if hashed_password is None:
+        return await _run_hashing(_verify_unknown, plain_password)
+    return await _run_hashing(verify_and_update_password, plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -50,6 +175,58 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
         raise credentials_exception
     return user_id
 
+def user_id_from_request(request: Request) -> Optional[int]:
+    """Best-effort user id from the bearer token; None if missing or invalid"""
+    authorization = request.headers.get("Authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return int(payload.get("sub"))
+    except (JWTError, ValueError, TypeError):
+        return None
+
+def load_principal(db: Session, user_id: int) -> Optional[UserPrincipal]:
+    """Cached principal lookup: one id/is_active/profile id row on a miss"""
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        row = db.query(User.id, User.is_active, Profile.id).outerjoin(
+            Profile, Profile.user_id == User.id
+        ).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        principal = UserPrincipal(id=row[0], is_active=bool(row[1]), profile_id=row[2])
+        principal_cache.set(principal)
+    return principal
+
+def get_current_principal(user_id: str = Depends(verify_token), db: Session = Depends(get_db)) -> UserPrincipal:
+    """
+    Authenticated caller for handlers that only need the id (and whether a
+    profile exists); skips loading the User row on cache hits.
+    """
+    try:
+        user_id_int = int(user_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid user ID"
+        )
+    principal = load_principal(db, user_id_int)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found"
+        )
+    if not principal.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Account is deactivated"
+        )
+    # Lets the session attribute its writes to this user (read-your-writes)
+    db.info["user_id"] = principal.id
+    return principal
+
 def get_current_user(user_id: str = Depends(verify_token), db: Session = Depends(get_db)):
     try:
         user_id_int = int(user_id)
@@ -59,9 +236,24 @@ def get_current_user(user_id: str = Depends(verify_token), db: Session = Depends
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="User not found"
             )
+        # Lets the session attribute its writes to this user (read-your-writes)
+        db.info["user_id"] = user.id
         return user
     except (ValueError, TypeError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid user ID"
         )
+
+def is_admin(user: Optional[User]) -> bool:
+    return user is not None and user.is_active and (
+        user.id in ADMIN_USER_IDS or (user.email or "").lower() in ADMIN_EMAILS
+    )
+
+def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+    if not is_admin(current_user):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
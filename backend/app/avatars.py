@@ -0,0 +1,147 @@
+import asyncio
+import glob
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+
+from app.storage import get_avatar_storage, content_key
+
+# Directory of legacy per-user avatar files (user_{id}_avatar*)
+AVATAR_DIR = "uploads/avatars"
+AVATAR_MAX_BYTES = int(os.getenv("AVATAR_MAX_BYTES", str(10 * 1024 * 1024)))
+AVATAR_WORKERS = int(os.getenv("AVATAR_WORKERS", "2"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp'}
+
+# Square WebP variants produced for every upload: "sm" for cards and
+# lists, "md" for the profile page
+AVATAR_VARIANTS = {"sm": 128, "md": 512}
+DEFAULT_VARIANT = "md"
+WEBP_QUALITY = 82
+# Refuse images that would decode to more pixels than this (decompression bombs)
+MAX_IMAGE_PIXELS = 40_000_000
+
+# Image decoding/resizing is CPU bound; keep it off the event loop and bounded
+_executor = ThreadPoolExecutor(max_workers=AVATAR_WORKERS, thread_name_prefix="avatar")
+
+def variant_url(url, variant):
+    """Map an avatar URL to another variant; non-pipeline URLs are returned unchanged"""
+    if not url:
+        return url
+    for name in AVATAR_VARIANTS:
+        suffix = f"_{name}.webp"
+        if url.endswith(suffix):
+            return url[: -len(suffix)] + f"_{variant}.webp"
+    return url
+
+def thumbnail_url(url):
+    return variant_url(url, "sm")
+
+async def save_upload_to_temp(file: UploadFile, max_bytes=AVATAR_MAX_BYTES):
+    """
+    Stream an upload to a temporary file in chunks, enforcing a size cap.
+    Disk writes run in the threadpool so the event loop is never blocked.
+    Returns (temp_path, sha256 hex digest of the content).
+    """
+    fd, temp_path = tempfile.mkstemp(prefix="avatar_upload_")
+    out = os.fdopen(fd, "wb")
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > max_bytes:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"File too large. Maximum size is {max_bytes // (1024 * 1024)} MB"
+                )
+            digest.update(chunk)
+            await run_in_threadpool(out.write, chunk)
+    except BaseException:
+        out.close()
+        os.unlink(temp_path)
+        raise
+    out.close()
+    return temp_path, digest.hexdigest()
+
+def _render_variants(source_path, digest, storage):
+    """
+    Decode, orient and resize the upload into WebP variants stored under
+    content-addressed keys; returns {variant: key}. Re-uploads of an image
+    that is already stored are not re-encoded, but its blobs are touched so
+    the garbage collector's grace period covers them until the profile
+    commits.
+    """
+    from PIL import Image, ImageOps
+
+    keys = {variant: content_key(digest, variant) for variant in AVATAR_VARIANTS}
+    if all(storage.touch(key) for key in keys.values()):
+        return keys
+
+    try:
+        image = Image.open(source_path)
+    except Exception:
+        raise ValueError("File is not a valid image")
+    with image:
+        # Checked on the header, before anything is decoded
+        if image.width * image.height > MAX_IMAGE_PIXELS:
+            raise ValueError("Image dimensions are too large")
+        try:
+            image.seek(0)  # first frame of animated images
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        except Exception:
+            raise ValueError("File is not a valid image")
+
+    for variant, size in AVATAR_VARIANTS.items():
+        fd, temp_path = tempfile.mkstemp(prefix="avatar_variant_", suffix=".webp")
+        os.close(fd)
+        try:
+            variant_image = ImageOps.fit(image, (size, size), method=Image.Resampling.BICUBIC)
+            variant_image.save(temp_path, "WEBP", quality=WEBP_QUALITY, method=4)
+            storage.put_file(keys[variant], temp_path)
+        finally:
+            os.unlink(temp_path)
+    return keys
+
+def remove_legacy_avatars(user_id):
+    """Delete pre-content-addressing avatar files (user_{id}_avatar.*, any case)"""
+    for path in glob.glob(os.path.join(AVATAR_DIR, f"user_{user_id}_avatar*")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+async def process_avatar_upload(file: UploadFile, user_id: int):
+    """
+    Store an uploaded avatar: stream it to disk, render the WebP variants in
+    the avatar worker pool into content-addressed storage and drop the
+    user's legacy files. Blobs of replaced avatars are left for gc_avatars.py.
+    Returns {variant: url}.
+    """
+    extension = file.filename.split(".")[-1].lower() if file.filename and "." in file.filename else ""
+    if extension not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File type not allowed. Allowed types: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
+        )
+
+    temp_path, digest = await save_upload_to_temp(file)
+    storage = get_avatar_storage()
+    loop = asyncio.get_running_loop()
+    try:
+        keys = await loop.run_in_executor(_executor, _render_variants, temp_path, digest, storage)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    finally:
+        os.unlink(temp_path)
+
+    await run_in_threadpool(remove_legacy_avatars, user_id)
+    return {variant: storage.url(key) for variant, key in keys.items()}
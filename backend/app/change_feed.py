@@ -0,0 +1,253 @@
+"""
+Change feed of profile, interest and skill edits (a transactional outbox).
+
+The mutation endpoints in routers/users.py call record_change() before they
+commit, so a profile_changes row exists exactly when its edit committed;
+the row id is the change's position in the feed. Derived data is kept
+fresh by consumers that apply the feed in order, a batch at a time:
+
+    pair_scores     compute_pair_scores.py --watch (the pair-scores
+                    service; replay_changes.py to reapply): recomputes the
+                    stored pair scores of changed users; its position is a
+                    change_feed_checkpoints row committed in the same
+                    transaction as the scores
+    every worker    ChangeFeedFollower: refreshes the worker's feature
+                    store (bio TF-IDF vectors included), invalidates its
+                    cached search rankings and, when names changed, its
+                    query vocabulary; its position lives in memory
+
+Changes every durable consumer has applied are pruned after
+CHANGE_FEED_RETENTION_DAYS by the pair-scores service (see prune()).
+
+Consumers pause between batches so that a burst of edits is applied at a
+bounded share of the process's time, and a worker that falls too far
+behind rebuilds its engine state once instead of replaying every change.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import ProfileChange, ChangeFeedCheckpoint
+
+logger = logging.getLogger(__name__)
+
+# Changes applied per batch
+CHANGE_FEED_BATCH_SIZE = int(os.getenv("CHANGE_FEED_BATCH_SIZE", "500"))
+# Seconds between polls once a consumer has caught up
+CHANGE_FEED_POLL_INTERVAL = float(os.getenv("CHANGE_FEED_POLL_INTERVAL", "2"))
+# Largest share of its time a worker spends applying changes during a burst
+CHANGE_FEED_MAX_DUTY = float(os.getenv("CHANGE_FEED_MAX_DUTY", "0.25"))
+# A worker further behind than this rebuilds its engine state instead
+CHANGE_FEED_MAX_LAG = int(os.getenv("CHANGE_FEED_MAX_LAG", "5000"))
+# Seconds to wait on a missing id: the transaction holding it may still commit
+CHANGE_FEED_GAP_SECONDS = float(os.getenv("CHANGE_FEED_GAP_SECONDS", "5"))
+# Days applied changes are kept (for replays) before prune() drops them
+CHANGE_FEED_RETENTION_DAYS = float(os.getenv("CHANGE_FEED_RETENTION_DAYS", "30"))
+# Checkpoint names of the durable consumers; a change is only pruned once
+# all of them have applied it
+DURABLE_CONSUMERS = ("pair_scores",)
+
+# Changes to these may add names the query parser does not know yet
+VOCABULARY_FIELDS = {"interests", "skills"}
+
+def record_change(db: Session, user_id: int, fields):
+    """Add a change to the feed in the caller's transaction"""
+    db.add(ProfileChange(user_id=user_id, fields=",".join(sorted(fields))))
+
+def head(db: Session) -> int:
+    """Position of the latest change"""
+    return db.query(func.max(ProfileChange.id)).scalar() or 0
+
+def read_checkpoint(db: Session, consumer: str, for_update=False) -> int:
+    query = db.query(ChangeFeedCheckpoint.position).filter(ChangeFeedCheckpoint.consumer == consumer)
+    if for_update:
+        query = query.with_for_update()
+    row = query.first()
+    return row[0] if row else 0
+
+def write_checkpoint(db: Session, consumer: str, position: int):
+    """Move a durable consumer to `position` in the caller's transaction"""
+    checkpoint = db.get(ChangeFeedCheckpoint, consumer)
+    if checkpoint is None:
+        db.add(ChangeFeedCheckpoint(consumer=consumer, position=position))
+    else:
+        checkpoint.position = position
+
+def prune(db: Session, days=CHANGE_FEED_RETENTION_DAYS) -> int:
+    """Delete changes older than `days` that every durable consumer has applied; returns how many"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    applied = min(read_checkpoint(db, name) for name in DURABLE_CONSUMERS)
+    deleted = db.query(ProfileChange).filter(
+        ProfileChange.id <= applied, ProfileChange.created_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+def _throttle(busy_seconds, max_duty):
+    """Sleep so that busy_seconds is at most max_duty of the elapsed time"""
+    if 0 < max_duty < 1:
+        time.sleep(busy_seconds * (1 - max_duty) / max_duty)
+
+class ChangeFeedReader:
+    """
+    Reads the feed in order. Ids are taken when a transaction inserts, not
+    when it commits, so a missing id may still appear; a batch stops
+    before such a gap until it has been missing for CHANGE_FEED_GAP_SECONDS
+    (rolled back transactions leave gaps that never fill).
+    """
+
+    def __init__(self, batch_size=CHANGE_FEED_BATCH_SIZE, gap_seconds=CHANGE_FEED_GAP_SECONDS):
+        self.batch_size = batch_size
+        self.gap_seconds = gap_seconds
+        self._gaps = {}  # first missing id -> when it was first seen missing
+
+    def read(self, db: Session, position: int):
+        """Up to batch_size (id, user_id, fields) changes after `position`"""
+        changes = db.query(ProfileChange.id, ProfileChange.user_id, ProfileChange.fields).filter(
+            ProfileChange.id > position
+        ).order_by(ProfileChange.id).limit(self.batch_size).all()
+        now = time.monotonic()
+        expected = position + 1
+        for i, change in enumerate(changes):
+            if change.id != expected and now - self._gaps.setdefault(expected, now) < self.gap_seconds:
+                return changes[:i]
+            expected = change.id + 1
+        self._gaps = {gap: seen for gap, seen in self._gaps.items() if gap >= expected}
+        return changes
+
+class DurableConsumer:
+    """
+    Applies the feed with apply(db, changes), whose writes are committed in
+    the same transaction as the new checkpoint: a batch is either applied
+    and recorded or, after a crash, applied again. apply must therefore be
+    idempotent, which also makes replays safe.
+    """
+
+    def __init__(self, name, apply, batch_size=CHANGE_FEED_BATCH_SIZE):
+        self.name = name
+        self.apply = apply
+        self.reader = ChangeFeedReader(batch_size)
+
+    def step(self, db: Session) -> int:
+        """Apply one batch; returns the number of changes applied"""
+        # Locks the checkpoint row, so concurrent runs take turns
+        position = read_checkpoint(db, self.name, for_update=True)
+        changes = self.reader.read(db, position)
+        if not changes:
+            db.rollback()
+            return 0
+        self.apply(db, changes)
+        write_checkpoint(db, self.name, changes[-1].id)
+        db.commit()
+        return len(changes)
+
+    def catch_up(self, db: Session, max_duty=1.0) -> int:
+        """Apply batches until the feed is drained; returns the number of changes applied"""
+        total = 0
+        while True:
+            started = time.perf_counter()
+            applied = self.step(db)
+            if not applied:
+                return total
+            total += applied
+            _throttle(time.perf_counter() - started, max_duty)
+
+    def lag(self, db: Session) -> int:
+        return max(0, head(db) - read_checkpoint(db, self.name))
+
+class ChangeFeedFollower:
+    """
+    Keeps one worker's in-memory derived data in step with edits made
+    through any worker, from a daemon thread.
+    """
+
+    def __init__(self, engine, batch_size=CHANGE_FEED_BATCH_SIZE):
+        self.engine = engine
+        self.reader = ChangeFeedReader(batch_size)
+        self.position = None
+        self.applied = 0
+        self.rebuilds = 0
+        self._thread = None
+
+    def mark_start(self, session_factory):
+        """
+        Start from the current head. Call before engine state is built from
+        the same source, so the state includes everything up to it.
+        """
+        try:
+            with session_factory() as db:
+                self.position = head(db)
+        except Exception as e:
+            logger.warning("Change feed unavailable, following from the first poll: %s", e)
+
+    def step(self, db: Session, session_factory) -> int:
+        """Apply one batch; returns the number of changes applied"""
+        if self.position is None:
+            self.position = head(db)
+            return 0
+        changes = self.reader.read(db, self.position)
+        if not changes:
+            return 0
+        if len(changes) == self.reader.batch_size:
+            latest = head(db)
+            if latest - self.position > CHANGE_FEED_MAX_LAG and self.engine.rebuild(session_factory):
+                logger.info("Change feed: %d changes behind, rebuilt engine state", latest - self.position)
+                self._invalidate(vocabulary=True, user_ids=None)
+                self.position = latest
+                self.rebuilds += 1
+                return 0
+        self.apply(db, changes)
+        self.position = changes[-1].id
+        self.applied += len(changes)
+        return len(changes)
+
+    def apply(self, db: Session, changes):
+        user_ids = sorted({change.user_id for change in changes})
+        for user_id in user_ids:
+            self.engine.refresh_profile(db, user_id)
+        self._invalidate(vocabulary=any(
+            VOCABULARY_FIELDS.intersection(change.fields.split(",")) for change in changes
+        ), user_ids=user_ids)
+
+    def _invalidate(self, vocabulary, user_ids):
+        """Drop derived data for `user_ids` (everyone for None)"""
+        from app.query_parser import expire_query_parser
+        from app.result_cache import profile_cache, profile_write_version
+
+        # Other workers counted their own writes already
+        profile_write_version.bump(shared=False)
+        if user_ids is None:
+            profile_cache.clear()
+        else:
+            profile_cache.discard(user_ids)
+        if vocabulary:
+            expire_query_parser()
+
+    def start(self, session_factory, interval=CHANGE_FEED_POLL_INTERVAL, max_duty=CHANGE_FEED_MAX_DUTY):
+        if interval <= 0 or self._thread is not None:
+            return
+
+        def follow():
+            while True:
+                try:
+                    with session_factory() as db:
+                        while True:
+                            started = time.perf_counter()
+                            if not self.step(db, session_factory):
+                                break
+                            db.rollback()  # end the read transaction between batches
+                            _throttle(time.perf_counter() - started, max_duty)
+                except Exception:
+                    logger.exception("Change feed follower failed")
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=follow, name="change-feed", daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        return {"position": self.position, "applied": self.applied, "rebuilds": self.rebuilds}
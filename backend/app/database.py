@@ -1,21 +1,346 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, NullPool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError, OperationalError
+import contextvars
+import itertools
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from fastapi import Request
+
+from app.metrics import Histogram
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://user:password@db:5432/people_search")
+# Comma-separated read replicas; empty means all reads go to the primary
+DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+# Seconds a user's reads stay on the primary after they wrote something
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", "5"))
+# Response header with the time of the request's last commit (Unix
+# seconds); clients send the latest one back so any worker sees the write
+LAST_WRITE_HEADER = "X-Last-Write"
+# Seconds before an unhealthy replica is health-checked again
+REPLICA_RETRY_INTERVAL = float(os.getenv("REPLICA_RETRY_INTERVAL", "10"))
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# Connection pool settings (per worker process)
+#   DB_POOL_SIZE          persistent connections per worker
+#   DB_MAX_OVERFLOW       extra connections allowed under bursts
+#   DB_MAX_CONNECTIONS    optional server-wide budget; when set, each worker
+#                         gets DB_MAX_CONNECTIONS // WEB_CONCURRENCY in all:
+#                         up to DB_POOL_SIZE persistent, the rest overflow
+#                         (DB_MAX_OVERFLOW is then ignored)
+#   DB_POOL_TIMEOUT       seconds to wait for a free connection
+#   DB_POOL_RECYCLE       seconds before a connection is replaced
+#   DB_POOL_PRE_PING      test connections on checkout (survives DB restarts)
+#   DB_PGBOUNCER          running behind PgBouncer in transaction mode: let
+#                         PgBouncer do the pooling and keep none locally
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+DB_MAX_CONNECTIONS = os.getenv("DB_MAX_CONNECTIONS")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+if DB_MAX_CONNECTIONS:
+    # pool_size + max_overflow is the most a worker ever opens
+    _worker_budget = max(1, int(DB_MAX_CONNECTIONS) // WEB_CONCURRENCY)
+    DB_POOL_SIZE = max(1, min(DB_POOL_SIZE, _worker_budget))
+    DB_MAX_OVERFLOW = _worker_budget - DB_POOL_SIZE
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+DB_POOL_USE_LIFO = _env_bool("DB_POOL_USE_LIFO", True)
+DB_PGBOUNCER = _env_bool("DB_PGBOUNCER", False)
+
+class PoolMetrics:
+    """Checkout latency / wait statistics collected by InstrumentedQueuePool"""
+
+    def __init__(self):
+        self.checkout_latency = Histogram()
+        self.wait_time_total = 0.0
+        self.waits = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def record_checkout(self, elapsed, waited):
+        self.checkout_latency.observe(elapsed)
+        if waited:
+            with self._lock:
+                self.waits += 1
+                self.wait_time_total += elapsed
+
+    def record_timeout(self, elapsed):
+        self.checkout_latency.observe(elapsed)
+        with self._lock:
+            self.timeouts += 1
+            self.waits += 1
+            self.wait_time_total += elapsed
+
+pool_metrics = PoolMetrics()
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times every checkout and counts waits on an exhausted pool"""
+
+    metrics = pool_metrics
+
+    def _do_get(self):
+        waited = self.checkedin() == 0 and self.overflow() >= self._max_overflow
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_timeout(time.perf_counter() - started)
+            raise
+        self.metrics.record_checkout(time.perf_counter() - started, waited)
+        return conn
+
+def _engine_options(url):
+    if url.startswith("sqlite"):
+        return {"pool_pre_ping": DB_POOL_PRE_PING}
+    if DB_PGBOUNCER:
+        # PgBouncer pools server connections; a local pool would pin them
+        return {"poolclass": NullPool}
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_use_lifo": DB_POOL_USE_LIFO,
+    }
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+
+@event.listens_for(engine, "connect")
+def _count_connect(dbapi_connection, connection_record):
+    pool_metrics.connects += 1
+
+@event.listens_for(engine, "invalidate")
+def _count_invalidate(dbapi_connection, connection_record, exception):
+    pool_metrics.invalidations += 1
 
-engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+class Replica:
+    """A read replica engine with a simple circuit breaker"""
+
+    def __init__(self, url):
+        self.url = url
+        self.engine = create_engine(url, **_engine_options(url))
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.healthy = True
+        self.retry_at = 0.0
+        event.listen(self.engine, "handle_error", self._on_error)
+
+    def _on_error(self, context):
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+            self.mark_down()
+
+    def mark_down(self):
+        self.healthy = False
+        self.retry_at = time.monotonic() + REPLICA_RETRY_INTERVAL
+
+    def available(self):
+        """True if usable; an unhealthy replica is pinged once its retry time has passed"""
+        if self.healthy:
+            return True
+        if time.monotonic() < self.retry_at:
+            return False
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except Exception:
+            self.mark_down()
+            return False
+        self.healthy = True
+        return True
+
+class ReplicaRouter:
+    """
+    Hands out sessions for read-only work: round-robin over healthy replicas,
+    falling back to the primary when none is available or when the user
+    wrote within READ_YOUR_WRITES_WINDOW (so they see their own changes).
+
+    Which users wrote recently is known to the worker that took the write;
+    other workers learn it from the last-write time the client sends back
+    (LAST_WRITE_HEADER, see ReadYourWritesMiddleware).
+    """
+
+    def __init__(self, primary_factory, replica_urls):
+        self.primary_factory = primary_factory
+        self.replicas = [Replica(url) for url in replica_urls]
+        self._cycle = itertools.cycle(self.replicas) if self.replicas else None
+        self._lock = threading.Lock()
+        self._recent_writers = {}
+
+    def record_write(self, user_id):
+        with self._lock:
+            self._recent_writers[user_id] = time.monotonic() + READ_YOUR_WRITES_WINDOW
+
+    def wrote_recently(self, user_id, last_write=None):
+        """True if `user_id` wrote through this worker, or `last_write` (Unix time) is, within the window"""
+        if last_write is not None and abs(time.time() - last_write) < READ_YOUR_WRITES_WINDOW:
+            return True
+        if user_id is None:
+            return False
+        with self._lock:
+            until = self._recent_writers.get(user_id)
+            if until is None:
+                return False
+            if until < time.monotonic():
+                del self._recent_writers[user_id]
+                return False
+            return True
+
+    def choose(self):
+        """Next available replica in round-robin order, or None"""
+        if not self.replicas:
+            return None
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                replica = next(self._cycle)
+            if replica.available():
+                return replica
+        return None
+
+    def read_session(self, user_id=None, last_write=None):
+        if not self.wrote_recently(user_id, last_write):
+            replica = self.choose()
+            if replica is not None:
+                session = replica.SessionLocal()
+                session.info["replica"] = replica.url
+                return session
+        return self.primary_factory()
+
+    def stats(self):
+        return [{"url": r.engine.url.render_as_string(hide_password=True), "healthy": r.healthy}
+                for r in self.replicas]
+
+replica_router = ReplicaRouter(SessionLocal, DATABASE_REPLICA_URLS)
+
+class RequestWrites:
+    """Time of the current request's last commit of the user's writes"""
+
+    def __init__(self):
+        self.last_write = None
+
+current_request_writes = contextvars.ContextVar("current_request_writes", default=None)
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI middleware sending the time of a request's last commit to the
+    client in LAST_WRITE_HEADER, for it to send back on its next requests
+    (whichever worker serves them)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        writes = RequestWrites()
+        token = current_request_writes.set(writes)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and writes.last_write is not None:
+                header = (LAST_WRITE_HEADER.lower().encode(), f"{writes.last_write:.3f}".encode())
+                message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request_writes.reset(token)
+
+def last_write_from_request(request: Request):
+    """The last-write time the client sent, or None if missing or malformed"""
+    try:
+        return float(request.headers[LAST_WRITE_HEADER])
+    except (KeyError, ValueError):
+        return None
+
+# Read-your-writes bookkeeping: a primary session remembers that it wrote,
+# and once it commits the authenticated user (stored in session.info by
+# get_current_user) is pinned to the primary for a short window, in this
+# worker and, through the response header, in the others.
+@event.listens_for(SessionLocal, "after_flush")
+def _mark_flush_write(session, flush_context):
+    session.info["has_writes"] = True
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _mark_bulk_write(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        orm_execute_state.session.info["has_writes"] = True
+
+@event.listens_for(SessionLocal, "after_commit")
+def _record_commit(session):
+    if session.info.pop("has_writes", False) and session.info.get("user_id") is not None:
+        replica_router.record_write(session.info["user_id"])
+        writes = current_request_writes.get()
+        if writes is not None:
+            writes.last_write = time.time()
+
+def get_pool_stats():
+    """Current pool occupancy plus cumulative checkout statistics"""
+    pool = engine.pool
+    stats = {
+        "pool_class": type(pool).__name__,
+        "connects": pool_metrics.connects,
+        "invalidations": pool_metrics.invalidations,
+    }
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(0, pool.overflow()),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout(),
+            "waits": pool_metrics.waits,
+            "wait_time_seconds_total": pool_metrics.wait_time_total,
+            "timeouts": pool_metrics.timeouts,
+            "checkout_latency_seconds": pool_metrics.checkout_latency.snapshot(),
+        })
+    stats["replicas"] = replica_router.stats()
+    return stats
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def get_read_db(request: Request):
+    """
+    Session for read-only endpoints; routed to a replica when configured.
+
+    The requesting user (from the bearer token, if any) and the last-write
+    time the client sent back keep someone who just wrote reading from
+    the primary.
+    """
+    user_id = last_write = None
+    if replica_router.replicas:
+        from app.auth import user_id_from_request
+        user_id = user_id_from_request(request)
+        last_write = last_write_from_request(request)
+    db = replica_router.read_session(user_id, last_write)
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,124 @@
+"""
+Opt-in fast path for list endpoints.
+
+Normally a list endpoint builds a Pydantic model per row, and FastAPI then
+validates each one again against response_model and serializes it. With
+FAST_JSON_RESPONSES set, the endpoints build plain dicts straight from row
+tuples and return them as a FastJSONResponse, serialized by orjson in one
+call. FastAPI skips response_model for Response objects, so the dicts must
+already have the model's fields and types; the model still documents the
+endpoint. Bodies of RESPONSE_COMPRESS_MIN_BYTES or more are compressed
+with brotli (when installed) or gzip, whichever the client accepts.
+
+benchmarks/serialization.py compares both paths.
+"""
+import gzip
+import json
+import logging
+import os
+from datetime import date, datetime
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+logger = logging.getLogger(__name__)
+
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "0").strip().lower() in ("1", "true", "yes", "on")
+# Smallest fast-path body worth compressing (0 disables compression)
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "5"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    if FAST_JSON_RESPONSES:
+        logger.warning("orjson is not installed; fast JSON responses use the json module")
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        # Same form as Pydantic: UTC as "Z"
+        return value.isoformat().replace("+00:00", "Z")
+    if type(value).__module__ == "numpy":
+        # Scores straight from the engine (numpy scalars / arrays)
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content) -> bytes:
+    """JSON bytes for dicts / lists of JSON types, datetimes and numpy values included"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False, default=_default).encode()
+
+def row_dicts(rows):
+    """Query result rows (named tuples) as dicts keyed by column label"""
+    if not rows:
+        return []
+    keys = rows[0]._fields
+    return [dict(zip(keys, row)) for row in rows]
+
+def accepted_encoding(accept_encoding: str):
+    """"br" or "gzip" if the Accept-Encoding header allows it (brotli preferred), else None"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL)
+
+class FastJSONResponse(Response):
+    """JSON response serialized with orjson, compressed for `request` when large enough"""
+    media_type = "application/json"
+
+    def __init__(self, content, request: Request = None, status_code: int = 200, headers=None):
+        body = dumps(content)
+        headers = dict(headers or {})
+        if request is not None and RESPONSE_COMPRESS_MIN_BYTES > 0:
+            headers["vary"] = "Accept-Encoding"
+            if len(body) >= RESPONSE_COMPRESS_MIN_BYTES:
+                encoding = accepted_encoding(request.headers.get("accept-encoding", ""))
+                if encoding is not None:
+                    body = compress(body, encoding)
+                    headers["content-encoding"] = encoding
+        super().__init__(body, status_code=status_code, headers=headers)
+
+def list_response(request: Request, items):
+    """
+    Return value for a list endpoint: the dicts as a FastJSONResponse on
+    the fast path, otherwise as they are for response_model to validate.
+    """
+    if FAST_JSON_RESPONSES:
+        return FastJSONResponse(items, request)
+    return items
+
+def with_headers(result, response: Response):
+    """
+    `result` with the headers set on the injected `response`; FastAPI
+    only applies those to return values it renders, not to a Response
+    """
+    if isinstance(result, Response):
+        for name, value in response.headers.items():
+            if name not in ("content-length", "content-type"):
+                result.headers[name] = value
+    return result
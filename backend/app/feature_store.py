@@ -0,0 +1,347 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.geo import EARTH_RADIUS_KM
+from app.models import Profile, Interest, Skill, user_interests, user_skills
+
+# Arrays of FeatureColumns, in the order they are written to a snapshot
+COLUMN_NAMES = (
+    "user_ids", "ages", "city_codes", "latitudes", "longitudes",
+    "interest_indptr", "interest_indices",
+    "skill_indptr", "skill_indices",
+    "bio_rows", "bio_hashes",
+    "bio_data", "bio_indices", "bio_indptr",
+)
+
+def bio_hash(bio):
+    """Stable (cross-process) fingerprint of a bio, 0 for none"""
+    return zlib.crc32(bio.encode("utf-8")) if bio else 0
+
+def distances_km(latitude, longitude, latitudes, longitudes):
+    """Great-circle distances from one point to arrays of points (NaN stays NaN)"""
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+class Vocabulary:
+    """Append-only name <-> code map; codes index the CSR columns (names are lower-cased)"""
+
+    def __init__(self, names=()):
+        self.names = list(names)
+        self.codes = {name: code for code, name in enumerate(self.names)}
+
+    def code(self, name, add=False):
+        code = self.codes.get(name)
+        if code is None and add:
+            code = len(self.names)
+            self.names.append(name)
+            self.codes[name] = code
+        return code
+
+    def __len__(self):
+        return len(self.names)
+
+class FeatureColumns:
+    """
+    One immutable block of profiles in columnar form, sorted by user id.
+    Row i describes user_ids[i]; 0 / -1 / NaN mark a missing age / city or
+    bio / coordinates. Interests and
+    skills are CSR (indptr, indices) over vocabulary codes, and bio_rows
+    points into the L2-normalized TF-IDF matrix stored as bio_data /
+    bio_indices / bio_indptr.
+    """
+
+    def __init__(self, arrays, vocabulary_size=1000):
+        for name in COLUMN_NAMES:
+            setattr(self, name, arrays[name])
+        self.vocabulary_size = vocabulary_size
+        self._bio_matrix = None
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def find(self, user_id):
+        """Row of user_id or None (binary search, no per-worker index)"""
+        row = int(np.searchsorted(self.user_ids, user_id))
+        if row < len(self.user_ids) and self.user_ids[row] == user_id:
+            return row
+        return None
+
+    def find_many(self, user_ids):
+        """Rows of those of `user_ids` (a sorted, unique array) that are present"""
+        rows = np.searchsorted(self.user_ids, user_ids)
+        rows = rows[rows < len(self.user_ids)]  # ids past the end can only be a suffix
+        return rows[self.user_ids[rows] == user_ids[:len(rows)]]
+
+    def take(self, rows):
+        """A new block holding only `rows`; the bio matrix is shared, not copied"""
+        arrays = {name: getattr(self, name) for name in COLUMN_NAMES}
+        for name in ("user_ids", "ages", "city_codes", "latitudes", "longitudes", "bio_rows", "bio_hashes"):
+            arrays[name] = arrays[name][rows]
+        for prefix in ("interest", "skill"):
+            indptr, indices = arrays[f"{prefix}_indptr"], arrays[f"{prefix}_indices"]
+            starts = indptr[rows]
+            lengths = indptr[rows + 1] - starts
+            new_indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+            positions = np.repeat(starts - new_indptr[:-1], lengths) + np.arange(new_indptr[-1])
+            arrays[f"{prefix}_indptr"] = new_indptr
+            arrays[f"{prefix}_indices"] = indices[positions]
+        taken = FeatureColumns(arrays, self.vocabulary_size)
+        taken._bio_matrix = self.bio_matrix()
+        return taken
+
+    def interest_codes(self, row):
+        return self.interest_indices[self.interest_indptr[row]:self.interest_indptr[row + 1]]
+
+    def skill_codes(self, row):
+        return self.skill_indices[self.skill_indptr[row]:self.skill_indptr[row + 1]]
+
+    def bio_matrix(self):
+        """The bio vectors as a CSR matrix (a view: memory-mapped arrays are not copied)"""
+        if self._bio_matrix is None:
+            from scipy.sparse import csr_matrix
+            self._bio_matrix = csr_matrix(
+                (self.bio_data, self.bio_indices, self.bio_indptr),
+                shape=(len(self.bio_indptr) - 1, self.vocabulary_size),
+            )
+        return self._bio_matrix
+
+    def memory_bytes(self):
+        return sum(getattr(self, name).nbytes for name in COLUMN_NAMES)
+
+    @classmethod
+    def from_rows(cls, rows, vocabulary_size=1000):
+        """
+        Build columns from (user_id, age, city_code, interest_codes,
+        skill_codes, bio_vector, bio_hash, latitude, longitude) tuples
+        sorted by user_id; bio_vector is a 1 x V sparse row or None.
+        """
+        interest_indptr, skill_indptr, bio_indptr = [0], [0], [0]
+        interest_indices, skill_indices = [], []
+        bio_rows, bio_data, bio_indices = [], [], []
+        for _, _, _, interests, skills, vector, _, _, _ in rows:
+            interest_indices.extend(sorted(interests))
+            interest_indptr.append(len(interest_indices))
+            skill_indices.extend(sorted(skills))
+            skill_indptr.append(len(skill_indices))
+            if vector is None:
+                bio_rows.append(-1)
+            else:
+                bio_rows.append(len(bio_indptr) - 1)
+                bio_data.extend(vector.data)
+                bio_indices.extend(vector.indices)
+                bio_indptr.append(len(bio_data))
+        return cls({
+            "user_ids": np.array([r[0] for r in rows], dtype=np.int64),
+            "ages": np.array([r[1] or 0 for r in rows], dtype=np.int16),
+            "city_codes": np.array([r[2] for r in rows], dtype=np.int32),
+            "latitudes": np.array([np.nan if r[7] is None else r[7] for r in rows], dtype=np.float64),
+            "longitudes": np.array([np.nan if r[8] is None else r[8] for r in rows], dtype=np.float64),
+            "interest_indptr": np.array(interest_indptr, dtype=np.int64),
+            "interest_indices": np.array(interest_indices, dtype=np.int32),
+            "skill_indptr": np.array(skill_indptr, dtype=np.int64),
+            "skill_indices": np.array(skill_indices, dtype=np.int32),
+            "bio_rows": np.array(bio_rows, dtype=np.int32),
+            "bio_hashes": np.array([r[6] for r in rows], dtype=np.uint32),
+            "bio_data": np.array(bio_data, dtype=np.float32),
+            "bio_indices": np.array(bio_indices, dtype=np.int32),
+            # int32 like bio_indices, so scipy does not upcast (copy) either
+            "bio_indptr": np.array(bio_indptr, dtype=np.int32),
+        }, vocabulary_size)
+
+class ProfileFeatureStore:
+    """
+    Scoring features of every complete profile as NumPy arrays.
+
+    The bulk-loaded base block is never modified (so it can be a read-only
+    memory map of a snapshot shared by all workers). Profiles written since
+    then live in a delta that shadows their base rows; the next full
+    rebuild folds the delta back into the base.
+
+    The delta is a list of immutable runs, each with a mask of its live
+    rows like the base: a write appends a one-row run and masks out the
+    profile's older row (copying only that mask), and the last two runs
+    are merged while the last is as large as the one before it, so a write
+    costs O(log delta) amortized and readers keep the segments they took.
+    """
+
+    def __init__(self, base, cities, interests, skills):
+        self.base = base
+        self.cities = cities
+        self.interests = interests
+        self.skills = skills
+        self._lock = threading.Lock()
+        self._delta_rows = {}  # user_id -> row tuple, None when removed
+        self._delta_written = {}  # user_id -> time.time() of the last write
+        self._base_mask = np.ones(len(base), dtype=bool)
+        self._runs = []  # [(columns, active_mask)], largest first
+        self._segments = [(base, self._base_mask)]
+
+    @classmethod
+    def load_from_db(cls, db: Session, vectorizer=None):
+        """
+        Bulk load with five queries. If a vectorizer is given it is fitted
+        on all bios and the bio vectors are stored; returns (store, vectorizer)
+        with vectorizer None when there is no indexable text.
+        """
+        profiles = db.query(Profile.user_id, Profile.age, Profile.city, Profile.bio,
+                            Profile.latitude, Profile.longitude).filter(
+            Profile.is_profile_complete == True
+        ).order_by(Profile.user_id).all()
+        complete = {p.user_id for p in profiles}
+
+        interests, skills = Vocabulary(), Vocabulary()
+        interest_codes = cls._load_codes(db, Interest, user_interests.c.user_id,
+                                         user_interests.c.interest_id, interests, complete)
+        skill_codes = cls._load_codes(db, Skill, user_skills.c.user_id,
+                                      user_skills.c.skill_id, skills, complete)
+
+        cities = Vocabulary()
+        bios = [p.bio for p in profiles if p.bio]
+        bio_matrix = None
+        if vectorizer is not None and bios:
+            try:
+                bio_matrix = vectorizer.fit_transform(bios).tocsr()
+            except ValueError:
+                pass  # only stop words: nothing to index
+        if bio_matrix is None:
+            vectorizer = None
+
+        rows = [
+            (p.user_id, p.age,
+             cities.code(p.city.lower(), add=True) if p.city else -1,
+             interest_codes.get(p.user_id, ()), skill_codes.get(p.user_id, ()),
+             None, bio_hash(p.bio), p.latitude, p.longitude)
+            for p in profiles
+        ]
+        vocabulary_size = len(vectorizer.vocabulary_) if vectorizer is not None else 0
+        base = FeatureColumns.from_rows(rows, vocabulary_size)
+        if bio_matrix is not None:
+            # Bio vectors are the fitted matrix as is, rows in profile order
+            has_bio = np.array([bool(p.bio) for p in profiles], dtype=bool)
+            base.bio_rows = np.where(has_bio, np.cumsum(has_bio) - 1, -1).astype(np.int32)
+            base.bio_data = bio_matrix.data.astype(np.float32)
+            base.bio_indices = bio_matrix.indices.astype(np.int32)
+            base.bio_indptr = bio_matrix.indptr.astype(np.int32)
+        return cls(base, cities, interests, skills), vectorizer
+
+    @staticmethod
+    def _load_codes(db, model, user_column, item_column, vocabulary, complete):
+        names = {}
+        for item_id, name in db.query(model.id, model.name).order_by(model.id):
+            names[item_id] = vocabulary.code(name.lower(), add=True)
+        codes = {}
+        for user_id, item_id in db.query(user_column, item_column):
+            if user_id in complete:
+                codes.setdefault(user_id, set()).add(names[item_id])
+        return codes
+
+    def upsert(self, user_id, age, city, interest_names, skill_names, bio_vector, bio,
+               latitude=None, longitude=None):
+        """Replace the features of one profile (takes effect for new readers)"""
+        with self._lock:
+            self._write(user_id, (
+                user_id, age,
+                self.cities.code(city.lower(), add=True) if city else -1,
+                {self.interests.code(n.lower(), add=True) for n in interest_names},
+                {self.skills.code(n.lower(), add=True) for n in skill_names},
+                bio_vector, bio_hash(bio), latitude, longitude,
+            ))
+
+    def remove(self, user_id):
+        with self._lock:
+            self._write(user_id, None)
+
+    def _write(self, user_id, row):
+        """Mask out the user's current row and append `row` (None when removed); lock held"""
+        base_row = self.base.find(user_id)
+        if base_row is not None and self._base_mask[base_row]:
+            self._base_mask = self._base_mask.copy()  # readers may hold the old one
+            self._base_mask[base_row] = False
+        if self._delta_rows.get(user_id) is not None:
+            for i, (columns, mask) in enumerate(self._runs):
+                run_row = columns.find(user_id)
+                if run_row is not None and mask[run_row]:
+                    mask = mask.copy()
+                    mask[run_row] = False
+                    self._runs[i] = (columns, mask)
+                    break
+        self._delta_rows[user_id] = row
+        self._delta_written[user_id] = time.time()
+        if row is not None:
+            self._runs.append((FeatureColumns.from_rows([row], self.base.vocabulary_size), np.ones(1, dtype=bool)))
+            while len(self._runs) > 1 and len(self._runs[-2][0]) <= len(self._runs[-1][0]):
+                last, previous = self._runs.pop(), self._runs.pop()
+                self._runs.append(self._merge(previous, last))
+        self._segments = [(self.base, self._base_mask), *self._runs]
+
+    def _merge(self, *runs):
+        """One run holding the live rows of `runs`"""
+        user_ids = np.sort(np.concatenate([columns.user_ids[mask] for columns, mask in runs]))
+        rows = [self._delta_rows[user_id] for user_id in user_ids.tolist()]
+        return FeatureColumns.from_rows(rows, self.base.vocabulary_size), np.ones(len(rows), dtype=bool)
+
+    def changed_since(self, timestamp):
+        """User ids written to the delta after `timestamp`"""
+        with self._lock:
+            return [user_id for user_id, written in self._delta_written.items() if written > timestamp]
+
+    def segments(self):
+        """
+        [(columns, active_mask)] covering every current profile exactly
+        once: the base block with shadowed rows masked out, then the delta runs.
+        """
+        return self._segments
+
+    def lookup(self, user_id):
+        """(columns, row) holding the user's current features, or None"""
+        for columns, mask in self.segments():
+            row = columns.find(user_id)
+            if row is not None and mask[row]:
+                return columns, row
+        return None
+
+    def __len__(self):
+        return sum(int(mask.sum()) for _, mask in self.segments())
+
+    def memory_bytes(self):
+        return sum(columns.memory_bytes() for columns, _ in self.segments())
+
+    def save(self, directory):
+        """
+        Write the base block as one .npy file per column plus the
+        vocabularies, so load(mmap=True) can map it without copying.
+        The delta is not saved.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in COLUMN_NAMES:
+            np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(getattr(self.base, name)))
+        with open(os.path.join(directory, "vocabularies.json"), "w", encoding="utf-8") as fh:
+            json.dump({
+                "vocabulary_size": self.base.vocabulary_size,
+                "cities": self.cities.names,
+                "interests": self.interests.names,
+                "skills": self.skills.names,
+            }, fh)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        arrays = {}
+        for name in COLUMN_NAMES:
+            path = os.path.join(directory, f"{name}.npy")
+            try:
+                arrays[name] = np.load(path, mmap_mode="r" if mmap else None)
+            except ValueError:
+                arrays[name] = np.load(path)  # empty arrays cannot be mapped
+        with open(os.path.join(directory, "vocabularies.json"), encoding="utf-8") as fh:
+            vocabularies = json.load(fh)
+        base = FeatureColumns(arrays, vocabularies["vocabulary_size"])
+        return cls(base, Vocabulary(vocabularies["cities"]),
+                   Vocabulary(vocabularies["interests"]), Vocabulary(vocabularies["skills"]))
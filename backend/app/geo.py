@@ -0,0 +1,119 @@
+"""
+Offline geocoding and distance helpers.
+
+Profiles store a free-text city; the bundled gazetteer (app/data/gazetteer.csv:
+id, name, country, latitude, longitude, "|"-separated aliases) maps it to a
+normalized city id and coordinates without any network lookup.
+"""
+import csv
+import math
+import os
+import re
+import unicodedata
+from typing import NamedTuple, Optional
+
+GAZETTEER_PATH = os.getenv(
+    "GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.csv")
+)
+# Distance (km) over which the location score decays from 1.0 towards 0.5
+GEO_DECAY_KM = float(os.getenv("GEO_DECAY_KM", "100"))
+EARTH_RADIUS_KM = 6371.0088
+
+class City(NamedTuple):
+    id: int
+    name: str
+    country: str
+    latitude: float
+    longitude: float
+
+def normalize_place(name: str) -> str:
+    """Lower-case, strip accents and punctuation, collapse spaces"""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^\w\s]", " ", name.lower()).split())
+
+class Gazetteer:
+    def __init__(self, cities):
+        self.by_id = {}
+        self.by_name = {}
+        self.names = []  # [(name or alias as written, city)]
+        for city, aliases in cities:
+            self.by_id[city.id] = city
+            for name in (city.name, *aliases):
+                self.by_name.setdefault(normalize_place(name), city)
+                self.names.append((name, city))
+
+    @classmethod
+    def load(cls, path=GAZETTEER_PATH):
+        with open(path, newline="", encoding="utf-8") as fh:
+            return cls([
+                (City(int(row["id"]), row["name"], row["country"],
+                      float(row["latitude"]), float(row["longitude"])),
+                 [alias for alias in (row.get("aliases") or "").split("|") if alias])
+                for row in csv.DictReader(fh)
+            ])
+
+    def get(self, city_id) -> Optional[City]:
+        return self.by_id.get(city_id)
+
+    def resolve(self, name) -> Optional[City]:
+        """City for a free-text name ("Portland", "Portland, OR"), or None"""
+        if not name:
+            return None
+        city = self.by_name.get(normalize_place(name))
+        if city is None and "," in name:
+            city = self.by_name.get(normalize_place(name.split(",", 1)[0]))
+        return city
+
+_gazetteer = None
+
+def get_gazetteer() -> Gazetteer:
+    global _gazetteer
+    if _gazetteer is None:
+        _gazetteer = Gazetteer.load()
+    return _gazetteer
+
+def geocode_profile(profile):
+    """Set city_id / latitude / longitude of a Profile from its city"""
+    city = get_gazetteer().resolve(profile.city)
+    profile.city_id = city.id if city else None
+    profile.latitude = city.latitude if city else None
+    profile.longitude = city.longitude if city else None
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def location_score(distance_km):
+    """1.0 in the same place, decaying to the old different-city score of 0.5 (works on arrays)"""
+    if hasattr(distance_km, "shape"):
+        import numpy as np
+        return 0.5 + 0.5 * np.exp(-distance_km / GEO_DECAY_KM)
+    return 0.5 + 0.5 * math.exp(-distance_km / GEO_DECAY_KM)
+
+def within_radius(latitude_column, longitude_column, latitude, longitude, radius_km):
+    """
+    SQL conditions on the coordinate columns for the bounding box of a
+    radius, answered by the (latitude, longitude) index; rows in its
+    corners are left for is_within to trim
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+    return [latitude_column.between(min_lat, max_lat), longitude_column.between(min_lon, max_lon)]
+
+def is_within(latitude, longitude, radius_km, other_latitude, other_longitude):
+    """True if the other point is known and within radius_km"""
+    if other_latitude is None or other_longitude is None:
+        return False
+    return haversine_km(latitude, longitude, other_latitude, other_longitude) <= radius_km
+
+def bounding_box(latitude, longitude, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) enclosing the radius (whole longitude range near poles / the antimeridian)"""
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = max(-90.0, latitude - delta_lat), min(90.0, latitude + delta_lat)
+    if min_lat <= -90 or max_lat >= 90:
+        return min_lat, max_lat, -180.0, 180.0
+    delta_lon = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(latitude))))
+    if longitude - delta_lon < -180 or longitude + delta_lon > 180:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, longitude - delta_lon, longitude + delta_lon
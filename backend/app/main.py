@@ -1,24 +1,33 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+import logging
 import os
 from dotenv import load_dotenv
 
-from app.database import get_db, engine, Base
+from app.admission import admission_stats
+from app.change_feed import ChangeFeedFollower
+from app.database import (
+    LAST_WRITE_HEADER, ReadYourWritesMiddleware, SessionLocal, get_pool_stats, pool_metrics, replica_router,
+)
+from app.metrics import RequestMetricsMiddleware, request_metrics
+from app.ml_engine import engine_registry
+from app.pagination import PAGINATION_HEADERS
+from app.profiling import PROFILING_ENABLED
 from app.routers import auth, users, recommendations, analytics, matches, chat, ai_search
-from app.models import User, Profile, Interest, Skill, Match, Message
+from app.storage import CachedStaticFiles
 
 load_dotenv()
 
-# Create database tables
-try:
-    Base.metadata.create_all(bind=engine)
-    print("✅ Database tables created successfully")
-except Exception as e:
-    print(f"⚠️ Warning: Could not create database tables: {e}")
-    print("Tables will be created when database is available")
+logger = logging.getLogger(__name__)
+
+# Build ML engine state before serving. With 0, scoring falls back to
+# per-pair TF-IDF until the first background rebuild.
+ENGINE_WARMUP = os.getenv("ENGINE_WARMUP", "1").strip().lower() in ("1", "true", "yes", "on")
+
+# Tables are created by `python init_db.py` (see docker-entrypoint.sh), not on
+# import: every worker would otherwise hit the database before serving.
 
 app = FastAPI(
     title="LegitSearch Platform",
@@ -26,6 +35,24 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# One set of ML engines per worker, shared by all routers
+app.state.engines = engine_registry
+# Applies profile changes made through any worker to this worker's engine state and caches
+change_follower = ChangeFeedFollower(engine_registry.compatibility)
+
+@app.on_event("startup")
+async def warm_up_engines():
+    # Before warm-up, so the state built next includes every change up to here
+    await run_in_threadpool(change_follower.mark_start, replica_router.read_session)
+    if ENGINE_WARMUP:
+        try:
+            await run_in_threadpool(engine_registry.warm_up, replica_router.read_session)
+        except Exception as e:
+            # Requests still work without prebuilt state, just slower
+            logger.warning("Engine warm-up failed: %s", e)
+    engine_registry.start_refresh(replica_router.read_session)
+    change_follower.start(SessionLocal)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -33,8 +60,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[*PAGINATION_HEADERS, LAST_WRITE_HEADER],
 )
 
+app.add_middleware(ReadYourWritesMiddleware)
+
+# Admin profiling is only installed when enabled (no cost otherwise)
+if PROFILING_ENABLED:
+    from app.profiling import ProfilingMiddleware
+    from app.routers import admin
+    app.add_middleware(ProfilingMiddleware)
+    app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
+
+# Outermost, so the timings include the other middleware
+app.add_middleware(RequestMetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
 app.include_router(users.router, prefix="/api/users", tags=["users"])
@@ -44,8 +84,8 @@ app.include_router(matches.router, prefix="/api/matches", tags=["matches"])
 app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
 app.include_router(ai_search.router, prefix="/api/ai", tags=["ai-search"])
 
-# Mount static files for avatar uploads
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Mount static files for avatar uploads (content-addressed files are immutable)
+app.mount("/uploads", CachedStaticFiles(directory="uploads"), name="uploads")
 
 @app.get("/")
 async def root():
@@ -55,6 +95,30 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/db")
+async def database_pool_stats():
+    """Connection pool occupancy and checkout latency for pool sizing"""
+    return get_pool_stats()
+
+@app.get("/health/engine")
+async def engine_stats():
+    """ML engine state version, build time, memory use and change feed position"""
+    return {**engine_registry.stats(), "change_feed": change_follower.stats()}
+
+@app.get("/health/admission")
+async def admission_control_stats():
+    """Per-endpoint running / waiting calls and shed, rate-limited and degraded counts"""
+    return admission_stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Request and connection pool metrics of this worker in Prometheus text format"""
+    lines = request_metrics.prometheus_lines()
+    lines.append("# HELP db_pool_checkout_seconds Time to check a connection out of the pool")
+    lines.append("# TYPE db_pool_checkout_seconds histogram")
+    lines.extend(pool_metrics.checkout_latency.prometheus_lines("db_pool_checkout_seconds"))
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,247 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, shared by all timing histograms
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """
+    Thread-safe cumulative histogram with fixed bucket bounds
+    (same semantics as a Prometheus histogram).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        """Return {"buckets": {le: cumulative_count}, "sum": float, "count": int}"""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = {}
+        running = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            running += n
+            cumulative["+Inf" if bound == float("inf") else repr(bound)] = running
+        return {"buckets": cumulative, "sum": total, "count": count}
+
+    def prometheus_lines(self, name, labels=""):
+        """Render as Prometheus text exposition lines (without HELP/TYPE)"""
+        snap = self.snapshot()
+        sep = "," if labels else ""
+        lines = [
+            f'{name}_bucket{{{labels}{sep}le="{le}"}} {count}'
+            for le, count in snap["buckets"].items()
+        ]
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {snap['sum']}")
+        lines.append(f"{name}_count{suffix} {snap['count']}")
+        return lines
+
+# Response body sizes in bytes and SQL statements per request
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+# Requests slower than this are logged with their SQL breakdown
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+# Statements listed in a slow-request log line
+SLOW_REQUEST_TOP_STATEMENTS = 5
+
+class RequestSQL:
+    """SQL issued while serving one request, collected by the engine event hooks"""
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.by_statement = {}  # statement text -> [count, seconds]
+
+    def record(self, statement, elapsed):
+        self.statements += 1
+        self.seconds += elapsed
+        entry = self.by_statement.get(statement)
+        if entry is None:
+            if len(self.by_statement) >= 100:
+                return
+            entry = self.by_statement[statement] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += elapsed
+
+    def top(self, n):
+        ranked = sorted(self.by_statement.items(), key=lambda item: item[1][1], reverse=True)
+        return [(" ".join(statement.split())[:160], count, seconds) for statement, (count, seconds) in ranked[:n]]
+
+# Set by RequestMetricsMiddleware for the duration of a request. Handlers
+# run in the threadpool get a copy of the context, so the same RequestSQL
+# object is shared with them.
+current_request_sql = ContextVar("current_request_sql", default=None)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    if current_request_sql.get() is not None:
+        conn.info.setdefault("request_query_started", []).append((context, time.perf_counter()))
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+    _record_statement(conn, statement, context)
+
+@event.listens_for(Engine, "handle_error")
+def _fail_statement(exception_context):
+    # after_cursor_execute does not fire for a statement that raised
+    if exception_context.connection is not None:
+        _record_statement(exception_context.connection, exception_context.statement,
+                          exception_context.execution_context)
+
+def _record_statement(conn, statement, context):
+    """Time the statement `context` started, if it is the one on top of the connection's stack"""
+    started = conn.info.get("request_query_started")
+    if not started or started[-1][0] is not context:
+        return
+    _, started_at = started.pop()
+    sql = current_request_sql.get()
+    if sql is not None:
+        sql.record(statement, time.perf_counter() - started_at)
+
+class RouteMetrics:
+    def __init__(self):
+        self.duration = Histogram()
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.sql_statements = Histogram(STATEMENT_BUCKETS)
+        self.sql_duration = Histogram()
+        self.responses = {}  # status code -> count
+
+class RequestMetrics:
+    """Per-route request metrics of this worker, rendered for Prometheus by /metrics"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self._routes = {}  # (method, route template) -> RouteMetrics
+        self._lock = threading.Lock()
+
+    def route(self, method, path):
+        key = (method, path)
+        metrics = self._routes.get(key)
+        if metrics is None:
+            with self._lock:
+                metrics = self._routes.setdefault(key, RouteMetrics())
+        return metrics
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, method, path, status, elapsed, body_bytes, sql):
+        with self._lock:
+            self.in_flight -= 1
+        metrics = self.route(method, path)
+        metrics.duration.observe(elapsed)
+        metrics.response_size.observe(body_bytes)
+        metrics.sql_statements.observe(sql.statements)
+        metrics.sql_duration.observe(sql.seconds)
+        with self._lock:
+            metrics.responses[status] = metrics.responses.get(status, 0) + 1
+
+    def prometheus_lines(self):
+        with self._lock:
+            routes = sorted(self._routes.items())
+            in_flight = self.in_flight
+        lines = [
+            "# HELP http_requests_in_flight Requests being served by this worker",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {in_flight}",
+            "# HELP http_requests_total Requests served, by route and status",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, path), metrics in routes:
+            for status, count in sorted(metrics.responses.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{path}",status="{status}"}} {count}')
+        for name, attribute, kind, help_text in (
+            ("http_request_duration_seconds", "duration", "histogram", "Request latency"),
+            ("http_response_size_bytes", "response_size", "histogram", "Response body size"),
+            ("http_request_sql_statements", "sql_statements", "histogram", "SQL statements per request"),
+            ("http_request_sql_seconds", "sql_duration", "histogram", "Time in SQL per request"),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (method, path), metrics in routes:
+                lines.extend(getattr(metrics, attribute).prometheus_lines(
+                    name, f'method="{method}",route="{path}"'
+                ))
+        return lines
+
+request_metrics = RequestMetrics()
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request. Requests are labelled with
+    the route template (e.g. /api/users/{user_id}) so label values stay
+    bounded: mounted apps as "<mount>/{path}", unmatched paths as "other".
+    """
+
+    def __init__(self, app, metrics=request_metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method, path, root_path = scope["method"], scope["path"], scope.get("root_path", "")
+        sql = RequestSQL()
+        token = current_request_sql.set(sql)
+        status = 500
+        body_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal status, body_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                body_bytes += len(message.get("body", b""))
+            await send(message)
+
+        self.metrics.started()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request_sql.reset(token)
+            # Routing fills in the (shared) scope: the matched route, or a
+            # longer root_path when a mount took the request
+            route = getattr(scope.get("route"), "path", None)
+            if route is None and scope.get("root_path", "") != root_path:
+                route = scope["root_path"] + "/{path}"
+            self.metrics.finished(method, route or "other", status, elapsed, body_bytes, sql)
+            if elapsed * 1000 >= SLOW_REQUEST_MS:
+                log_slow_request(method, path, status, elapsed, sql)
+
+def log_slow_request(method, path, status, elapsed, sql):
+    breakdown = "; ".join(
+        f"{count}x {seconds * 1000:.1f}ms {statement}"
+        for statement, count, seconds in sql.top(SLOW_REQUEST_TOP_STATEMENTS)
+    )
+    logger.warning(
+        "Slow request %s %s -> %s in %.0fms (%d SQL statements, %.0fms in SQL) %s",
+        method, path, status, elapsed * 1000,
+        sql.statements, sql.seconds * 1000, breakdown,
+    )
@@ -1,16 +1,276 @@
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sqlalchemy.orm import Session
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from fastapi import Request
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Tuple
-from app.models import User, Profile, Interest, Skill, Match
-from app.schemas import Recommendation
+from app.models import User, Profile, Interest, Skill, Match, user_interests, user_skills
+from app.projection import RECOMMENDATION_FIELDS, profile_value, user_load_options
+from app.geo import haversine_km, location_score
+from app.pair_scores import dirty_user_ids, stored_score, top_partners
+
+logger = logging.getLogger(__name__)
+
+# Seconds between background rebuilds of the engine state (0 disables)
+ENGINE_REBUILD_INTERVAL = float(os.getenv("ENGINE_REBUILD_INTERVAL", "600"))
+# Directory of snapshots written by build_snapshot.py. When set, workers
+# map the published snapshot instead of building state from the database,
+# and poll every ENGINE_SNAPSHOT_POLL seconds for a new version.
+ENGINE_SNAPSHOT_DIR = os.getenv("ENGINE_SNAPSHOT_DIR", "")
+ENGINE_SNAPSHOT_POLL = float(os.getenv("ENGINE_SNAPSHOT_POLL", "10"))
+
+class EngineState:
+    """
+    Immutable model state built from the whole profile table: a TF-IDF
+    vectorizer fitted on every bio and the ProfileFeatureStore holding each
+    complete profile's features (including its bio vector). Engines swap a
+    new instance in after a rebuild; requests keep whichever instance they
+    started with. Only the store's small delta changes in place.
+    """
+
+    def __init__(self, vectorizer, features, version, build_seconds, source="database", built_at=None):
+        self.vectorizer = vectorizer
+        self.features = features
+        self.version = version
+        self.build_seconds = build_seconds
+        self.source = source
+        self.built_at = built_at or time.time()
+
+    @classmethod
+    def build(cls, db: Session, version: int) -> "EngineState":
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from app.feature_store import ProfileFeatureStore
+
+        started = time.perf_counter()
+        features, vectorizer = ProfileFeatureStore.load_from_db(
+            db, TfidfVectorizer(max_features=1000, stop_words='english')
+        )
+        return cls(vectorizer, features, version, time.perf_counter() - started)
+
+    @classmethod
+    def from_snapshot(cls, root, version=None) -> "EngineState":
+        from app.snapshot import load_snapshot
+
+        started = time.perf_counter()
+        manifest, vectorizer, features = load_snapshot(root, version)
+        return cls(vectorizer, features, manifest["version"], time.perf_counter() - started,
+                   source="snapshot", built_at=manifest["created_at"])
+
+    def transform_bio(self, bio):
+        if not bio or self.vectorizer is None:
+            return None
+        return self.vectorizer.transform([bio]).tocsr()
+
+    def bio_vector(self, user_id, bio):
+        """Stored vector for the user if their bio is unchanged, else a fresh transform"""
+        from app.feature_store import bio_hash
+        found = self.features.lookup(user_id)
+        if found is not None:
+            columns, row = found
+            bio_row = columns.bio_rows[row]
+            if bio_row >= 0 and columns.bio_hashes[row] == bio_hash(bio):
+                return columns.bio_matrix()[bio_row]
+        return self.transform_bio(bio)
+
+    def memory_bytes(self):
+        """Approximate memory held by this state"""
+        total = self.features.memory_bytes()
+        if self.vectorizer is not None:
+            vocabulary = self.vectorizer.vocabulary_
+            total += sys.getsizeof(vocabulary) + sum(sys.getsizeof(term) for term in vocabulary)
+            total += self.vectorizer.idf_.nbytes
+        return total
 
 class CompatibilityEngine:
     def __init__(self):
-        self.vectorizer = TfidfVectorizer(max_features=1000, stop_words='english')
+        # scikit-learn (and numpy/scipy with it) takes most of a second to
+        # import, so it is loaded on first use instead of at worker boot
+        self._vectorizer = None
+        # Replaced wholesale by rebuild(); None until the first build
+        self.state = None
+        self._rebuild_lock = threading.Lock()
+        self._version = 0
+        # Profiles written while a rebuild was reading the database
+        self._refresh_after_rebuild = set()
+
+    @property
+    def vectorizer(self):
+        if self._vectorizer is None:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            self._vectorizer = TfidfVectorizer(max_features=1000, stop_words='english')
+        return self._vectorizer
+
+    def rebuild(self, session_factory) -> bool:
+        """
+        Build new model state from the database and swap it in. Requests
+        are served from the old state meanwhile. Returns False if another
+        rebuild is already running.
+        """
+        if not self._rebuild_lock.acquire(blocking=False):
+            return False
+        try:
+            db = session_factory()
+            try:
+                state = EngineState.build(db, self._version + 1)
+            finally:
+                db.close()
+            self._version = state.version
+            self.state = state  # single reference assignment: atomic swap
+            pending, self._refresh_after_rebuild = self._refresh_after_rebuild, set()
+            if pending:
+                db = session_factory()
+                try:
+                    for user_id in pending:
+                        self.refresh_profile(db, user_id)
+                finally:
+                    db.close()
+            logger.info("Compatibility engine state v%d built in %.2fs (%d profiles, %.1f MB)",
+                        state.version, state.build_seconds, len(state.features),
+                        state.memory_bytes() / 1e6)
+            return True
+        finally:
+            self._rebuild_lock.release()
+
+    def load_snapshot(self, root, session_factory) -> bool:
+        """
+        Swap in the published snapshot if it differs from the current state.
+        Profiles this worker wrote after the snapshot was taken are
+        re-read so their updates are not lost. Returns True on a swap.
+        """
+        from app.snapshot import current_version
+
+        version = current_version(root)
+        state = self.state
+        if version is None or (state is not None and state.source == "snapshot"
+                               and state.version == version):
+            return False
+        if not self._rebuild_lock.acquire(blocking=False):
+            return False
+        try:
+            new_state = EngineState.from_snapshot(root, version)
+            self.state = new_state
+            changed = set(state.features.changed_since(new_state.built_at)) if state is not None else set()
+            changed |= self._refresh_after_rebuild
+            self._refresh_after_rebuild = set()
+            if changed:
+                db = session_factory()
+                try:
+                    for user_id in changed:
+                        self.refresh_profile(db, user_id)
+                finally:
+                    db.close()
+            logger.info("Compatibility engine snapshot v%d loaded in %.3fs (%d profiles)",
+                        new_state.version, new_state.build_seconds, len(new_state.features))
+            return True
+        finally:
+            self._rebuild_lock.release()
+
+    def refresh_profile(self, db: Session, user_id: int):
+        """Update the feature store after a write to the user's profile, interests or skills"""
+        state = self.state
+        if state is None:
+            return
+        if self._rebuild_lock.locked():
+            self._refresh_after_rebuild.add(user_id)
+        profile = db.query(Profile).filter(Profile.user_id == user_id).first()
+        if not profile or not profile.is_profile_complete:
+            state.features.remove(user_id)
+            return
+        interests = [name for (name,) in db.query(Interest.name).join(
+            user_interests, user_interests.c.interest_id == Interest.id
+        ).filter(user_interests.c.user_id == user_id)]
+        skills = [name for (name,) in db.query(Skill.name).join(
+            user_skills, user_skills.c.skill_id == Skill.id
+        ).filter(user_skills.c.user_id == user_id)]
+        state.features.upsert(user_id, profile.age, profile.city, interests, skills,
+                              state.transform_bio(profile.bio), profile.bio,
+                              profile.latitude, profile.longitude)
+
+    def score_all(self, state: EngineState, profile: Profile, user_ids=None):
+        """
+        calculate_compatibility of `profile` against every profile in the
+        feature store at once, or only against `user_ids` when given (ids
+        without stored features are left out). Returns (user_ids, scores)
+        arrays; the profile's own user is excluded.
+        """
+        import numpy as np
+        from app.feature_store import distances_km
+
+        features = state.features
+        query_interests = {i.name.lower() for i in profile.interests}
+        query_skills = {s.name.lower() for s in profile.skills}
+        interest_codes = [c for c in map(features.interests.code, query_interests) if c is not None]
+        skill_codes = [c for c in map(features.skills.code, query_skills) if c is not None]
+        city_code = features.cities.code(profile.city.lower()) if profile.city else None
+        query_bio = state.bio_vector(profile.user_id, profile.bio) if profile.bio else None
+
+        wanted = None if user_ids is None else np.unique(np.asarray(user_ids, dtype=np.int64))
+        all_ids, all_scores = [], []
+        for columns, active in features.segments():
+            if wanted is not None:
+                rows = columns.find_many(wanted)
+                rows = rows[active[rows]]
+                columns, active = columns.take(rows), np.ones(len(rows), dtype=bool)
+            scores = np.zeros(len(columns))
+            scores += 0.4 * _jaccard(columns.interest_indptr, columns.interest_indices,
+                                     interest_codes, len(query_interests))
+            scores += 0.3 * _jaccard(columns.skill_indptr, columns.skill_indices,
+                                     skill_codes, len(query_skills))
+            if profile.age:
+                has_age = columns.ages > 0
+                age_score = np.clip(1 - np.abs(columns.ages.astype(np.float64) - profile.age) / 20, 0, None)
+                scores += 0.1 * np.where(has_age, age_score, 0)
+            if profile.city:
+                city_score = np.where(columns.city_codes == (-2 if city_code is None else city_code), 1.0, 0.5)
+                if profile.latitude is not None and profile.longitude is not None:
+                    # Distance decay where both places are geocoded, city match otherwise
+                    distance = distances_km(profile.latitude, profile.longitude,
+                                            columns.latitudes, columns.longitudes)
+                    city_score = np.where(np.isnan(distance), city_score, location_score(distance))
+                scores += 0.1 * np.where(columns.city_codes >= 0, city_score, 0)
+            if query_bio is not None:
+                has_bio = columns.bio_rows >= 0
+                if has_bio.any():
+                    # Rows are L2-normalized, so the dot product is the cosine
+                    similarity = np.asarray(columns.bio_matrix() @ query_bio.T.toarray()).ravel()
+                    scores[has_bio] += 0.1 * similarity[columns.bio_rows[has_bio]]
+            keep = active & (columns.user_ids != profile.user_id)
+            all_ids.append(columns.user_ids[keep])
+            all_scores.append(np.minimum(scores[keep], 1.0))
+        return np.concatenate(all_ids), np.concatenate(all_scores)
+
+    def bio_similarity(self, user1: Profile, user2: Profile, state=None) -> float:
+        state = state or self.state
+        if state is not None and state.vectorizer is not None:
+            # Rows are L2-normalized, so the dot product is the cosine
+            vector1 = state.bio_vector(user1.user_id, user1.bio)
+            vector2 = state.bio_vector(user2.user_id, user2.bio)
+            return float(vector1.multiply(vector2).sum())
+        # Not warmed up: fit on just the two bios
+        from sklearn.metrics.pairwise import cosine_similarity
+        tfidf_matrix = self.vectorizer.fit_transform([user1.bio, user2.bio])
+        return float(cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0])
+
+    def stats(self):
+        state = self.state
+        if state is None:
+            return {"ready": False, "rebuilding": self._rebuild_lock.locked()}
+        return {
+            "ready": True,
+            "rebuilding": self._rebuild_lock.locked(),
+            "version": state.version,
+            "source": state.source,
+            "built_at": state.built_at,
+            "build_seconds": state.build_seconds,
+            "profiles": len(state.features),
+            "vocabulary_size": len(state.vectorizer.vocabulary_) if state.vectorizer is not None else 0,
+            "memory_bytes": state.memory_bytes(),
+        }
     
-    def calculate_compatibility(self, user1: Profile, user2: Profile) -> float:
+    def calculate_compatibility(self, user1: Profile, user2: Profile, state=None) -> float:
         """
         Calculate compatibility score between two users based on:
         - Common interests (40% weight)
@@ -45,75 +305,121 @@ class CompatibilityEngine:
             age_score = max(0, 1 - (age_diff / 20))  # Penalty for age difference > 20 years
             score += age_score * 0.1
         
-        # Location proximity (10% weight)
+        # Location proximity (10% weight): decays with distance when both
+        # cities are geocoded, otherwise same city 1.0 / different 0.5
         if user1.city and user2.city:
-            location_score = 1.0 if user1.city.lower() == user2.city.lower() else 0.5
-            score += location_score * 0.1
+            if None not in (user1.latitude, user1.longitude, user2.latitude, user2.longitude):
+                proximity = location_score(haversine_km(user1.latitude, user1.longitude,
+                                                        user2.latitude, user2.longitude))
+            else:
+                proximity = 1.0 if user1.city.lower() == user2.city.lower() else 0.5
+            score += proximity * 0.1
         
         # Bio similarity (10% weight)
         if user1.bio and user2.bio:
             try:
-                bios = [user1.bio, user2.bio]
-                tfidf_matrix = self.vectorizer.fit_transform(bios)
-                bio_similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
-                score += bio_similarity * 0.1
+                score += self.bio_similarity(user1, user2, state) * 0.1
             except:
                 pass  # Skip bio similarity if vectorization fails
         
-        return min(1.0, score)  # Cap at 1.0
+        return float(min(1.0, score))  # Cap at 1.0
     
-    def get_recommendations(self, user_id: int, db: Session, limit: int = 10) -> List[Recommendation]:
+    def get_recommendations(self, user_id: int, db: Session, limit: int = 10, fields=None) -> List[dict]:
         """
-        Get personalized recommendations for a user
+        Get personalized recommendations for a user (dicts with the fields
+        of schemas.Recommendation, or only `fields`)
         """
         current_user = db.query(User).filter(User.id == user_id).first()
         if not current_user or not current_user.profile:
             return []
         
         current_profile = current_user.profile
+        state = self.state  # one consistent snapshot for the whole request
+        recommendations = self._recommend_from_pair_scores(state, current_profile, db, limit, fields)
+        if recommendations is not None:
+            return recommendations
+        if state is not None:
+            return self._recommend_from_features(state, current_profile, db, limit, fields)
         
-        # Get all other users with profiles
+        # Get all other users with profiles (interests/skills batch-loaded)
         other_users = db.query(User).join(Profile).filter(
             User.id != user_id,
             Profile.is_profile_complete == True
+        ).options(
+            selectinload(User.profile), selectinload(User.interests), selectinload(User.skills)
         ).all()
         
-        recommendations = []
+        scored = []
         
         for user in other_users:
             if not user.profile:
                 continue
             
             # Calculate compatibility score
-            compatibility_score = self.calculate_compatibility(current_profile, user.profile)
-            
-            # Get common interests and skills
-            current_interests = set([interest.name for interest in current_profile.interests])
-            other_interests = set([interest.name for interest in user.profile.interests])
-            common_interests = list(current_interests.intersection(other_interests))
-            
-            current_skills = set([skill.name for skill in current_profile.skills])
-            other_skills = set([skill.name for skill in user.profile.skills])
-            common_skills = list(current_skills.intersection(other_skills))
-            
-            recommendation = Recommendation(
-                user_id=user.id,
-                first_name=user.profile.first_name,
-                last_name=user.profile.last_name,
-                age=user.profile.age,
-                city=user.profile.city,
-                bio=user.profile.bio,
-                profile_picture=user.profile.profile_picture,
-                compatibility_score=compatibility_score,
-                common_interests=common_interests,
-                common_skills=common_skills
-            )
-            
-            recommendations.append(recommendation)
+            compatibility_score = self.calculate_compatibility(current_profile, user.profile, state)
+            scored.append((compatibility_score, user))
         
         # Sort by compatibility score and return top recommendations
-        recommendations.sort(key=lambda x: x.compatibility_score, reverse=True)
-        return recommendations[:limit]
+        scored.sort(key=lambda x: x[0], reverse=True)
+        current_interests, current_skills = common_sets(current_profile, fields)
+        return [recommendation_row(user, compatibility_score, current_interests, current_skills, fields)
+                for compatibility_score, user in scored[:limit]]
+    
+    def _recommend_from_pair_scores(self, state, current_profile, db, limit, fields=None):
+        """
+        The user's best stored pairs, or None when they have none or their
+        own profile changed since. Partners whose profile changed since are
+        rescored from the feature store (or left out before warm-up).
+        """
+        user_id = current_profile.user_id
+        if dirty_user_ids(db, [user_id]):
+            return None
+        # A few spare in case some profiles are no longer complete
+        score_of = dict(top_partners(db, user_id, limit * 2))
+        if not score_of:
+            return None
+        stale = dirty_user_ids(db, score_of)
+        if stale:
+            for other_id in stale:
+                del score_of[other_id]
+            if state is not None:
+                user_ids, scores = self.score_all(state, current_profile, sorted(stale))
+                score_of.update(zip(user_ids.tolist(), scores.tolist()))
+        candidates = sorted(score_of, key=lambda other_id: (-score_of[other_id], other_id))
+        return self._load_recommendations(current_profile, db, candidates, score_of, limit, fields)
+
+    def _recommend_from_features(self, state, current_profile, db, limit, fields=None):
+        """Score everyone from the feature store; load only the winners from the database"""
+        import numpy as np
+
+        user_ids, scores = self.score_all(state, current_profile)
+        # Highest score first, ties by user id; a few spare in case some
+        # profiles changed since the store was built
+        order = np.lexsort((user_ids, -scores))[:limit * 2]
+        candidates = [int(user_ids[i]) for i in order]
+        score_of = {int(user_ids[i]): float(scores[i]) for i in order}
+        return self._load_recommendations(current_profile, db, candidates, score_of, limit, fields)
+
+    def _load_recommendations(self, current_profile, db, candidates, score_of, limit, fields=None):
+        """Recommendations for the first `limit` candidates that still have a complete profile"""
+        users = db.query(User).join(Profile).filter(
+            User.id.in_(candidates),
+            Profile.is_profile_complete == True
+        ).options(*user_load_options(fields)).all()
+        by_id = {user.id: user for user in users}
+
+        current_interests, current_skills = common_sets(current_profile, fields)
+        recommendations = []
+        for user_id in candidates:
+            user = by_id.get(user_id)
+            if user is None:
+                continue
+            recommendations.append(recommendation_row(
+                user, score_of[user_id], current_interests, current_skills, fields
+            ))
+            if len(recommendations) == limit:
+                break
+        return recommendations
     
     def create_match(self, user_id: int, matched_user_id: int, db: Session) -> Match:
         """
@@ -135,7 +441,10 @@ class CompatibilityEngine:
         if not user1 or not user2 or not user1.profile or not user2.profile:
             raise ValueError("User profiles not found")
         
-        compatibility_score = self.calculate_compatibility(user1.profile, user2.profile)
+        # Stored by compute_pair_scores.py unless either profile changed since
+        compatibility_score = stored_score(db, user_id, matched_user_id)
+        if compatibility_score is None:
+            compatibility_score = self.calculate_compatibility(user1.profile, user2.profile)
         
         match = Match(
             user_id=user_id,
@@ -148,3 +457,104 @@ class CompatibilityEngine:
         db.refresh(match)
         
         return match
+
+def common_sets(profile: Profile, fields=None):
+    """The profile's interest and skill names, loaded only if `fields` has common_interests / common_skills"""
+    wanted = fields or RECOMMENDATION_FIELDS
+    interests = {interest.name for interest in profile.interests} if "common_interests" in wanted else set()
+    skills = {skill.name for skill in profile.skills} if "common_skills" in wanted else set()
+    return interests, skills
+
+def recommendation_row(user: User, compatibility_score, current_interests, current_skills, fields=None) -> dict:
+    """
+    A schemas.Recommendation as a plain dict (see app/fast_json.py), or
+    only `fields` of it, touching only the attributes those need
+    """
+    row = {}
+    for name in fields or RECOMMENDATION_FIELDS:
+        if name == "user_id":
+            row[name] = user.id
+        elif name == "compatibility_score":
+            # Plain float whichever scorer produced it (numpy scalars included)
+            row[name] = float(compatibility_score)
+        elif name == "common_interests":
+            row[name] = list(current_interests.intersection(i.name for i in user.interests))
+        elif name == "common_skills":
+            row[name] = list(current_skills.intersection(s.name for s in user.skills))
+        else:
+            row[name] = profile_value(user.profile, name)
+    return row
+
+def _jaccard(indptr, indices, query_codes, query_size):
+    """Per-row |row & query| / |row | query| for a CSR set column"""
+    import numpy as np
+
+    sizes = np.diff(indptr)
+    if query_codes:
+        hits = np.concatenate(([0], np.cumsum(np.isin(indices, query_codes))))
+        common = hits[indptr[1:]] - hits[indptr[:-1]]
+    else:
+        common = np.zeros(len(sizes), dtype=np.int64)
+    union = sizes + query_size - common
+    return np.divide(common, union, out=np.zeros(len(sizes)), where=union > 0)
+
+class EngineRegistry:
+    """
+    The ML engines of this worker process. One instance is attached to
+    app.state.engines; routers get engines through the dependencies below
+    so that all requests share the same model state.
+    """
+
+    def __init__(self):
+        self.compatibility = CompatibilityEngine()
+        self._refresh_thread = None
+
+    def warm_up(self, session_factory):
+        """Load the published snapshot, or build all engine state from the database"""
+        if ENGINE_SNAPSHOT_DIR and self.compatibility.load_snapshot(ENGINE_SNAPSHOT_DIR, session_factory):
+            return
+        self.compatibility.rebuild(session_factory)
+
+    def refresh(self, session_factory):
+        """Swap in a newly published snapshot (ENGINE_SNAPSHOT_DIR), else rebuild from the database"""
+        if ENGINE_SNAPSHOT_DIR:
+            return self.compatibility.load_snapshot(ENGINE_SNAPSHOT_DIR, session_factory)
+        return self.compatibility.rebuild(session_factory)
+
+    def start_refresh(self, session_factory, interval=None):
+        """
+        Keep engine state fresh in a daemon thread: poll for new snapshots
+        when ENGINE_SNAPSHOT_DIR is set, else rebuild from the database
+        every ENGINE_REBUILD_INTERVAL seconds.
+        """
+        if interval is None:
+            interval = ENGINE_SNAPSHOT_POLL if ENGINE_SNAPSHOT_DIR else ENGINE_REBUILD_INTERVAL
+        if interval <= 0 or self._refresh_thread is not None:
+            return
+
+        def refresh():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh(session_factory)
+                except Exception:
+                    logger.exception("Compatibility engine refresh failed")
+
+        self._refresh_thread = threading.Thread(target=refresh, name="engine-refresh", daemon=True)
+        self._refresh_thread.start()
+
+    def stats(self):
+        # ru_maxrss is in KB on Linux
+        return {
+            "compatibility": self.compatibility.stats(),
+            "process_max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        }
+
+engine_registry = EngineRegistry()
+
+def get_engine() -> CompatibilityEngine:
+    """The process-wide compatibility engine, for code outside a request"""
+    return engine_registry.compatibility
+
+def get_compatibility_engine(request: Request) -> CompatibilityEngine:
+    return request.app.state.engines.compatibility
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, Table, Index, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
+from app.geo import geocode_profile
 
 # Association tables for many-to-many relationships
 user_interests = Table(
@@ -46,6 +47,10 @@ class Profile(Base):
     last_name = Column(String, nullable=False)
     age = Column(Integer)
     city = Column(String)
+    # Resolved from city via the gazetteer (app/geo.py); None if unknown
+    city_id = Column(Integer, index=True)
+    latitude = Column(Float)
+    longitude = Column(Float)
     bio = Column(Text)
     profile_picture = Column(String)
     search_goals = Column(Text)  # JSON string of goals
@@ -55,6 +60,23 @@ class Profile(Base):
     
     # Relationships
     user = relationship("User", back_populates="profile")
+    
+    # Bounding-box probes for radius searches
+    __table_args__ = (Index("ix_profiles_lat_lon", "latitude", "longitude"),)
+    
+    # Interests and skills are attached to the user; expose them here for scoring
+    @property
+    def interests(self):
+        return self.user.interests if self.user else []
+    
+    @property
+    def skills(self):
+        return self.user.skills if self.user else []
+
+@event.listens_for(Profile, "before_insert")
+@event.listens_for(Profile, "before_update")
+def _geocode_city(mapper, connection, target):
+    geocode_profile(target)
 
 class Interest(Base):
     __tablename__ = "interests"
@@ -91,6 +113,9 @@ class Match(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # Pages of a user's matches, newest first (keyset pagination)
+    __table_args__ = (Index("ix_matches_user_id_id", "user_id", "id"),)
+    
     # Relationships
     user = relationship("User", foreign_keys=[user_id], back_populates="sent_matches")
     matched_user = relationship("User", foreign_keys=[matched_user_id], back_populates="received_matches")
@@ -105,6 +130,41 @@ class Message(Base):
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    # Pages of a conversation, newest first (keyset pagination; one range per direction)
+    __table_args__ = (Index("ix_messages_pair_created_at", "sender_id", "recipient_id", "created_at", "id"),)
+    
     # Relationships
     sender = relationship("User", foreign_keys=[sender_id], back_populates="sent_messages")
     recipient = relationship("User", foreign_keys=[recipient_id], back_populates="received_messages")
+
+class PairScore(Base):
+    """Stored compatibility of an unordered pair of users, keyed (lower id, higher id)"""
+    __tablename__ = "pair_scores"
+    
+    user_low_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    user_high_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    score = Column(Float, nullable=False)
+    computed_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Best partners of a user from either side of the pair
+    __table_args__ = (
+        Index("ix_pair_scores_low_score", "user_low_id", "score"),
+        Index("ix_pair_scores_high_score", "user_high_id", "score"),
+    )
+
+class ProfileChange(Base):
+    """Change feed (outbox) of profile, interest and skill edits; the id is the position in the feed"""
+    __tablename__ = "profile_changes"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    fields = Column(String, nullable=False)  # comma-separated names of what changed
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+class ChangeFeedCheckpoint(Base):
+    """Feed position up to which a durable consumer has applied changes"""
+    __tablename__ = "change_feed_checkpoints"
+    
+    consumer = Column(String, primary_key=True)
+    position = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
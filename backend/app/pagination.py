@@ -0,0 +1,162 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+A page is read with `WHERE (key, id) > (:key, :id) ORDER BY key, id LIMIT n`
+(or < and DESC), which an index on (key, id) answers without scanning the
+rows before it, however deep the page. The cursor handed to the client is
+the (key, id) of the last row, as opaque urlsafe base64; the next page is
+requested with ?cursor=<it>. Response bodies stay plain lists: the next
+cursor comes in the X-Next-Cursor header (and a Link rel="next"), absent on
+the last page.
+
+Ranked searches page their cached ranking the same way, in (score
+descending, user id) order, with the last entry's (score, user id) as the
+cursor (ranking_cursor). A page read after the ranking was recomputed
+starts where the previous one ended instead of shifting with an offset.
+
+Totals are opt-in (?total=true) and approximate: on PostgreSQL the planner's
+row estimate for the query (EXPLAIN, nothing is scanned), elsewhere a count
+stopped at PAGE_COUNT_CAP rows. X-Total-Count-Estimated is set when the
+X-Total-Count header is not exact.
+"""
+import base64
+import binascii
+import json
+import logging
+import os
+from datetime import date, datetime
+
+from fastapi import HTTPException, Request, Response, status
+from sqlalchemy import func, literal, tuple_
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "500"))
+# Rows counted at most for ?total=true where planner estimates are unavailable
+PAGE_COUNT_CAP = int(os.getenv("PAGE_COUNT_CAP", "10000"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+TOTAL_ESTIMATED_HEADER = "X-Total-Count-Estimated"
+# Headers browsers may read on cross-origin responses (CORS expose_headers)
+PAGINATION_HEADERS = [NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER, TOTAL_ESTIMATED_HEADER, "Link"]
+
+def page_size(limit) -> int:
+    """`limit` clamped to 1..PAGE_SIZE_MAX, PAGE_SIZE_DEFAULT if not given"""
+    if limit is None:
+        return PAGE_SIZE_DEFAULT
+    return max(1, min(limit, PAGE_SIZE_MAX))
+
+def encode_cursor(values) -> str:
+    values = [value.isoformat() if isinstance(value, (datetime, date)) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def _cursor_values(cursor: str, length: int) -> list:
+    values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError("wrong length")
+    return values
+
+def decode_cursor(cursor: str, columns) -> list:
+    """Values of `columns` from a cursor made by encode_cursor, 400 if it is not one"""
+    try:
+        values = _cursor_values(cursor, len(columns))
+        decoded = []
+        for column, value in zip(columns, values):
+            python_type = column.type.python_type
+            if python_type in (datetime, date):
+                value = python_type.fromisoformat(value)
+            elif python_type is float and isinstance(value, int):
+                value = float(value)
+            elif not isinstance(value, python_type) or isinstance(value, bool):
+                raise ValueError(f"{column.key} is not {python_type.__name__}")
+            decoded.append(value)
+        return decoded
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def ranking_cursor(entry) -> str:
+    """Cursor after one (user_id, score) entry of a ranked search"""
+    user_id, score = entry
+    return encode_cursor([float(score), user_id])
+
+def decode_ranking_cursor(cursor: str):
+    """(score, user_id) from a cursor made by ranking_cursor, 400 if it is not one"""
+    try:
+        score, user_id = _cursor_values(cursor, 2)
+        if isinstance(score, bool) or not isinstance(score, (int, float)):
+            raise ValueError("score is not a number")
+        if isinstance(user_id, bool) or not isinstance(user_id, int):
+            raise ValueError("user id is not int")
+        return float(score), user_id
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def _sortable(query, column, value=None):
+    """
+    `column` (or a cursor `value` for it) as compared and ordered. SQLite
+    stores server-default timestamps without fractional seconds but binds
+    datetimes with them, so equal times would not compare equal as text:
+    there they are compared as julian days.
+    """
+    expression = column if value is None else literal(value, column.type)
+    if column.type.python_type is datetime and query.session.get_bind().dialect.name == "sqlite":
+        return func.julianday(expression)
+    return column if value is None else value
+
+def paginate(query, id_column, cursor=None, limit=None, key_column=None, descending=False):
+    """
+    One page of `query` in (key_column, id_column) order, id_column alone
+    when there is no key; both must be unique together and non-null, and
+    their values readable from each row by attribute name (selected
+    columns, or the entity). Returns (rows, next cursor or None).
+    """
+    columns = [key_column, id_column] if key_column is not None else [id_column]
+    limit = page_size(limit)
+    sortable = [_sortable(query, column) for column in columns]
+    if cursor:
+        values = [_sortable(query, column, value) for column, value in zip(columns, decode_cursor(cursor, columns))]
+        if len(columns) == 1:
+            position, after = sortable[0], values[0]
+        else:
+            position, after = tuple_(*sortable), tuple_(*values)
+        query = query.filter(position < after if descending else position > after)
+    order = [column.desc() if descending else column.asc() for column in sortable]
+    rows = query.order_by(*order).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], column.key) for column in columns])
+
+def estimate_count(db, query):
+    """
+    (rows of `query`, exact): the planner's estimate on PostgreSQL, else
+    COUNT(*) stopped at PAGE_COUNT_CAP (exact if below it)
+    """
+    bind = db.get_bind()
+    if bind.dialect.name == "postgresql":
+        compiled = query.statement.compile(dialect=bind.dialect)
+        try:
+            plan = db.connection().exec_driver_sql(
+                "EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params
+            ).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"]), False
+        except Exception as e:
+            logger.warning("Row estimate failed (%s); counting instead", e)
+            db.rollback()
+    count = db.query(func.count()).select_from(query.order_by(None).limit(PAGE_COUNT_CAP).subquery()).scalar()
+    return count, count < PAGE_COUNT_CAP
+
+def set_page_headers(request: Request, response: Response, next_cursor, total=None):
+    """Next-page and total headers of a page on `response`"""
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    if total is not None:
+        count, exact = total
+        response.headers[TOTAL_COUNT_HEADER] = str(count)
+        if not exact:
+            response.headers[TOTAL_ESTIMATED_HEADER] = "true"
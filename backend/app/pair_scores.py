@@ -0,0 +1,204 @@
+"""
+Persisted pair compatibility scores.
+
+calculate_compatibility is symmetric, so each unordered pair is stored once
+in pair_scores under (lower user id, higher user id). compute_pair_scores.py
+fills the table with every user's PAIR_SCORES_PER_USER best partners (a
+pair is kept if it is in either user's list) and then keeps it current as
+the "pair_scores" consumer of the change feed (app/change_feed.py): only
+pairs involving users with a change past its checkpoint (dirty users) are
+recomputed.
+
+Readers treat scores involving a dirty user as stale and compute those
+instead.
+"""
+import os
+
+from sqlalchemy import delete, func, insert, or_, select
+from sqlalchemy.orm import Session, selectinload
+
+from app.change_feed import CHANGE_FEED_BATCH_SIZE, DurableConsumer, head, write_checkpoint
+from app.models import User, Profile, PairScore, ProfileChange, ChangeFeedCheckpoint
+
+# Best partners stored per user
+PAIR_SCORES_PER_USER = int(os.getenv("PAIR_SCORES_PER_USER", "200"))
+PAIR_SCORES_BATCH_SIZE = int(os.getenv("PAIR_SCORES_BATCH_SIZE", "5000"))
+# Users whose pairs a full rebuild writes per transaction
+PAIR_SCORES_REBUILD_USERS = int(os.getenv("PAIR_SCORES_REBUILD_USERS", "1000"))
+PAIR_SCORES_CONSUMER = "pair_scores"
+
+def canonical_pair(user_id, other_id):
+    return (user_id, other_id) if user_id < other_id else (other_id, user_id)
+
+def dirty_user_ids(db: Session, user_ids=None):
+    """Users with changes the stored scores do not reflect yet (optionally only among user_ids)"""
+    checkpoint = select(ChangeFeedCheckpoint.position).where(
+        ChangeFeedCheckpoint.consumer == PAIR_SCORES_CONSUMER
+    ).scalar_subquery()
+    query = db.query(ProfileChange.user_id).filter(
+        ProfileChange.id > func.coalesce(checkpoint, 0)
+    ).distinct()
+    if user_ids is not None:
+        query = query.filter(ProfileChange.user_id.in_(list(user_ids)))
+    return {user_id for (user_id,) in query}
+
+def stored_scores(db: Session, user_id: int, other_ids):
+    """{other_id: score} of the stored pairs between user_id and other_ids (two index range scans)"""
+    higher = [o for o in other_ids if o > user_id]
+    lower = [o for o in other_ids if o < user_id]
+    scores = {}
+    if higher:
+        scores.update(db.query(PairScore.user_high_id, PairScore.score).filter(
+            PairScore.user_low_id == user_id, PairScore.user_high_id.in_(higher)
+        ))
+    if lower:
+        scores.update(db.query(PairScore.user_low_id, PairScore.score).filter(
+            PairScore.user_high_id == user_id, PairScore.user_low_id.in_(lower)
+        ))
+    return scores
+
+def fresh_scores(db: Session, user_id: int, other_ids):
+    """stored_scores without the pairs made stale by a dirty user on either side"""
+    scores = stored_scores(db, user_id, other_ids)
+    if scores:
+        stale = dirty_user_ids(db, [user_id, *scores])
+        if user_id in stale:
+            return {}
+        for other_id in stale:
+            del scores[other_id]
+    return scores
+
+def stored_score(db: Session, user_id: int, other_id: int):
+    """The stored score of a pair, or None if missing or stale"""
+    return fresh_scores(db, user_id, [other_id]).get(other_id)
+
+def partner_ids(db: Session, user_id: int):
+    """Ids of every user the given user has a stored pair with"""
+    return [other for (other,) in db.query(PairScore.user_high_id).filter(PairScore.user_low_id == user_id)] + \
+        [other for (other,) in db.query(PairScore.user_low_id).filter(PairScore.user_high_id == user_id)]
+
+def top_partners(db: Session, user_id: int, limit: int):
+    """[(other_id, score)] of the user's best stored pairs, highest first (ties by id)"""
+    partners = db.query(PairScore.user_high_id, PairScore.score).filter(
+        PairScore.user_low_id == user_id
+    ).order_by(PairScore.score.desc()).limit(limit).all()
+    partners += db.query(PairScore.user_low_id, PairScore.score).filter(
+        PairScore.user_high_id == user_id
+    ).order_by(PairScore.score.desc()).limit(limit).all()
+    partners.sort(key=lambda p: (-p[1], p[0]))
+    return partners[:limit]
+
+def _best_partners(engine, state, profile, per_user):
+    """{other_id: score} of the profile's per_user best partners in the feature store"""
+    import numpy as np
+
+    user_ids, scores = engine.score_all(state, profile)
+    order = np.lexsort((user_ids, -scores))[:per_user]
+    return dict(zip(user_ids[order].tolist(), scores[order].tolist()))
+
+def _load_profiles(db, user_ids=None):
+    query = db.query(Profile).filter(Profile.is_profile_complete == True).options(
+        selectinload(Profile.user).selectinload(User.interests),
+        selectinload(Profile.user).selectinload(User.skills)
+    )
+    if user_ids is not None:
+        query = query.filter(Profile.user_id.in_(list(user_ids)))
+    return query.all()
+
+def _insert_pairs(db, pairs):
+    rows = [{"user_low_id": low, "user_high_id": high, "score": score}
+            for (low, high), score in pairs.items()]
+    for start in range(0, len(rows), PAIR_SCORES_BATCH_SIZE):
+        db.execute(insert(PairScore), rows[start:start + PAIR_SCORES_BATCH_SIZE])
+
+def rebuild_all(db: Session, engine, state, per_user=PAIR_SCORES_PER_USER, batch_users=PAIR_SCORES_REBUILD_USERS):
+    """
+    Replace the whole table with every user's best partners, one user-id
+    range of `batch_users` complete profiles per transaction, then move
+    the checkpoint to the feed head as of the start (later changes are left
+    for the next incremental pass). Returns the number of pairs stored.
+
+    Pairs are owned by their lower id: a range deletes the pairs it owns
+    before inserting its users' partners, and skips pairs an earlier range
+    already stored from the other side. Readers see old scores for the
+    ranges not reached yet.
+    """
+    position = head(db)
+    stored = 0
+    lower = None  # last user id of the previous range
+    while True:
+        query = db.query(Profile).filter(Profile.is_profile_complete == True).options(
+            selectinload(Profile.user).selectinload(User.interests),
+            selectinload(Profile.user).selectinload(User.skills)
+        )
+        if lower is not None:
+            query = query.filter(Profile.user_id > lower)
+        profiles = query.order_by(Profile.user_id).limit(batch_users).all()
+        upper = profiles[-1].user_id if len(profiles) == batch_users else None
+
+        pairs = {}
+        for profile in profiles:
+            for other_id, score in _best_partners(engine, state, profile, per_user).items():
+                pairs[canonical_pair(profile.user_id, other_id)] = score
+        if lower is not None and profiles:
+            stored_before = db.query(PairScore.user_low_id, PairScore.user_high_id).filter(
+                PairScore.user_high_id.in_([profile.user_id for profile in profiles]),
+                PairScore.user_low_id <= lower
+            )
+            for pair in stored_before:
+                pairs.pop(tuple(pair), None)
+
+        owned = delete(PairScore)
+        if lower is not None:
+            owned = owned.where(PairScore.user_low_id > lower)
+        if upper is not None:
+            owned = owned.where(PairScore.user_low_id <= upper)
+        db.execute(owned)
+        _insert_pairs(db, pairs)
+        db.commit()
+        db.expunge_all()
+        stored += len(pairs)
+        if upper is None:
+            break
+        lower = upper
+    write_checkpoint(db, PAIR_SCORES_CONSUMER, position)
+    db.commit()
+    return stored
+
+def recompute_users(db: Session, engine, state, user_ids, per_user=PAIR_SCORES_PER_USER):
+    """
+    Replace the pairs of `user_ids` (without committing): their current
+    best partners plus every pair already stored for them, rescored. Users
+    who no longer have a complete profile lose their pairs. Returns the
+    number of pairs written.
+    """
+    user_ids = sorted(set(user_ids))
+    # The engine state may predate these changes
+    for user_id in user_ids:
+        engine.refresh_profile(db, user_id)
+
+    pairs = {}
+    for profile in _load_profiles(db, user_ids):
+        scores = _best_partners(engine, state, profile, per_user)
+        existing = [other for other in partner_ids(db, profile.user_id) if other not in scores]
+        if existing:
+            others, rescored = engine.score_all(state, profile, existing)
+            scores.update(zip(others.tolist(), rescored.tolist()))
+        for other_id, score in scores.items():
+            pairs[canonical_pair(profile.user_id, other_id)] = score
+
+    db.execute(delete(PairScore).where(or_(
+        PairScore.user_low_id.in_(user_ids), PairScore.user_high_id.in_(user_ids)
+    )))
+    _insert_pairs(db, pairs)
+    return len(pairs)
+
+def pair_score_consumer(engine, per_user=PAIR_SCORES_PER_USER, batch_size=CHANGE_FEED_BATCH_SIZE):
+    """
+    The change feed consumer recomputing the pairs of changed users, each
+    batch against the engine's state at the time (rebuilds are picked up)
+    """
+    def apply(db, changes):
+        recompute_users(db, engine, engine.state, [change.user_id for change in changes], per_user)
+
+    return DurableConsumer(PAIR_SCORES_CONSUMER, apply, batch_size)
@@ -0,0 +1,268 @@
+"""
+On-demand profiling of a running worker, for admins.
+
+Two profilers are available:
+
+    cprofile    deterministic cProfile of the event loop thread (where the
+                async handlers and everything they call synchronously run)
+                and of the work admission control hands to the threadpool
+                (ranking and scoring; see run_profiled); output as pstats
+                (binary, for snakeviz / gprof2dot) or text
+    sample      statistical sampler reading every thread's stack each
+                PROFILE_SAMPLE_INTERVAL seconds; output as collapsed stacks
+                (one "frame;frame;frame count" line per stack) for
+                flamegraph.pl or speedscope
+
+A worker-wide run is started with POST /api/admin/profile; a single
+request is profiled by sending it with an "X-Profile: cprofile|sample"
+header, in which case the profile is returned instead of the response.
+Nothing is installed unless PROFILING_ENABLED is set, so disabled
+profiling costs nothing.
+"""
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from starlette.concurrency import run_in_threadpool
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0").strip().lower() in ("1", "true", "yes", "on")
+# Longest worker-wide run an admin can start
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_HEADER = "x-profile"
+
+PROFILERS = ("cprofile", "sample")
+FORMATS = {"cprofile": ("pstats", "text"), "sample": ("collapsed",)}
+
+class ProfilerBusy(Exception):
+    pass
+
+# One profiler at a time per worker (cProfile cannot nest)
+_profiling_lock = threading.Lock()
+# The running Profile, if any
+_active = None
+
+class StackSampler:
+    """Counts the stacks of all other threads, sampled from a background thread"""
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+class Profile:
+    """A cProfile or sampling run; start() / stop() then render(fmt)"""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self._impl = cProfile.Profile() if profiler == "cprofile" else StackSampler()
+        # cProfile only sees the thread that enabled it: calls run in other
+        # threads get a profiler each, merged in by render()
+        self._thread_profiles = []
+        self._thread_lock = threading.Lock()
+        self.started = None
+        self.seconds = 0.0
+
+    def start(self):
+        global _active
+        if not _profiling_lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running in this worker")
+        self.started = time.perf_counter()
+        if self.profiler == "cprofile":
+            self._impl.enable()
+        else:
+            self._impl.start()
+        _active = self
+
+    def stop(self):
+        global _active
+        _active = None
+        try:
+            if self.profiler == "cprofile":
+                self._impl.disable()
+            else:
+                self._impl.stop()
+        finally:
+            self.seconds = time.perf_counter() - self.started
+            _profiling_lock.release()
+
+    def run_in_thread(self, fn, *args):
+        """fn(*args) profiled in the calling thread, included in this profile"""
+        thread_profile = cProfile.Profile()
+        thread_profile.enable()
+        try:
+            return fn(*args)
+        finally:
+            thread_profile.disable()
+            with self._thread_lock:
+                self._thread_profiles.append(thread_profile)
+
+    def render(self, fmt):
+        """(body, media type) of the profile in `fmt`"""
+        if fmt == "collapsed":
+            return self._impl.collapsed(), "text/plain"
+        out = io.StringIO()
+        with self._thread_lock:
+            stats = pstats.Stats(self._impl, *self._thread_profiles, stream=out)
+        if fmt == "pstats":
+            # What pstats.Stats.dump_stats writes, without a temporary file
+            return marshal.dumps(stats.stats), "application/octet-stream"
+        stats.sort_stats("cumulative").print_stats(100)
+        return out.getvalue(), "text/plain"
+
+def run_profiled(fn, *args):
+    """
+    fn(*args), for calls handed to the threadpool: included in the running
+    cProfile (which otherwise only sees the event loop thread), if any.
+    The sampler sees every thread already.
+    """
+    profile = _active
+    if profile is None or profile.profiler != "cprofile":
+        return fn(*args)
+    return profile.run_in_thread(fn, *args)
+
+def check_options(profiler, fmt):
+    """The output format to use, or raise ValueError for an unknown combination"""
+    if profiler not in FORMATS:
+        raise ValueError(f"profiler must be one of {', '.join(PROFILERS)}")
+    fmt = fmt or FORMATS[profiler][0]
+    if fmt not in FORMATS[profiler]:
+        raise ValueError(f"{profiler} output format must be one of {', '.join(FORMATS[profiler])}")
+    return fmt
+
+async def profile_for(seconds, profiler):
+    """Profile this worker for `seconds` while it keeps serving requests"""
+    profile = Profile(profiler)
+    profile.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profile.stop()
+    return profile
+
+class ProfilingMiddleware:
+    """
+    Profiles one request when an admin sends it with the X-Profile header
+    (value: profiler, optionally "profiler:format"). The handler's response
+    is discarded and the profile returned instead, with the original status
+    in X-Profiled-Status. Concurrent requests on the same worker show up in
+    the profile too.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        value = None
+        for name, header_value in scope["headers"]:
+            if name == PROFILE_HEADER.encode():
+                value = header_value.decode("latin-1").strip().lower()
+                break
+        if value is None or not await _is_admin_request(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profiler, _, fmt = value.partition(":")
+        try:
+            fmt = check_options(profiler, fmt)
+        except ValueError as e:
+            await _send_text(send, 400, str(e).encode(), "text/plain")
+            return
+
+        status = 500
+
+        async def discard(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        profile = Profile(profiler)
+        try:
+            profile.start()
+        except ProfilerBusy as e:
+            await _send_text(send, 409, str(e).encode(), "text/plain")
+            return
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profile.stop()
+        body, media_type = profile.render(fmt)
+        await _send_text(send, 200, body.encode() if isinstance(body, str) else body, media_type,
+                         [(b"x-profiled-status", str(status).encode()),
+                          (b"x-profile-seconds", f"{profile.seconds:.3f}".encode())])
+
+async def _is_admin_request(scope):
+    """
+    Whether the request's bearer token is an admin's. Ids that no admin rule
+    can match, and listed admin ids with a cached principal, are answered
+    without the database; otherwise the user is loaded in the threadpool.
+    """
+    from starlette.requests import Request
+    from app.auth import ADMIN_EMAILS, ADMIN_USER_IDS, principal_cache, user_id_from_request
+
+    user_id = user_id_from_request(Request(scope))
+    if user_id is None or (user_id not in ADMIN_USER_IDS and not ADMIN_EMAILS):
+        return False
+    principal = principal_cache.get(user_id)
+    if principal is not None and user_id in ADMIN_USER_IDS:
+        return principal.is_active
+    return await run_in_threadpool(_load_is_admin, user_id)
+
+def _load_is_admin(user_id):
+    from app.auth import is_admin
+    from app.database import SessionLocal
+    from app.models import User
+
+    db = SessionLocal()
+    try:
+        return is_admin(db.get(User, user_id))
+    finally:
+        db.close()
+
+async def _send_text(send, status, body, media_type, headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", media_type.encode()),
+                    (b"content-length", str(len(body)).encode()), *headers],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,96 @@
+"""
+Sparse fieldsets: a `fields=` query parameter selecting which fields of
+profile, search and recommendation responses are returned.
+
+    fields=first_name,age,city      just these (plus the id field)
+    fields=card                     what a list card shows: name, age,
+                                    city and avatar
+
+The selection drives the SQL as well as the response: only the profile
+columns a field needs are loaded (load_only / explicit columns) and
+interests and skills are only loaded when asked for, so light list views
+neither read nor ship bios. A projected row lacks fields response_model
+requires, so it is returned as a FastJSONResponse without re-validation.
+"""
+from typing import Optional
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy.orm import selectinload
+
+from app.avatars import thumbnail_url
+from app.fast_json import FastJSONResponse, list_response
+from app.models import User, Profile
+
+# Response fields in schema order
+SEARCH_RESULT_FIELDS = ("user_id", "first_name", "last_name", "age", "city", "bio", "profile_picture")
+RECOMMENDATION_FIELDS = SEARCH_RESULT_FIELDS + ("compatibility_score", "common_interests", "common_skills")
+PROFILE_FIELDS = (
+    "id", "user_id", "first_name", "last_name", "age", "city", "bio", "profile_picture", "search_goals",
+    "city_id", "latitude", "longitude", "is_profile_complete", "created_at", "updated_at",
+)
+USER_DETAIL_FIELDS = ("id", "email", "interests", "skills")
+PROFILE_DETAIL_FIELDS = PROFILE_FIELDS + ("interests", "skills")
+
+PRESETS = {"card": ("user_id", "first_name", "last_name", "age", "city", "profile_picture")}
+
+# Response fields read straight from a Profile column
+PROFILE_COLUMN_FIELDS = frozenset(PROFILE_FIELDS) - {"id", "user_id"}
+
+def parse_fields(fields: Optional[str], allowed, always=()):
+    """
+    The requested fields of `allowed`, in its order and including
+    `always`; None when no projection was asked for. Unknown names are a
+    400.
+    """
+    if fields is None or not fields.strip():
+        return None
+    requested = set(always)
+    for name in fields.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name in PRESETS:
+            requested.update(field for field in PRESETS[name] if field in allowed)
+        elif name in allowed:
+            requested.add(name)
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown field '{name}'; choose from {', '.join(allowed)} or {', '.join(PRESETS)}"
+            )
+    return tuple(field for field in allowed if field in requested)
+
+def profile_columns(fields):
+    """Profile columns the fields are read from (all of them for None)"""
+    if fields is None:
+        return [getattr(Profile, name) for name in PROFILE_FIELDS]
+    return [getattr(Profile, name) for name in fields if name in PROFILE_COLUMN_FIELDS]
+
+def user_load_options(fields):
+    """Loader options for Users rendered with `fields`: projected profile, interests / skills if needed"""
+    options = [selectinload(User.profile).load_only(*profile_columns(fields))]
+    if fields is None or "common_interests" in fields:
+        options.append(selectinload(User.interests))
+    if fields is None or "common_skills" in fields:
+        options.append(selectinload(User.skills))
+    return options
+
+def profile_value(profile: Profile, name: str):
+    """A list-card field of a profile (avatars as thumbnails)"""
+    if name == "profile_picture":
+        return thumbnail_url(profile.profile_picture)
+    return getattr(profile, name)
+
+def search_result_row(user: User, fields=SEARCH_RESULT_FIELDS) -> dict:
+    """A schemas.UserSearchResult as a dict, touching only the attributes `fields` need"""
+    return {name: user.id if name == "user_id" else profile_value(user.profile, name) for name in fields}
+
+def projected_response(request: Request, items, fields):
+    """
+    list_response for full rows; projected rows skip response_model
+    validation, so they go through fast_json.dumps (datetimes and numpy
+    values included) whatever FAST_JSON_RESPONSES is set to
+    """
+    if fields is None:
+        return list_response(request, items)
+    return FastJSONResponse(items, request)
@@ -0,0 +1,218 @@
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import NamedTuple, Tuple, Optional
+
+from sqlalchemy.orm import Session
+
+from app.geo import Gazetteer, get_gazetteer, normalize_place
+from app.models import Interest, Skill
+
+# Parsed queries cached per worker (keyed by normalized query text)
+QUERY_PARSE_CACHE_SIZE = int(os.getenv("QUERY_PARSE_CACHE_SIZE", "4096"))
+# Seconds before interest / skill names are reloaded from the database
+QUERY_VOCABULARY_TTL = float(os.getenv("QUERY_VOCABULARY_TTL", "300"))
+
+# Generic words that map to a broad interest category
+KEYWORD_CATEGORIES = {
+    'music': ['music', 'musician', 'singer', 'guitar', 'piano'],
+    'sports': ['sports', 'football', 'basketball', 'tennis', 'running'],
+    'art': ['art', 'painting', 'drawing', 'design', 'creative'],
+    'technology': ['tech', 'programming', 'coding', 'developer', 'software'],
+    'business': ['business', 'entrepreneur', 'startup', 'marketing'],
+    'education': ['teacher', 'student', 'education', 'learning'],
+    'fitness': ['fitness', 'gym', 'workout', 'yoga', 'exercise']
+}
+
+MIN_AGE, MAX_AGE = 16, 120
+
+# Age expressions, tried at each position before vocabulary terms
+AGE_PATTERNS = [
+    ("range", r"(?:between\s+)?(?P<range_lo>\d{1,3})\s*(?:-|–|to|and)\s*(?P<range_hi>\d{1,3})(?:\s*years?)?"),
+    ("under", r"(?:under|below|younger\s+than|less\s+than)\s+(?P<under>\d{1,3})"),
+    ("over", r"(?:over|above|older\s+than|more\s+than)\s+(?P<over>\d{1,3})"),
+    ("at_least", r"(?P<at_least>\d{1,3})\s*(?:\+|or\s+older|and\s+(?:up|older))"),
+    ("decade", r"(?:in\s+their\s+)?(?P<decade>[1-9]0)s"),
+    ("exact", r"(?:age[sd]?\s+(?P<exact_a>\d{1,3})|(?P<exact_b>\d{1,3})\s*(?:years?\s+old|yo))"),
+]
+
+# "within 50 km", "within 20 miles"
+RADIUS_PATTERN = r"within\s+(?P<radius>\d{1,5})\s*(?P<radius_unit>km|kilometers?|kilometres?|mi|miles?)"
+KM_PER_MILE = 1.609344
+
+class ParsedQuery(NamedTuple):
+    """Search criteria extracted from a free-text query (immutable: cached and shared)"""
+    text: str
+    cities: Tuple[str, ...] = ()  # lower-cased gazetteer names
+    interests: Tuple[str, ...] = ()
+    skills: Tuple[str, ...] = ()
+    min_age: Optional[int] = None
+    max_age: Optional[int] = None
+    radius_km: Optional[float] = None  # around the first city (or the searcher)
+
+def _trie_pattern(terms):
+    """
+    Regex matching any of `terms`, factored by common prefix so matching
+    walks one trie branch per character instead of trying every term.
+    Longer terms win because each node tries its children before ending.
+    """
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def render(node):
+        ends = "" in node
+        branches = []
+        for char in sorted(k for k in node if k):
+            piece = r"\s+" if char == " " else re.escape(char)
+            branches.append(piece + render(node[char]))
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if ends else body
+
+    return render(trie) if trie else r"(?!x)x"
+
+def normalize_query(query: str) -> str:
+    """Lower-case, drop punctuation (keeping '-' and '+' for ages), collapse spaces"""
+    return " ".join(re.sub(r"[^\w\s+\-–]", " ", query.lower()).split())
+
+class QueryParser:
+    """
+    Extracts cities, a search radius, age bounds, interests and skills from
+    a query in a single left-to-right scan of one compiled regular
+    expression: the radius and age patterns plus every known term compiled
+    as a prefix trie (longest match wins, so "machine learning" beats
+    "learning"). Each term match is looked up in a term -> [(kind,
+    canonical name)] table.
+
+    Cities are the gazetteer's names and aliases (with and without
+    accents), never the free text users put in their profiles.
+    """
+
+    def __init__(self, interest_names=(), skill_names=(), gazetteer: Optional[Gazetteer] = None):
+        self.terms = {}
+        for category, keywords in KEYWORD_CATEGORIES.items():
+            for keyword in keywords:
+                self._add(keyword, "interest", category)
+        for name in interest_names:
+            self._add(name, "interest", name.lower())
+        for name in skill_names:
+            self._add(name, "skill", name.lower())
+        for name, city in (gazetteer.names if gazetteer is not None else ()):
+            for spelling in (name, normalize_place(name)):
+                self._add(spelling, "city", city.name.lower())
+
+        alternation = _trie_pattern(self.terms)
+        ages = "|".join(f"(?P<age_{kind}>{pattern})" for kind, pattern in AGE_PATTERNS)
+        self.pattern = re.compile(
+            rf"(?<![\w])(?P<within>{RADIUS_PATTERN})(?![\w])|"
+            rf"(?<![\w]){ages}(?![\w])|(?<![\w])(?P<term>{alternation})(?:e?s|ers?)?(?![\w])"
+        )
+        self.parse_normalized = lru_cache(maxsize=QUERY_PARSE_CACHE_SIZE)(self._parse)
+
+    def _add(self, name, kind, canonical):
+        term = normalize_query(name)  # same form as the queries it must match
+        if term:
+            entries = self.terms.setdefault(term, [])
+            if (kind, canonical) not in entries:
+                entries.append((kind, canonical))
+
+    def parse(self, query: str) -> ParsedQuery:
+        return self.parse_normalized(normalize_query(query))
+
+    def _parse(self, text: str) -> ParsedQuery:
+        found = {"city": [], "interest": [], "skill": []}
+        min_age, max_age = None, None
+        radius_km = None
+
+        def bound(lo=None, hi=None):
+            nonlocal min_age, max_age
+            if lo is not None:
+                min_age = lo if min_age is None else max(min_age, lo)
+            if hi is not None:
+                max_age = hi if max_age is None else min(max_age, hi)
+
+        for match in self.pattern.finditer(text):
+            groups = match.groupdict()
+            if groups["term"] is not None:
+                term = " ".join(groups["term"].split())
+                for kind, canonical in self.terms.get(term, ()):
+                    if canonical not in found[kind]:
+                        found[kind].append(canonical)
+            elif groups["within"] is not None:
+                radius_km = float(groups["radius"])
+                if groups["radius_unit"].startswith("mi"):
+                    radius_km *= KM_PER_MILE
+            elif groups["age_range"] is not None:
+                lo, hi = sorted((int(groups["range_lo"]), int(groups["range_hi"])))
+                if MIN_AGE <= lo and hi <= MAX_AGE:
+                    bound(lo, hi)
+            elif groups["age_under"] is not None:
+                bound(hi=int(groups["under"]) - 1)
+            elif groups["age_over"] is not None:
+                bound(lo=int(groups["over"]) + 1)
+            elif groups["age_at_least"] is not None:
+                bound(lo=int(groups["at_least"]))
+            elif groups["age_decade"] is not None:
+                decade = int(groups["decade"])
+                bound(decade, decade + 9)
+            elif groups["age_exact"] is not None:
+                age = int(groups["exact_a"] or groups["exact_b"])
+                # Same leeway as before: an exact age means roughly that age
+                if age < 18:
+                    bound(lo=age)
+                elif age > 65:
+                    bound(hi=age)
+                else:
+                    bound(age - 5, age + 5)
+
+        return ParsedQuery(
+            text=text,
+            cities=tuple(found["city"]),
+            interests=tuple(found["interest"]),
+            skills=tuple(found["skill"]),
+            min_age=min_age,
+            max_age=max_age,
+            radius_km=radius_km,
+        )
+
+_parser = None
+_parser_loaded_at = 0.0
+_parser_lock = threading.Lock()
+
+def fresh_query_parser() -> Optional[QueryParser]:
+    """The worker's parser if it needs no recompiling, else None"""
+    if _parser is not None and time.monotonic() - _parser_loaded_at < QUERY_VOCABULARY_TTL:
+        return _parser
+    return None
+
+def get_query_parser(db: Session) -> QueryParser:
+    """
+    The worker's parser, compiled from the current interest and skill names
+    and the gazetteer, and recompiled once QUERY_VOCABULARY_TTL has passed
+    (which also starts a fresh parse cache). Compiling queries the database
+    and builds a large regex: async callers take fresh_query_parser() and
+    run this in the threadpool only when that is None.
+    """
+    global _parser, _parser_loaded_at
+    parser = fresh_query_parser()
+    if parser is not None:
+        return parser
+    with _parser_lock:
+        if fresh_query_parser() is None:
+            interests = [name for (name,) in db.query(Interest.name)]
+            skills = [name for (name,) in db.query(Skill.name)]
+            _parser = QueryParser(interests, skills, get_gazetteer())
+            _parser_loaded_at = time.monotonic()
+    return _parser
+
+def expire_query_parser():
+    """Recompile the parser on next use, e.g. after new interest or skill names appeared"""
+    global _parser_loaded_at
+    _parser_loaded_at = float("-inf")
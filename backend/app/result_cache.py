@@ -0,0 +1,259 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, selectinload
+
+from app.database import SessionLocal
+from app.models import User, Profile
+
+logger = logging.getLogger(__name__)
+
+# Cached search rankings per worker
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2048"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "120"))
+# How many ranked results are kept per search (pages beyond this are recomputed)
+RESULT_CACHE_DEPTH = int(os.getenv("RESULT_CACHE_DEPTH", "200"))
+# Optional Redis for sharing the profile-write version between workers
+RESULT_CACHE_REDIS_URL = os.getenv("RESULT_CACHE_REDIS_URL", os.getenv("REDIS_URL", ""))
+VERSION_POLL_INTERVAL = float(os.getenv("RESULT_CACHE_VERSION_POLL", "1"))
+VERSION_KEY = "search:profile_write_version"
+# Per-user profile details served by POST /api/users/batch (the TTL also
+# bounds how long a row read from a lagging replica can outlive its invalidation)
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+
+class ProfileWriteVersion:
+    """
+    Counter bumped on every committed profile, interest or skill change.
+    Cached rankings remember the version they were computed at and are
+    discarded once it moves on.
+
+    The local part sees this worker's writes immediately. With Redis
+    configured, writes are also counted in a shared key (read at most every
+    VERSION_POLL_INTERVAL seconds) so other workers' writes invalidate too.
+    If Redis is unreachable the shared part is frozen and retried later;
+    the TTL still bounds staleness.
+    """
+
+    def __init__(self, redis_url=""):
+        self._local = 0
+        self._shared = 0
+        self._shared_read_at = 0.0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._redis = None
+        if redis_url:
+            try:
+                import redis
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.2,
+                                                   socket_connect_timeout=0.2)
+            except ImportError:
+                logger.warning("redis is not installed; profile write version is per worker")
+
+    def _shared_call(self, method, *args):
+        if self._redis is None or time.monotonic() < self._retry_at:
+            return None
+        try:
+            return getattr(self._redis, method)(*args)
+        except Exception as e:
+            logger.warning("Profile write version: Redis unavailable (%s)", e)
+            self._retry_at = time.monotonic() + 10
+            return None
+
+    def bump(self, shared=True):
+        """Count a write; shared=False for writes other workers learn of themselves"""
+        with self._lock:
+            self._local += 1
+        if not shared:
+            return
+        shared = self._shared_call("incr", VERSION_KEY)
+        if shared is not None:
+            with self._lock:
+                self._shared = int(shared)
+                self._shared_read_at = time.monotonic()
+
+    def current(self):
+        if self._redis is not None and time.monotonic() - self._shared_read_at >= VERSION_POLL_INTERVAL:
+            shared = self._shared_call("get", VERSION_KEY)
+            with self._lock:
+                if shared is not None:
+                    self._shared = int(shared)
+                self._shared_read_at = time.monotonic()
+        with self._lock:
+            return (self._local, self._shared)
+
+profile_write_version = ProfileWriteVersion(RESULT_CACHE_REDIS_URL)
+
+class ResultCache:
+    """
+    LRU + TTL cache of search results keyed by normalized criteria and
+    requester. Entries are dropped when they expire or when the profile
+    write version has moved on since they were stored. Without a version
+    entries only expire, or are discarded by key.
+    """
+
+    def __init__(self, max_size, ttl, version):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _current(self):
+        return self.version.current() if self.version is not None else None
+
+    def get(self, key):
+        found = self.get_many((key,))
+        return found.get(key)
+
+    def get_many(self, keys):
+        """{key: value} for the keys with a live entry"""
+        current = self._current()
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    value, version, expires_at = entry
+                    if version == current and expires_at >= now:
+                        self._entries.move_to_end(key)
+                        found[key] = value
+                        continue
+                    del self._entries[key]
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, values):
+        current = self._current()
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = (value, current, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL, profile_write_version)
+# Keyed by user id and invalidated per user: by this worker's commits below
+# and by the change feed follower for other workers' writes
+profile_cache = ResultCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL, None)
+
+def ranking_order(entry):
+    """Sort key of a (user_id, score) ranking entry: best score first, ties by user id"""
+    user_id, score = entry
+    return (-score, user_id)
+
+def ranking_position(ranking, after):
+    """Index of the first entry of a ranking past cursor position `after` = (score, user_id), 0 for None"""
+    if after is None:
+        return 0
+    score, user_id = after
+    return bisect.bisect_right(ranking, (-score, user_id), key=ranking_order)
+
+def _covers(ranking, complete, limit, after):
+    # One entry beyond the page tells whether there is a next page
+    return complete or len(ranking) > ranking_position(ranking, after) + limit
+
+def cached_ranking_hit(key, limit, after=None):
+    """The cached ranking of a search if it covers the page of `limit` after `after`, else None"""
+    entry = result_cache.get(key)
+    if entry is not None:
+        ranking, complete = entry
+        if _covers(ranking, complete, limit, after):
+            return ranking
+    return None
+
+def cached_ranking(key, limit, rank, after=None):
+    """
+    Ranked [(user_id, score)] for a search, in ranking_order, covering the
+    page of `limit` results after cursor position `after` unless there are
+    fewer results. Only ids and scores are cached, so later pages of the
+    same search skip the ranking entirely. On a miss rank(depth) must return
+    (ranking, complete) where complete says no result beyond the first
+    `depth` was left out; the depth is doubled until the page is covered or
+    a deeper rank() finds nothing more. rank() may return ([], False) to stop
+    deepening (e.g. out of time); the longest ranking found is kept, and
+    cached as incomplete unless rank() said otherwise.
+    """
+    ranking = cached_ranking_hit(key, limit, after)
+    if ranking is not None:
+        return ranking
+    depth = max(limit + 1, RESULT_CACHE_DEPTH)
+    best = None
+    while True:
+        ranking, complete = rank(depth)
+        ranking = sorted(ranking, key=ranking_order)
+        complete = complete and len(ranking) <= depth
+        ranking = tuple(ranking[:depth])
+        if best is not None and len(ranking) <= len(best[0]):
+            break  # deeper found nothing more (or rank() gave up): keep the last pass
+        best = (ranking, complete)
+        if _covers(ranking, complete, limit, after):
+            break
+        depth *= 2
+    result_cache.set(key, best)
+    return best[0]
+
+def ranking_page(ranking, limit, after=None):
+    """(entries of the page of `limit` after `after`, the last one if a page follows it, else None)"""
+    start = ranking_position(ranking, after)
+    page = ranking[start:start + limit]
+    return page, (page[-1] if len(ranking) > start + limit else None)
+
+def load_page(db: Session, page, options=None):
+    """
+    [(user, score)] for one page of a ranking, loaded with one query per
+    relationship (profile, interests and skills unless `options` says otherwise)
+    """
+    if not page:
+        return []
+    if options is None:
+        options = [selectinload(User.profile), selectinload(User.interests), selectinload(User.skills)]
+    users = db.query(User).options(*options).filter(User.id.in_([user_id for user_id, _ in page])).all()
+    by_id = {user.id: user for user in users}
+    # Users deleted since the ranking was cached are skipped
+    return [(by_id[user_id], score) for user_id, score in page
+            if user_id in by_id and by_id[user_id].profile]
+
+# Bump the version and drop the users' cached profiles when a commit
+# touched profiles or users (interest and skill changes are collection
+# changes on User)
+@event.listens_for(SessionLocal, "after_flush")
+def _mark_profile_write(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, Profile):
+            session.info.setdefault("changed_user_ids", set()).add(instance.user_id)
+        elif isinstance(instance, User):
+            session.info.setdefault("changed_user_ids", set()).add(instance.id)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _bump_profile_write_version(session):
+    user_ids = session.info.pop("changed_user_ids", None)
+    if user_ids:
+        profile_write_version.bump()
+        profile_cache.discard(user_ids)
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from app.models import User
+from app.auth import get_current_admin
+from app.profiling import PROFILE_MAX_SECONDS, ProfilerBusy, check_options, profile_for
+
+router = APIRouter()
+
+@router.post("/profile")
+async def profile_worker(
+    seconds: float = 10,
+    profiler: str = "sample",
+    format: str = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """
+    Profile the worker serving this request for `seconds` and return the
+    result (collapsed stacks for "sample", pstats or text for "cprofile")
+    """
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"seconds must be between 0 and {PROFILE_MAX_SECONDS:g}"
+        )
+    try:
+        fmt = check_options(profiler, format)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    try:
+        profile = await profile_for(seconds, profiler)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    
+    body, media_type = profile.render(fmt)
+    return Response(content=body, media_type=media_type, headers={
+        "X-Profile-Seconds": f"{profile.seconds:.3f}"
+    })
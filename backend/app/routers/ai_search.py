@@ -1,138 +1,284 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import logging
+import os
+import time
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import case, func, literal, or_, select
+from sqlalchemy.orm import Session, selectinload
 from typing import List
-from app.database import get_db
-from app.models import User, Profile, Interest, Skill
+from app.database import get_read_db
+from app.models import User, Profile, Interest, Skill, user_interests, user_skills
 from app.schemas import UserSearchRequest, UserSearchResult
 from app.auth import get_current_user
-from app.ml_engine import CompatibilityEngine
+from app.geo import get_gazetteer, is_within, within_radius
+from app.ml_engine import CompatibilityEngine, get_compatibility_engine
+from app.query_parser import ParsedQuery, fresh_query_parser, get_query_parser
+from app.projection import SEARCH_RESULT_FIELDS, parse_fields, projected_response, search_result_row, user_load_options
+from app.result_cache import cached_ranking, cached_ranking_hit, load_page, ranking_page
+from app.pagination import NEXT_CURSOR_HEADER, decode_ranking_cursor, page_size, ranking_cursor
+from app.admission import Admission, admission_controllers
+from app.fast_json import with_headers
+
+logger = logging.getLogger(__name__)
+
+# Stage 2 rescoring: how many of the best text matches are rescored with
+# compatibility, and the compatibility share of the final score (0..1)
+AI_SEARCH_RERANK_DEPTH = int(os.getenv("AI_SEARCH_RERANK_DEPTH", "300"))
+AI_SEARCH_COMPATIBILITY_WEIGHT = float(os.getenv("AI_SEARCH_COMPATIBILITY_WEIGHT", "0.3"))
+# Time budget for ranking one search; past it, retrieval stops early and
+# rescoring is skipped
+AI_SEARCH_BUDGET_MS = float(os.getenv("AI_SEARCH_BUDGET_MS", "250"))
 
 router = APIRouter()
-ml_engine = CompatibilityEngine()
+
+class StageTimer:
+    """Per-stage durations of one search, reported in the Server-Timing header"""
+
+    def __init__(self, budget_ms):
+        self.started = time.perf_counter()
+        self.deadline = self.started + budget_ms / 1000
+        self.stages = []
+        self._stage_started = self.started
+
+    def expired(self):
+        return time.perf_counter() >= self.deadline
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.stages.append((name, (now - self._stage_started) * 1000))
+        self._stage_started = now
+
+    def header(self):
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in self.stages)
 
 @router.post("/ai-search", response_model=List[UserSearchResult])
 async def ai_search_people(
     search_request: UserSearchRequest,
+    request: Request,
+    response: Response,
+    fields: str = None,  # Comma-separated subset of the response fields, or "card"
+    admission: Admission = Depends(admission_controllers["ai_search"]),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    ml_engine: CompatibilityEngine = Depends(get_compatibility_engine)
 ):
     """
-    AI-powered search for people based on natural language queries
+    AI-powered search for people based on natural language queries.
+
+    Ranking has two stages: candidates matching the parsed criteria are
+    scored by text relevance, then the best AI_SEARCH_RERANK_DEPTH are
+    rescored by blending in their compatibility with the searcher. The
+    next page is requested with the X-Next-Cursor header's value as the
+    body's cursor.
     """
+    fields = parse_fields(fields, SEARCH_RESULT_FIELDS, always=("user_id",))
     if not current_user.profile:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Complete your profile first to use AI search"
         )
     
+    timer = StageTimer(AI_SEARCH_BUDGET_MS)
     query = search_request.query.lower()
-    limit = search_request.limit
+    limit = page_size(search_request.limit)
+    after = decode_ranking_cursor(search_request.cursor) if search_request.cursor else None
     
     # Parse the query to extract search criteria
-    search_criteria = parse_ai_query(query)
+    parser = fresh_query_parser() or await run_in_threadpool(get_query_parser, db)
+    search_criteria = parser.parse(query)
+    timer.lap("parse")
+    if search_criteria.radius_km is not None and radius_center(
+        [(name, get_gazetteer().resolve(name)) for name in search_criteria.cities], current_user.profile
+    ) is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unknown location for a radius search"
+        )
+    
+    passes = 0
     
+    def rank(depth):
+        nonlocal passes
+        if passes and timer.expired():
+            # No deeper retrieval over budget; cached_ranking keeps the last pass
+            logger.info("ai-search over budget; serving a partial ranking")
+            return [], False
+        passes += 1
+        ranking, complete = retrieve_candidates(db, current_user.profile, query, search_criteria, depth * 2)
+        timer.lap("retrieve")
+        if timer.expired():
+            logger.info("ai-search over budget after retrieval; skipping rescoring")
+            return ranking, False
+        ranking = rerank_by_compatibility(ml_engine, current_user.profile, ranking)
+        timer.lap("rerank")
+        return ranking, complete
+    
+    # Rephrasings with the same criteria and words share one cached ranking
+    cache_key = (
+        "ai-search", current_user.id,
+        search_criteria._replace(text=" ".join(sorted(set(query.split()))))
+    )
+    ranking = await admission.run(
+        cache_key, cached_ranking, cache_key, limit, rank, after,
+        cached=lambda: cached_ranking_hit(cache_key, limit, after)
+    )
+    page, last = ranking_page(ranking, limit, after)
+    if last is not None:
+        response.headers[NEXT_CURSOR_HEADER] = ranking_cursor(last)
+    
+    # Interests and skills are not part of the results
+    page = load_page(db, page, user_load_options(fields or SEARCH_RESULT_FIELDS))
+    results = [search_result_row(user, fields or SEARCH_RESULT_FIELDS) for user, _ in page]
+    timer.lap("page")
+    response.headers["Server-Timing"] = timer.header()
+    return with_headers(projected_response(request, results, fields), response)
+
+def retrieve_candidates(db: Session, current_profile: Profile, query: str, criteria: ParsedQuery, pool: int):
+    """
+    Stage 1: up to `pool` profiles matching the criteria, scored by text
+    relevance. The database ranks the matching profiles by relevance_sql
+    before the pool limit, so the pool holds the best text matches; they
+    are then rescored exactly. Returns ([(user_id, relevance)] best first,
+    complete), where complete is False if the pool cut the scan short.
+    """
     # Get all users with profiles
     users_query = db.query(User).join(Profile).filter(
-        User.id != current_user.id,
+        User.id != current_profile.user_id,
         Profile.is_profile_complete == True
+    ).options(
+        selectinload(User.profile), selectinload(User.interests), selectinload(User.skills)
     )
     
     # Apply filters based on parsed criteria
-    if search_criteria.get('city'):
-        users_query = users_query.filter(Profile.city.ilike(f"%{search_criteria['city']}%"))
-    
-    if search_criteria.get('min_age'):
-        users_query = users_query.filter(Profile.age >= search_criteria['min_age'])
+    gazetteer = get_gazetteer()
+    places = [(name, gazetteer.resolve(name)) for name in criteria.cities]
+    center = radius_center(places, current_profile) if criteria.radius_km is not None else None
+    if center is not None:
+        users_query = users_query.filter(
+            *within_radius(Profile.latitude, Profile.longitude, center[0], center[1], criteria.radius_km)
+        )
+    elif places:
+        # Geocoded cities by indexed id, anything else by name
+        city_ids = [city.id for _, city in places if city is not None]
+        names = [name for name, city in places if city is None]
+        conditions = []
+        if city_ids:
+            conditions.append(Profile.city_id.in_(city_ids))
+        if names:
+            conditions.append(func.lower(Profile.city).in_(names))
+        users_query = users_query.filter(or_(*conditions))
     
-    if search_criteria.get('max_age'):
-        users_query = users_query.filter(Profile.age <= search_criteria['max_age'])
+    if criteria.min_age is not None:
+        users_query = users_query.filter(Profile.age >= criteria.min_age)
     
-    users = users_query.limit(limit * 2).all()  # Get more to filter by interests/skills
+    if criteria.max_age is not None:
+        users_query = users_query.filter(Profile.age <= criteria.max_age)
     
-    results = []
+    city_ids = query_city_ids(criteria)
+    relevance = relevance_sql(query, criteria, city_ids)
+    users = users_query.filter(relevance > 0.1).order_by(relevance.desc(), User.id).limit(pool).all()
+    complete = len(users) < pool
+    if center is not None:
+        # Trim the corners of the radius's box
+        users = [user for user in users if is_within(
+            center[0], center[1], criteria.radius_km, user.profile.latitude, user.profile.longitude
+        )]
     
+    ranking = []
     for user in users:
         if not user.profile:
             continue
         
         # Calculate AI relevance score
-        relevance_score = calculate_ai_relevance(
-            query, user.profile, search_criteria, current_user.profile
-        )
+        relevance_score = calculate_ai_relevance(query, user.profile, criteria, city_ids)
         
         # Only include users with reasonable relevance
         if relevance_score > 0.1:
-            result = UserSearchResult(
-                user_id=user.id,
-                first_name=user.profile.first_name,
-                last_name=user.profile.last_name,
-                age=user.profile.age,
-                city=user.profile.city,
-                bio=user.profile.bio,
-                profile_picture=user.profile.profile_picture
-            )
-            results.append((result, relevance_score))
-    
-    # Sort by relevance score and return top results
-    results.sort(key=lambda x: x[1], reverse=True)
-    return [result[0] for result in results[:limit]]
-
-def parse_ai_query(query: str) -> dict:
+            ranking.append((user.id, relevance_score))
+    
+    # Sort by relevance score
+    ranking.sort(key=lambda x: x[1], reverse=True)
+    return ranking, complete
+
+def radius_center(places, current_profile: Profile):
+    """
+    Center of "within N km [of <city>]": the first known city, else the
+    searcher's own location; None if neither is known
+    """
+    city = next((city for _, city in places if city is not None), None)
+    if city is not None:
+        return city.latitude, city.longitude
+    if current_profile.latitude is not None and current_profile.longitude is not None:
+        return current_profile.latitude, current_profile.longitude
+    return None
+
+def rerank_by_compatibility(ml_engine: CompatibilityEngine, current_profile: Profile, ranking):
     """
-    Parse natural language query to extract search criteria
+    Stage 2: blend compatibility with the searcher into the scores of the
+    top AI_SEARCH_RERANK_DEPTH candidates, scored in one batch against the
+    engine's feature store. Candidates below the cut follow in text order
+    (scaled like the rest, so they stay below every rescored one). Without
+    engine state the ranking is returned unchanged.
     """
-    criteria = {}
-    
-    # Extract city
-    city_keywords = ['in', 'from', 'city', 'location']
-    words = query.split()
-    for i, word in enumerate(words):
-        if word.lower() in city_keywords and i + 1 < len(words):
-            criteria['city'] = words[i + 1].strip('.,!?')
-            break
-    
-    # Extract age range
-    age_keywords = ['age', 'years old', 'old']
-    for i, word in enumerate(words):
-        if word.lower() in age_keywords:
-            # Look for numbers around this keyword
-            for j in range(max(0, i-2), min(len(words), i+3)):
-                if words[j].isdigit():
-                    age = int(words[j])
-                    if age < 18:
-                        criteria['min_age'] = age
-                    elif age > 65:
-                        criteria['max_age'] = age
-                    else:
-                        criteria['min_age'] = age - 5
-                        criteria['max_age'] = age + 5
-                    break
-    
-    # Extract interests/skills from common keywords
-    interest_keywords = {
-        'music': ['music', 'musician', 'singer', 'guitar', 'piano'],
-        'sports': ['sports', 'football', 'basketball', 'tennis', 'running'],
-        'art': ['art', 'painting', 'drawing', 'design', 'creative'],
-        'technology': ['tech', 'programming', 'coding', 'developer', 'software'],
-        'business': ['business', 'entrepreneur', 'startup', 'marketing'],
-        'education': ['teacher', 'student', 'education', 'learning'],
-        'fitness': ['fitness', 'gym', 'workout', 'yoga', 'exercise']
-    }
-    
-    detected_interests = []
-    for interest, keywords in interest_keywords.items():
-        if any(keyword in query.lower() for keyword in keywords):
-            detected_interests.append(interest)
-    
-    if detected_interests:
-        criteria['interests'] = detected_interests
-    
-    return criteria
-
-def calculate_ai_relevance(query: str, profile: Profile, criteria: dict, current_profile: Profile) -> float:
+    state = ml_engine.state
+    weight = AI_SEARCH_COMPATIBILITY_WEIGHT
+    if state is None or not ranking or weight <= 0:
+        return ranking
+    
+    head, tail = ranking[:AI_SEARCH_RERANK_DEPTH], ranking[AI_SEARCH_RERANK_DEPTH:]
+    user_ids, scores = ml_engine.score_all(state, current_profile, [user_id for user_id, _ in head])
+    compatibility = dict(zip(user_ids.tolist(), scores.tolist()))
+    
+    rescored = [
+        (user_id, (1 - weight) * relevance + weight * compatibility.get(user_id, 0.0))
+        for user_id, relevance in head
+    ]
+    rescored.sort(key=lambda x: x[1], reverse=True)
+    return rescored + [(user_id, (1 - weight) * relevance) for user_id, relevance in tail]
+
+def _matching_count(association, model, terms):
+    """Correlated count of the user's interests / skills named in `terms`"""
+    return select(func.count()).select_from(association.join(model)).where(
+        association.c.user_id == User.id, func.lower(model.name).in_(terms)
+    ).scalar_subquery()
+
+def query_city_ids(criteria: ParsedQuery):
+    """Gazetteer ids of the query's cities"""
+    gazetteer = get_gazetteer()
+    return [city.id for city in map(gazetteer.resolve, criteria.cities) if city is not None]
+
+def relevance_sql(query: str, criteria: ParsedQuery, city_ids=None):
     """
-    Calculate relevance score for AI search results
+    calculate_ai_relevance as a SQL expression on User / Profile, for
+    ordering candidates before they are loaded (bio words are matched
+    between spaces, newlines and tabs; close to str.split())
     """
+    if city_ids is None:
+        city_ids = query_city_ids(criteria)
+    score = literal(0.0)
+    query_words = set(query.lower().split())
+    if query_words:
+        padded = " " + func.replace(func.replace(func.lower(func.coalesce(Profile.bio, "")), "\n", " "), "\t", " ") + " "
+        common = sum(case((padded.contains(f" {word} ", autoescape=True), 1), else_=0) for word in query_words)
+        bio_score = common * (1.0 / len(query_words))
+        score = score + case((bio_score > 0.4, 0.4), else_=bio_score)
+    if criteria.interests:
+        score = score + _matching_count(user_interests, Interest, criteria.interests) * (0.3 / len(criteria.interests))
+    skill_terms = criteria.skills or criteria.interests
+    if skill_terms:
+        score = score + _matching_count(user_skills, Skill, skill_terms) * (0.2 / len(skill_terms))
+    if city_ids:
+        score = score + case((Profile.city_id.in_(city_ids), 0.1), else_=0.0)
+    return score
+
+def calculate_ai_relevance(query: str, profile: Profile, criteria: ParsedQuery, city_ids=None) -> float:
+    """
+    Text / criteria relevance of a profile to a query (stage 1 score; the
+    searcher's compatibility is blended in by rerank_by_compatibility).
+    `city_ids` are query_city_ids(criteria), looked up here if None.
+    """
+    if city_ids is None:
+        city_ids = query_city_ids(criteria)
     score = 0.0
     
     # Bio relevance (40% weight)
@@ -144,22 +290,23 @@ def calculate_ai_relevance(query: str, profile: Profile, criteria: dict, current
             score += min(0.4, common_words / len(query_words))
     
     # Interest matching (30% weight)
-    if criteria.get('interests'):
+    if criteria.interests:
         profile_interests = [interest.name.lower() for interest in profile.interests]
-        for interest in criteria['interests']:
-            if interest.lower() in profile_interests:
-                score += 0.3 / len(criteria['interests'])
+        for interest in criteria.interests:
+            if interest in profile_interests:
+                score += 0.3 / len(criteria.interests)
     
-    # Skill matching (20% weight)
-    if criteria.get('interests'):
+    # Skill matching (20% weight); without named skills, interest terms are
+    # matched against skills too
+    skill_terms = criteria.skills or criteria.interests
+    if skill_terms:
         profile_skills = [skill.name.lower() for skill in profile.skills]
-        for interest in criteria['interests']:
-            if interest.lower() in profile_skills:
-                score += 0.2 / len(criteria['interests'])
-    
-    # Location matching (10% weight)
-    if criteria.get('city') and profile.city:
-        if criteria['city'].lower() in profile.city.lower():
-            score += 0.1
+        for skill in skill_terms:
+            if skill in profile_skills:
+                score += 0.2 / len(skill_terms)
+    
+    # Location matching (10% weight), by geocoded city so aliases match
+    if profile.city_id is not None and profile.city_id in city_ids:
+        score += 0.1
     
     return min(1.0, score)
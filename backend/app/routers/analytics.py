@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
-from app.database import get_db
+from app.database import get_read_db
 from app.models import User, Profile, Match, Interest, Skill
 from app.schemas import UserAnalytics, PlatformAnalytics
 from app.auth import get_current_user
@@ -11,7 +11,7 @@ router = APIRouter()
 @router.get("/user", response_model=UserAnalytics)
 async def get_user_analytics(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Get analytics for the current user
@@ -78,7 +78,7 @@ async def get_user_analytics(
     )
 
 @router.get("/platform", response_model=PlatformAnalytics)
-async def get_platform_analytics(db: Session = Depends(get_db)):
+async def get_platform_analytics(db: Session = Depends(get_read_db)):
     """
     Get platform-wide analytics
     """
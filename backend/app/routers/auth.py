@@ -5,7 +5,7 @@ from pydantic import BaseModel
 from app.database import get_db
 from app.models import User
 from app.schemas import UserCreate, User as UserSchema
-from app.auth import verify_password, get_password_hash, create_access_token, get_current_user
+from app.auth import hash_password_async, verify_password_async, create_access_token, get_current_user
 
 class LoginRequest(BaseModel):
     email: str
@@ -17,15 +17,17 @@ router = APIRouter()
 async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     try:
         # Check if user already exists
-        existing_user = db.query(User).filter(User.email == user_data.email).first()
+        existing_user = db.query(User.id).filter(User.email == user_data.email).first()
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already registered"
             )
+        # Don't hold a pooled connection while waiting for the hashing threads
+        db.rollback()
         
         # Create new user
-        hashed_password = get_password_hash(user_data.password)
+        hashed_password = await hash_password_async(user_data.password)
         db_user = User(
             email=user_data.email,
             hashed_password=hashed_password,
@@ -60,8 +62,15 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
 @router.post("/login", response_model=dict)
 async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
     try:
-        user = db.query(User).filter(User.email == login_data.email).first()
-        if not user:
+        user = db.query(User.id, User.is_active, User.hashed_password).filter(
+            User.email == login_data.email
+        ).first()
+        # Don't hold a pooled connection while waiting for the hashing threads
+        db.rollback()
+        valid, new_hash = await verify_password_async(
+            login_data.password, user.hashed_password if user else None
+        )
+        if not valid:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect email or password"
@@ -73,11 +82,14 @@ async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
                 detail="Account is deactivated"
             )
         
-        if not verify_password(login_data.password, user.hashed_password):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect email or password"
-            )
+        if new_hash:
+            # Legacy or outdated-cost hash: store the current one. A plain UPDATE
+            # (no ORM change) so it does not count as a profile write, and only
+            # if the password was not changed meanwhile.
+            db.query(User).filter(
+                User.id == user.id, User.hashed_password == user.hashed_password
+            ).update({User.hashed_password: new_hash}, synchronize_session=False)
+            db.commit()
         
         access_token_expires = timedelta(minutes=30)
         access_token = create_access_token(
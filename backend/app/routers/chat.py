@@ -1,18 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func
 from typing import List
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import User, Message, Profile
 from app.schemas import MessageCreate, Message as MessageSchema, Chat
-from app.auth import get_current_user
+from app.auth import get_current_principal, UserPrincipal
+from app.fast_json import list_response, row_dicts, with_headers
+from app.pagination import paginate, set_page_headers
 
 router = APIRouter()
 
 @router.post("/send", response_model=MessageSchema)
 async def send_message(
     message_data: MessageCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """
@@ -53,15 +55,20 @@ async def send_message(
 
 @router.get("/conversations", response_model=List[Chat])
 async def get_conversations(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    cursor: str = None,
+    limit: int = None,
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: Session = Depends(get_read_db)
 ):
     """
-    Get all conversations for the current user
+    Get the conversations of the current user, most recent first; the next
+    page is at the X-Next-Cursor header's ?cursor=
     """
     # Get all unique users the current user has messaged with
     conversations = db.query(
-        User.id,
+        User.id.label('user_id'),
         User.email,
         Profile.first_name,
         Profile.last_name,
@@ -73,55 +80,76 @@ async def get_conversations(
         ((Message.recipient_id == current_user.id) & (Message.sender_id == User.id))
     ).filter(User.id != current_user.id).group_by(
         User.id, User.email, Profile.first_name, Profile.last_name
-    ).order_by(desc('last_message_time')).all()
+    ).subquery()
+    page, next_cursor = paginate(
+        db.query(conversations), conversations.c.user_id, cursor, limit,
+        key_column=conversations.c.last_message_time, descending=True
+    )
     
     result = []
-    for conv in conversations:
+    for conv in page:
         # Get the last message content
         last_message = db.query(Message.content).filter(
-            ((Message.sender_id == current_user.id) & (Message.recipient_id == conv.id)) |
-            ((Message.recipient_id == current_user.id) & (Message.sender_id == conv.id))
-        ).order_by(desc(Message.created_at)).first()
+            ((Message.sender_id == current_user.id) & (Message.recipient_id == conv.user_id)) |
+            ((Message.recipient_id == current_user.id) & (Message.sender_id == conv.user_id))
+        ).order_by(desc(Message.created_at), desc(Message.id)).first()
         
-        result.append(Chat(
-            user_id=conv.id,
-            first_name=conv.first_name or "Unknown",
-            last_name=conv.last_name or "User",
-            last_message=last_message[0] if last_message else None,
-            last_message_time=conv.last_message_time,
-            unread_count=conv.unread_count or 0
-        ))
+        result.append({
+            "user_id": conv.user_id,
+            "first_name": conv.first_name or "Unknown",
+            "last_name": conv.last_name or "User",
+            "last_message": last_message[0] if last_message else None,
+            "last_message_time": conv.last_message_time,
+            "unread_count": conv.unread_count or 0
+        })
     
-    return result
+    set_page_headers(request, response, next_cursor)
+    return with_headers(list_response(request, result), response)
 
 @router.get("/messages/{user_id}", response_model=List[MessageSchema])
 async def get_messages(
     user_id: int,
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    cursor: str = None,
+    limit: int = None,
+    current_user: UserPrincipal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """
-    Get messages between current user and another user
+    Get messages between current user and another user, newest first; the
+    next (older) page is at the X-Next-Cursor header's ?cursor=. Only the
+    returned messages are marked as read.
     """
-    messages = db.query(Message).filter(
+    query = db.query(
+        Message.id, Message.sender_id, Message.recipient_id,
+        Message.content, Message.created_at, Message.is_read
+    ).filter(
         ((Message.sender_id == current_user.id) & (Message.recipient_id == user_id)) |
         ((Message.sender_id == user_id) & (Message.recipient_id == current_user.id))
-    ).order_by(Message.created_at).all()
+    )
+    rows, next_cursor = paginate(query, Message.id, cursor, limit, key_column=Message.created_at, descending=True)
+    messages = row_dicts(rows)
     
-    # Mark messages as read
-    db.query(Message).filter(
-        Message.recipient_id == current_user.id,
-        Message.sender_id == user_id,
-        Message.is_read == False
-    ).update({"is_read": True})
-    db.commit()
+    # Mark the page's messages to the current user as read
+    unread_ids = {message["id"] for message in messages
+                  if message["recipient_id"] == current_user.id and not message["is_read"]}
+    if unread_ids:
+        db.query(Message).filter(Message.id.in_(unread_ids)).update(
+            {"is_read": True}, synchronize_session=False
+        )
+        db.commit()
+        for message in messages:
+            if message["id"] in unread_ids:
+                message["is_read"] = True
     
-    return messages
+    set_page_headers(request, response, next_cursor)
+    return with_headers(list_response(request, messages), response)
 
 @router.get("/unread-count")
 async def get_unread_count(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: Session = Depends(get_read_db)
 ):
     """
     Get total unread message count for current user
@@ -1,20 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from typing import List
 from app.database import get_db
-from app.models import User, Match
+from app.models import Match
 from app.schemas import Match as MatchSchema
-from app.auth import get_current_user
-from app.ml_engine import CompatibilityEngine
+from app.auth import get_current_principal, UserPrincipal
+from app.ml_engine import CompatibilityEngine, get_compatibility_engine
+from app.pagination import estimate_count, paginate, set_page_headers
 
 router = APIRouter()
-ml_engine = CompatibilityEngine()
 
 @router.post("/like/{matched_user_id}")
 async def like_user(
     matched_user_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: Session = Depends(get_db),
+    ml_engine: CompatibilityEngine = Depends(get_compatibility_engine)
 ):
     """
     Like a user (swipe right)
@@ -63,8 +64,9 @@ async def like_user(
 @router.post("/dislike/{matched_user_id}")
 async def dislike_user(
     matched_user_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: Session = Depends(get_db),
+    ml_engine: CompatibilityEngine = Depends(get_compatibility_engine)
 ):
     """
     Dislike a user (swipe left)
@@ -92,27 +94,44 @@ async def dislike_user(
     
     return {"message": "User disliked"}
 
+def match_page(request: Request, response: Response, db: Session, query, cursor, limit, total):
+    """A page of matches, newest first, with its pagination headers"""
+    matches, next_cursor = paginate(query, Match.id, cursor, limit, descending=True)
+    set_page_headers(request, response, next_cursor, estimate_count(db, query) if total else None)
+    return matches
+
 @router.get("/", response_model=List[MatchSchema])
 async def get_matches(
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    cursor: str = None,
+    limit: int = None,
+    total: bool = False,
+    current_user: UserPrincipal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """
-    Get all matches for the current user
+    Get the matches of the current user, newest first; the next page is
+    at the X-Next-Cursor header's ?cursor=
     """
-    matches = db.query(Match).filter(Match.user_id == current_user.id).all()
-    return matches
+    query = db.query(Match).filter(Match.user_id == current_user.id)
+    return match_page(request, response, db, query, cursor, limit, total)
 
 @router.get("/mutual", response_model=List[MatchSchema])
 async def get_mutual_matches(
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    cursor: str = None,
+    limit: int = None,
+    total: bool = False,
+    current_user: UserPrincipal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """
-    Get mutual matches for the current user
+    Get mutual matches for the current user, paged like get_matches
     """
-    matches = db.query(Match).filter(
+    query = db.query(Match).filter(
         Match.user_id == current_user.id,
         Match.is_mutual == True
-    ).all()
-    return matches
+    )
+    return match_page(request, response, db, query, cursor, limit, total)
@@ -1,116 +1,166 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.orm import Session, selectinload
 from typing import List
-from app.database import get_db
+from app.database import get_read_db
 from app.models import User, Profile
 from app.schemas import Recommendation
-from app.auth import get_current_user
-from app.ml_engine import CompatibilityEngine
+from app.auth import get_current_user, get_current_principal, UserPrincipal
+from app.ml_engine import CompatibilityEngine, get_compatibility_engine, common_sets, recommendation_row
+from app.geo import get_gazetteer, is_within, within_radius
+from app.result_cache import cached_ranking, cached_ranking_hit, load_page, ranking_page
+from app.pagination import decode_ranking_cursor, page_size, ranking_cursor, set_page_headers
+from app.pair_scores import fresh_scores
+from app.projection import RECOMMENDATION_FIELDS, parse_fields, projected_response, user_load_options
+from app.admission import Admission, admission_controllers
+from app.fast_json import with_headers
 
 router = APIRouter()
-ml_engine = CompatibilityEngine()
 
 @router.get("/", response_model=List[Recommendation])
 async def get_recommendations(
+    request: Request,
+    response: Response,
     limit: int = 10,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    fields: str = None,  # Comma-separated subset of the response fields, or "card"
+    admission: Admission = Depends(admission_controllers["recommendations"]),
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: Session = Depends(get_read_db),
+    ml_engine: CompatibilityEngine = Depends(get_compatibility_engine)
 ):
     """
     Get personalized recommendations for the current user
     """
-    if not current_user.profile:
+    fields = parse_fields(fields, RECOMMENDATION_FIELDS, always=("user_id",))
+    if not current_user.profile_id:
         # Return empty list if no profile exists
         return []
     
-    recommendations = ml_engine.get_recommendations(current_user.id, db, limit)
-    return recommendations
+    recommendations = await admission.run(
+        (current_user.id, limit, fields), ml_engine.get_recommendations, current_user.id, db, limit, fields
+    )
+    return with_headers(projected_response(request, recommendations, fields), response)
 
 @router.get("/search")
 async def search_users(
+    request: Request,
+    response: Response,
     city: str = None,
     min_age: int = None,
     max_age: int = None,
     interests: str = None,  # Comma-separated list
     skills: str = None,     # Comma-separated list
+    within_km: float = None,  # Radius around `city` (or your own city)
     limit: int = 10,
+    cursor: str = None,
+    fields: str = None,  # Comma-separated subset of the response fields, or "card"
+    admission: Admission = Depends(admission_controllers["search"]),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    ml_engine: CompatibilityEngine = Depends(get_compatibility_engine)
 ):
     """
-    Advanced search with filters
+    Advanced search with filters, best compatibility first; the next page
+    is at the X-Next-Cursor header's ?cursor=
     """
+    fields = parse_fields(fields, RECOMMENDATION_FIELDS, always=("user_id",))
     if not current_user.profile:
         # Return empty list if no profile exists
         return []
     
-    # Start with all users except current user
-    query = db.query(User).join(Profile).filter(User.id != current_user.id)
-    
-    # Apply filters
-    if city:
-        query = query.filter(Profile.city.ilike(f'%{city}%'))
-    
-    if min_age:
-        query = query.filter(Profile.age >= min_age)
+    limit = page_size(limit)
+    after = decode_ranking_cursor(cursor) if cursor else None
+    place = get_gazetteer().resolve(city) if city else None
+    center = None
+    if within_km is not None:
+        if place is not None:
+            center = (place.latitude, place.longitude)
+        elif not city and current_user.profile.latitude is not None:
+            center = (current_user.profile.latitude, current_user.profile.longitude)
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Unknown location for a radius search"
+            )
+    interest_list = sorted({i.strip().lower() for i in interests.split(',')}) if interests else []
+    skill_list = sorted({s.strip().lower() for s in skills.split(',')}) if skills else []
     
-    if max_age:
-        query = query.filter(Profile.age <= max_age)
-    
-    # Get filtered users
-    filtered_users = query.all()
-    
-    # Get recommendations for filtered users
-    recommendations = []
-    for user in filtered_users:
-        if not user.profile:
-            continue
-        
-        # Calculate compatibility
-        compatibility_score = ml_engine.calculate_compatibility(
-            current_user.profile, user.profile
+    def rank(depth):
+        # Start with all users except current user
+        query = db.query(User).join(Profile).filter(User.id != current_user.id).options(
+            selectinload(User.profile), selectinload(User.interests), selectinload(User.skills)
         )
         
-        # Get common interests and skills
-        current_interests = set([interest.name for interest in current_user.profile.interests])
-        other_interests = set([interest.name for interest in user.profile.interests])
-        common_interests = list(current_interests.intersection(other_interests))
+        # Apply filters: a radius probes the lat/lon index, a known city its id
+        if center is not None:
+            query = query.filter(*within_radius(Profile.latitude, Profile.longitude, center[0], center[1], within_km))
+        elif place is not None:
+            query = query.filter(Profile.city_id == place.id)
+        elif city:
+            query = query.filter(Profile.city.ilike(f'%{city}%'))
         
-        current_skills = set([skill.name for skill in current_user.profile.skills])
-        other_skills = set([skill.name for skill in user.profile.skills])
-        common_skills = list(current_skills.intersection(other_skills))
+        if min_age:
+            query = query.filter(Profile.age >= min_age)
         
-        # Apply interest filter if specified
-        if interests:
-            interest_list = [i.strip().lower() for i in interests.split(',')]
-            user_interests = [i.name.lower() for i in user.interests]
-            # Check if user has any of the requested interests
-            if not any(interest in user_interests for interest in interest_list):
-                continue
+        if max_age:
+            query = query.filter(Profile.age <= max_age)
         
-        # Apply skill filter if specified
-        if skills:
-            skill_list = [s.strip().lower() for s in skills.split(',')]
-            user_skills = [s.name.lower() for s in user.skills]
-            # Check if user has any of the requested skills
-            if not any(skill in user_skills for skill in skill_list):
-                continue
+        # Get filtered users (trimming the corners of a radius's box)
+        filtered_users = query.all()
+        if center is not None:
+            filtered_users = [user for user in filtered_users if is_within(
+                center[0], center[1], within_km, user.profile.latitude, user.profile.longitude
+            )]
+        state = ml_engine.state
+        stored = fresh_scores(db, current_user.id, [user.id for user in filtered_users])
         
-        recommendation = Recommendation(
-            user_id=user.id,
-            first_name=user.profile.first_name,
-            last_name=user.profile.last_name,
-            age=user.profile.age,
-            city=user.profile.city,
-            bio=user.profile.bio,
-            profile_picture=user.profile.profile_picture,
-            compatibility_score=compatibility_score,
-            common_interests=common_interests,
-            common_skills=common_skills
-        )
+        ranking = []
+        for user in filtered_users:
+            if not user.profile:
+                continue
+            
+            # Apply interest filter if specified
+            if interest_list:
+                user_interests = [i.name.lower() for i in user.interests]
+                # Check if user has any of the requested interests
+                if not any(interest in user_interests for interest in interest_list):
+                    continue
+            
+            # Apply skill filter if specified
+            if skill_list:
+                user_skills = [s.name.lower() for s in user.skills]
+                # Check if user has any of the requested skills
+                if not any(skill in user_skills for skill in skill_list):
+                    continue
+            
+            # Stored compatibility if up to date, else calculate it
+            compatibility_score = stored.get(user.id)
+            if compatibility_score is None:
+                compatibility_score = ml_engine.calculate_compatibility(
+                    current_user.profile, user.profile, state
+                )
+            ranking.append((user.id, compatibility_score))
         
-        recommendations.append(recommendation)
+        # cached_ranking puts it in score order
+        return ranking, True
+    
+    cache_key = (
+        "recommendations-search", current_user.id,
+        city.lower() if city else None, within_km, min_age or None, max_age or None,
+        tuple(interest_list), tuple(skill_list)
+    )
+    ranking = await admission.run(
+        cache_key, cached_ranking, cache_key, limit, rank, after,
+        cached=lambda: cached_ranking_hit(cache_key, limit, after)
+    )
+    page, last = ranking_page(ranking, limit, after)
+    set_page_headers(request, response, ranking_cursor(last) if last else None)
+    
+    # Common interests and skills are only worked out for the page shown
+    current_interests, current_skills = common_sets(current_user.profile, fields)
+    
+    recommendations = [
+        recommendation_row(user, compatibility_score, current_interests, current_skills, fields)
+        for user, compatibility_score in load_page(db, page, user_load_options(fields))
+    ]
     
-    # Sort by compatibility score
-    recommendations.sort(key=lambda x: x.compatibility_score, reverse=True)
-    return recommendations[:limit]
+    return with_headers(projected_response(request, recommendations, fields), response)
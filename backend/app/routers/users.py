@@ -1,22 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, UploadFile, File
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_, func
+from sqlalchemy import or_, and_
 from typing import List
-import os
-import shutil
-from app.database import get_db
-from app.models import User, Profile, Interest, Skill
+from app.database import get_db, get_read_db
+from app.models import User, Profile, Interest, Skill, user_interests, user_skills
 from app.schemas import (
     ProfileCreate, ProfileUpdate, Profile as ProfileSchema, 
     InterestCreate, SkillCreate, InterestSchema, SkillSchema,
-    CustomInterestCreate, CustomSkillCreate, UserSearchResult
+    CustomInterestCreate, CustomSkillCreate, UserSearchResult,
+    UserBatchRequest, ProfileDetails
+)
+from app.auth import get_current_user, get_current_principal, UserPrincipal
+from app.avatars import process_avatar_upload, thumbnail_url, DEFAULT_VARIANT
+from app.ml_engine import CompatibilityEngine, get_compatibility_engine
+from app.change_feed import record_change
+from app.fast_json import FastJSONResponse, list_response, row_dicts, with_headers
+from app.projection import (
+    SEARCH_RESULT_FIELDS, PROFILE_FIELDS, USER_DETAIL_FIELDS, PROFILE_DETAIL_FIELDS,
+    parse_fields, profile_columns, projected_response
 )
-from app.auth import get_current_user
+from app.result_cache import profile_cache
+from app.pagination import estimate_count, paginate, set_page_headers
 
 router = APIRouter()
 
+# Most users POST /api/users/batch accepts at once
+USER_BATCH_MAX_IDS = int(os.getenv("USER_BATCH_MAX_IDS", "500"))
+
 @router.get("/profile", response_model=ProfileSchema)
-async def get_profile(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_profile(current_user: UserPrincipal = Depends(get_current_principal), db: Session = Depends(get_read_db)):
     from app.models import Profile as ProfileModel
     profile = db.query(ProfileModel).filter(ProfileModel.user_id == current_user.id).first()
     if not profile:
@@ -30,8 +43,9 @@ async def get_profile(current_user: User = Depends(get_current_user), db: Sessio
 @router.post("/profile", response_model=ProfileSchema)
 async def create_profile(
     profile_data: ProfileCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: Session = Depends(get_db),
+    ml_engine: CompatibilityEngine = Depends(get_compatibility_engine)
 ):
     # Check if profile already exists
     existing_profile = db.query(Profile).filter(Profile.user_id == current_user.id).first()
@@ -46,15 +60,18 @@ async def create_profile(
         **profile_data.dict()
     )
     db.add(profile)
+    record_change(db, current_user.id, profile_data.dict())
     db.commit()
     db.refresh(profile)
+    ml_engine.refresh_profile(db, current_user.id)
     return profile
 
 @router.put("/profile", response_model=ProfileSchema)
 async def update_profile(
     profile_data: ProfileUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: Session = Depends(get_db),
+    ml_engine: CompatibilityEngine = Depends(get_compatibility_engine)
 ):
     profile = db.query(Profile).filter(Profile.user_id == current_user.id).first()
     if not profile:
@@ -63,17 +80,33 @@ async def update_profile(
             detail="Profile not found"
         )
     
-    for field, value in profile_data.dict(exclude_unset=True).items():
+    changes = profile_data.dict(exclude_unset=True)
+    for field, value in changes.items():
         setattr(profile, field, value)
     
+    record_change(db, current_user.id, changes)
     db.commit()
     db.refresh(profile)
+    ml_engine.refresh_profile(db, current_user.id)
     return profile
 
+def vocabulary_page(request: Request, response: Response, db: Session, model, cursor, limit, total):
+    """A page of interests or skills in name order (names are unique), with its pagination headers"""
+    query = db.query(model.id, model.name, model.category, model.created_at)
+    rows, next_cursor = paginate(query, model.name, cursor, limit)
+    set_page_headers(request, response, next_cursor, estimate_count(db, query) if total else None)
+    return with_headers(list_response(request, row_dicts(rows)), response)
+
 @router.get("/interests", response_model=List[InterestSchema])
-async def get_interests(db: Session = Depends(get_db)):
-    interests = db.query(Interest).all()
-    return [InterestSchema(id=i.id, name=i.name, category=i.category, created_at=i.created_at) for i in interests]
+async def get_interests(
+    request: Request,
+    response: Response,
+    cursor: str = None,
+    limit: int = None,
+    total: bool = False,
+    db: Session = Depends(get_read_db)
+):
+    return vocabulary_page(request, response, db, Interest, cursor, limit, total)
 
 @router.post("/interests", response_model=InterestSchema)
 async def create_interest(
@@ -87,9 +120,15 @@ async def create_interest(
     return InterestSchema(id=interest.id, name=interest.name, category=interest.category, created_at=interest.created_at)
 
 @router.get("/skills", response_model=List[SkillSchema])
-async def get_skills(db: Session = Depends(get_db)):
-    skills = db.query(Skill).all()
-    return [SkillSchema(id=s.id, name=s.name, category=s.category, created_at=s.created_at) for s in skills]
+async def get_skills(
+    request: Request,
+    response: Response,
+    cursor: str = None,
+    limit: int = None,
+    total: bool = False,
+    db: Session = Depends(get_read_db)
+):
+    return vocabulary_page(request, response, db, Skill, cursor, limit, total)
 
 @router.post("/skills", response_model=SkillSchema)
 async def create_skill(
@@ -106,7 +145,8 @@ async def create_skill(
 async def add_interest_to_profile(
     interest_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    ml_engine: CompatibilityEngine = Depends(get_compatibility_engine)
 ):
     profile = db.query(Profile).filter(Profile.user_id == current_user.id).first()
     if not profile:
@@ -124,7 +164,9 @@ async def add_interest_to_profile(
     
     if interest not in current_user.interests:
         current_user.interests.append(interest)
+        record_change(db, current_user.id, ["interests"])
         db.commit()
+        ml_engine.refresh_profile(db, current_user.id)
     
     return {"message": "Interest added successfully"}
 
@@ -132,7 +174,8 @@ async def add_interest_to_profile(
 async def add_skill_to_profile(
     skill_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    ml_engine: CompatibilityEngine = Depends(get_compatibility_engine)
 ):
     profile = db.query(Profile).filter(Profile.user_id == current_user.id).first()
     if not profile:
@@ -150,7 +193,9 @@ async def add_skill_to_profile(
     
     if skill not in current_user.skills:
         current_user.skills.append(skill)
+        record_change(db, current_user.id, ["skills"])
         db.commit()
+        ml_engine.refresh_profile(db, current_user.id)
     
     return {"message": "Skill added successfully"}
 
@@ -159,7 +204,8 @@ async def add_skill_to_profile(
 async def add_custom_interest(
     interest_data: CustomInterestCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    ml_engine: CompatibilityEngine = Depends(get_compatibility_engine)
 ):
     """
     Add a custom interest to the user's profile
@@ -185,7 +231,9 @@ async def add_custom_interest(
     # Add to user's interests if not already added
     if interest not in current_user.interests:
         current_user.interests.append(interest)
+        record_change(db, current_user.id, ["interests"])
         db.commit()
+        ml_engine.refresh_profile(db, current_user.id)
     
     return InterestSchema(id=interest.id, name=interest.name, category=interest.category, created_at=interest.created_at)
 
@@ -193,7 +241,8 @@ async def add_custom_interest(
 async def add_custom_skill(
     skill_data: CustomSkillCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    ml_engine: CompatibilityEngine = Depends(get_compatibility_engine)
 ):
     """
     Add a custom skill to the user's profile
@@ -219,7 +268,9 @@ async def add_custom_skill(
     # Add to user's skills if not already added
     if skill not in current_user.skills:
         current_user.skills.append(skill)
+        record_change(db, current_user.id, ["skills"])
         db.commit()
+        ml_engine.refresh_profile(db, current_user.id)
     
     return SkillSchema(id=skill.id, name=skill.name, category=skill.category, created_at=skill.created_at)
 
@@ -227,7 +278,8 @@ async def add_custom_skill(
 async def remove_interest_from_profile(
     interest_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    ml_engine: CompatibilityEngine = Depends(get_compatibility_engine)
 ):
     """
     Remove an interest from the user's profile
@@ -241,7 +293,9 @@ async def remove_interest_from_profile(
     
     if interest in current_user.interests:
         current_user.interests.remove(interest)
+        record_change(db, current_user.id, ["interests"])
         db.commit()
+        ml_engine.refresh_profile(db, current_user.id)
     
     return {"message": "Interest removed successfully"}
 
@@ -249,7 +303,8 @@ async def remove_interest_from_profile(
 async def remove_skill_from_profile(
     skill_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    ml_engine: CompatibilityEngine = Depends(get_compatibility_engine)
 ):
     """
     Remove a skill from the user's profile
@@ -263,7 +318,9 @@ async def remove_skill_from_profile(
     
     if skill in current_user.skills:
         current_user.skills.remove(skill)
+        record_change(db, current_user.id, ["skills"])
         db.commit()
+        ml_engine.refresh_profile(db, current_user.id)
     
     return {"message": "Skill removed successfully"}
 
@@ -271,7 +328,7 @@ async def remove_skill_from_profile(
 @router.post("/profile/avatar")
 async def upload_avatar(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """
@@ -284,113 +341,166 @@ async def upload_avatar(
             detail="Profile not found"
         )
     
-    # Validate file type
-    allowed_extensions = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp', 'svg'}
-    file_extension = file.filename.split(".")[-1].lower() if "." in file.filename else ""
-    
-    if file_extension not in allowed_extensions:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File type not allowed. Allowed types: {', '.join(allowed_extensions)}"
-        )
-    
-    # Create uploads directory if it doesn't exist
-    upload_dir = "uploads/avatars"
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    # Generate unique filename
-    filename = f"user_{current_user.id}_avatar.{file_extension}"
-    file_path = os.path.join(upload_dir, filename)
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    urls = await process_avatar_upload(file, current_user.id)
     
     # Update profile with avatar path
-    profile.profile_picture = f"/uploads/avatars/{filename}"
+    profile.profile_picture = urls[DEFAULT_VARIANT]
+    record_change(db, current_user.id, ["profile_picture"])
     db.commit()
     
-    return {"message": "Avatar uploaded successfully", "avatar_url": profile.profile_picture}
+    return {
+        "message": "Avatar uploaded successfully",
+        "avatar_url": profile.profile_picture,
+        "thumbnail_url": urls["sm"]
+    }
 
 # User search endpoint
 @router.get("/search", response_model=List[UserSearchResult])
 async def search_users(
     query: str,
+    request: Request,
+    response: Response,
+    cursor: str = None,
     limit: int = 10,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    total: bool = False,
+    fields: str = None,  # Comma-separated subset of the response fields, or "card"
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: Session = Depends(get_read_db)
 ):
     """
-    Search users by name
+    Search users by name, in user id order; the next page is at the
+    X-Next-Cursor header's ?cursor=
     """
+    fields = parse_fields(fields, SEARCH_RESULT_FIELDS, always=("user_id",))
     if not query or len(query.strip()) < 2:
         return []
     
     # Search in profiles by first name, last name, or full name
     search_term = f"%{query.strip()}%"
     
-    users = db.query(User).join(Profile).filter(
-        User.id != current_user.id,
+    # Only the columns of the requested fields are read
+    matching = db.query(Profile.user_id, *profile_columns(fields or SEARCH_RESULT_FIELDS)).filter(
+        Profile.user_id != current_user.id,
         or_(
             Profile.first_name.ilike(search_term),
             Profile.last_name.ilike(search_term),
-            func.concat(Profile.first_name, ' ', Profile.last_name).ilike(search_term)
+            (Profile.first_name + ' ' + Profile.last_name).ilike(search_term)
         )
-    ).limit(limit).all()
+    )
+    rows, next_cursor = paginate(matching, Profile.user_id, cursor, limit)
+    set_page_headers(request, response, next_cursor, estimate_count(db, matching) if total else None)
     
-    results = []
-    for user in users:
-        if user.profile:
-            results.append(UserSearchResult(
-                user_id=user.id,
-                first_name=user.profile.first_name,
-                last_name=user.profile.last_name,
-                age=user.profile.age,
-                city=user.profile.city,
-                bio=user.profile.bio,
-                profile_picture=user.profile.profile_picture
-            ))
+    results = row_dicts(rows)
+    for result in results:
+        if "profile_picture" in result:
+            result["profile_picture"] = thumbnail_url(result["profile_picture"])
     
-    return results
+    return with_headers(projected_response(request, results, fields), response)
 
 # Get user profile by ID (for viewing other users' profiles)
 @router.get("/profile/{user_id}", response_model=ProfileSchema)
 async def get_user_profile(
     user_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    fields: str = None,  # Comma-separated subset of the response fields, or "card"
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: Session = Depends(get_read_db)
 ):
     """
     Get another user's profile by ID
     """
-    profile = db.query(Profile).filter(Profile.user_id == user_id).first()
+    fields = parse_fields(fields, PROFILE_FIELDS, always=("user_id",))
+    query = db.query(Profile) if fields is None else db.query(*[getattr(Profile, name) for name in fields])
+    profile = query.filter(Profile.user_id == user_id).first()
     if not profile:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User profile not found"
         )
     
+    if fields is not None:
+        return FastJSONResponse(profile._asdict(), request)
     return profile
 
+def load_profile_details(db: Session, user_ids) -> dict:
+    """
+    {user_id: schemas.ProfileDetails as a dict} for those of `user_ids`
+    with a profile, in three queries whatever their number
+    """
+    rows = db.query(*profile_columns(None)).filter(Profile.user_id.in_(user_ids)).all()
+    details = {row.user_id: {**row._asdict(), "interests": [], "skills": []} for row in rows}
+    if not details:
+        return details
+    for name, model, link, link_column in (
+        ("interests", Interest, user_interests, user_interests.c.interest_id),
+        ("skills", Skill, user_skills, user_skills.c.skill_id),
+    ):
+        tags = db.query(link.c.user_id, model.id, model.name, model.category).join(
+            model, model.id == link_column
+        ).filter(link.c.user_id.in_(list(details))).order_by(link.c.user_id, model.name).all()
+        for tag in tags:
+            details[tag.user_id][name].append({"id": tag.id, "name": tag.name, "category": tag.category})
+    return details
+
+@router.post("/batch", response_model=List[ProfileDetails])
+async def get_profiles_batch(
+    batch: UserBatchRequest,
+    request: Request,
+    fields: str = None,  # Comma-separated subset of the response fields, or "card"
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Profiles with interests and skills for many users at once, in the order
+    asked for (users without a profile are left out). Replaces a profile
+    and a details request per list card.
+    """
+    fields = parse_fields(fields, PROFILE_DETAIL_FIELDS, always=("user_id",))
+    user_ids = list(dict.fromkeys(batch.user_ids))
+    if len(user_ids) > USER_BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {USER_BATCH_MAX_IDS} user ids per batch"
+        )
+    
+    # Full rows are cached so every projection is served from the same entries
+    details = profile_cache.get_many(user_ids)
+    missing = [user_id for user_id in user_ids if user_id not in details]
+    if missing:
+        loaded = load_profile_details(db, missing)
+        profile_cache.set_many(loaded)
+        details.update(loaded)
+    
+    results = [details[user_id] for user_id in user_ids if user_id in details]
+    if fields is not None:
+        results = [{name: result[name] for name in fields} for result in results]
+    return projected_response(request, results, fields)
+
 @router.get("/{user_id}")
 async def get_user_with_details(
     user_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    fields: str = None,  # Comma-separated: id, email, interests, skills
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: Session = Depends(get_read_db)
 ):
     """
-    Get user with interests and skills
+    Get user with interests and skills (only the requested ones with `fields`)
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    fields = parse_fields(fields, USER_DETAIL_FIELDS, always=("id",)) or USER_DETAIL_FIELDS
+    user = db.query(User.id, User.email).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    return {
-        "id": user.id,
-        "email": user.email,
-        "interests": [{"id": i.id, "name": i.name, "category": i.category} for i in user.interests],
-        "skills": [{"id": s.id, "name": s.name, "category": s.category} for s in user.skills]
-    }
+    result = {name: getattr(user, name) for name in ("id", "email") if name in fields}
+    if "interests" in fields:
+        result["interests"] = row_dicts(db.query(Interest.id, Interest.name, Interest.category).join(
+            user_interests, user_interests.c.interest_id == Interest.id
+        ).filter(user_interests.c.user_id == user_id).all())
+    if "skills" in fields:
+        result["skills"] = row_dicts(db.query(Skill.id, Skill.name, Skill.category).join(
+            user_skills, user_skills.c.skill_id == Skill.id
+        ).filter(user_skills.c.user_id == user_id).all())
+    return result
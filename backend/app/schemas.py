@@ -37,6 +37,9 @@ class ProfileUpdate(ProfileBase):
 class Profile(ProfileBase):
     id: int
     user_id: int
+    city_id: Optional[int] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     is_profile_complete: bool
     created_at: datetime
     updated_at: Optional[datetime] = None
@@ -136,6 +139,7 @@ class CustomSkillCreate(BaseModel):
 class UserSearchRequest(BaseModel):
     query: str
     limit: int = 10
+    cursor: Optional[str] = None  # X-Next-Cursor of the previous page
 
 class UserSearchResult(BaseModel):
     user_id: int
@@ -146,6 +150,19 @@ class UserSearchResult(BaseModel):
     bio: Optional[str]
     profile_picture: Optional[str]
 
+# Batch profile schemas
+class UserBatchRequest(BaseModel):
+    user_ids: List[int]
+
+class TagSummary(BaseModel):
+    id: int
+    name: str
+    category: Optional[str] = None
+
+class ProfileDetails(Profile):
+    interests: List[TagSummary]
+    skills: List[TagSummary]
+
 # Chat schemas
 class MessageCreate(BaseModel):
     recipient_id: int
@@ -0,0 +1,144 @@
+"""
+On-disk snapshots of the compatibility engine state.
+
+Layout under the snapshot root:
+
+    CURRENT                 version number of the snapshot to serve
+    v000042/
+        manifest.json       format, version, creation time, sizes
+        tfidf.json          vectorizer parameters and terms (by column)
+        tfidf_idf.npy       IDF weights
+        features/           ProfileFeatureStore columns (.npy) and
+                            name vocabularies (cities, interests, skills)
+
+A snapshot is written into a hidden temporary directory, fsynced, renamed
+into place and only then published by replacing CURRENT, so readers never
+see a partial snapshot. Workers memory-map the .npy files read-only: the
+pages live in the OS page cache once and are shared by every worker.
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+SNAPSHOT_FORMAT = 2  # 2: profile coordinates
+CURRENT_FILE = "CURRENT"
+
+class SnapshotError(Exception):
+    pass
+
+def snapshot_path(root, version):
+    return os.path.join(root, f"v{version:06d}")
+
+def current_version(root):
+    """Published snapshot version, or None if there is none"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as fh:
+            return int(fh.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _fsync_tree(directory):
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            with open(os.path.join(dirpath, filename), "rb") as fh:
+                os.fsync(fh.fileno())
+
+def _publish(root, version):
+    temp_path = os.path.join(root, f".{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as fh:
+        fh.write(f"{version}\n")
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(temp_path, os.path.join(root, CURRENT_FILE))
+
+def write_snapshot(root, vectorizer, features, keep=3):
+    """Write and publish a new snapshot of (vectorizer, features); returns its version"""
+    os.makedirs(root, exist_ok=True)
+    existing = [v for v in list_versions(root)]
+    version = max(existing + [current_version(root) or 0]) + 1
+
+    temp_dir = tempfile.mkdtemp(prefix=".building-", dir=root)
+    try:
+        features.save(os.path.join(temp_dir, "features"))
+        terms = []
+        if vectorizer is not None:
+            terms = [None] * len(vectorizer.vocabulary_)
+            for term, column in vectorizer.vocabulary_.items():
+                terms[column] = term
+            np.save(os.path.join(temp_dir, "tfidf_idf.npy"), vectorizer.idf_.astype(np.float64))
+        with open(os.path.join(temp_dir, "tfidf.json"), "w", encoding="utf-8") as fh:
+            json.dump({
+                "fitted": vectorizer is not None,
+                "max_features": vectorizer.max_features if vectorizer is not None else None,
+                "stop_words": vectorizer.stop_words if vectorizer is not None else None,
+                "terms": terms,
+            }, fh)
+        with open(os.path.join(temp_dir, "manifest.json"), "w", encoding="utf-8") as fh:
+            json.dump({
+                "format": SNAPSHOT_FORMAT,
+                "version": version,
+                "created_at": time.time(),
+                "profiles": len(features),
+                "bytes": features.memory_bytes(),
+            }, fh)
+        _fsync_tree(temp_dir)
+        os.rename(temp_dir, snapshot_path(root, version))
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+    _publish(root, version)
+    prune(root, keep)
+    return version
+
+def list_versions(root):
+    versions = []
+    for name in os.listdir(root) if os.path.isdir(root) else []:
+        if name.startswith("v") and name[1:].isdigit():
+            versions.append(int(name[1:]))
+    return sorted(versions)
+
+def prune(root, keep):
+    """
+    Delete all but the newest `keep` snapshots. Workers still mapping a
+    deleted snapshot keep working: unlinked files stay readable while mapped.
+    """
+    current = current_version(root)
+    for version in list_versions(root)[:-keep] if keep > 0 else []:
+        if version != current:
+            shutil.rmtree(snapshot_path(root, version), ignore_errors=True)
+
+def load_snapshot(root, version=None, mmap=True):
+    """
+    Load a snapshot (the published one by default). Returns
+    (manifest, vectorizer, features); vectorizer is None if the snapshot
+    had no indexable bios.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from app.feature_store import ProfileFeatureStore
+
+    version = version if version is not None else current_version(root)
+    if version is None:
+        raise SnapshotError(f"No snapshot published in {root}")
+    directory = snapshot_path(root, version)
+    with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format')} in {directory}")
+
+    with open(os.path.join(directory, "tfidf.json"), encoding="utf-8") as fh:
+        tfidf = json.load(fh)
+    vectorizer = None
+    if tfidf["fitted"]:
+        vectorizer = TfidfVectorizer(
+            max_features=tfidf["max_features"], stop_words=tfidf["stop_words"],
+            vocabulary={term: column for column, term in enumerate(tfidf["terms"])},
+        )
+        vectorizer.idf_ = np.load(os.path.join(directory, "tfidf_idf.npy"))
+
+    features = ProfileFeatureStore.load(os.path.join(directory, "features"), mmap=mmap)
+    return manifest, vectorizer, features
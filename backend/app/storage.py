@@ -0,0 +1,159 @@
+import os
+import re
+from abc import ABC, abstractmethod
+import shutil
+import time
+
+from fastapi.staticfiles import StaticFiles
+
+AVATAR_STORAGE = os.getenv("AVATAR_STORAGE", "local")
+
+# Content-addressed keys: "ab/cd/<sha256>_<variant>.webp". The hash never
+# changes for a given image, so URLs built from these keys can be cached
+# forever.
+CONTENT_KEY_RE = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})_[a-z]+\.[a-z]+$")
+CONTENT_FILENAME_RE = re.compile(r"(^|/)[0-9a-f]{64}_[a-z]+\.[a-z]+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MUTABLE_CACHE_CONTROL = "public, max-age=300"
+
+def content_key(digest, variant, extension="webp"):
+    """Sharded storage key for one variant of a content hash"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}_{variant}.{extension}"
+
+def digest_from_key(key):
+    match = CONTENT_KEY_RE.match(key)
+    return match.group(1) if match else None
+
+class StorageBackend(ABC):
+    """
+    Where avatar blobs live. Keys are relative paths; url() returns what
+    clients should request. Implementations: LocalDiskStorage (an object
+    store backend would implement the same methods).
+    """
+
+    @abstractmethod
+    def put_file(self, key, source_path):
+        """Store the file at source_path under key (atomic replace)"""
+
+    @abstractmethod
+    def exists(self, key):
+        pass
+
+    @abstractmethod
+    def touch(self, key):
+        """Reset a blob's modified time to now; False if it is not stored"""
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    @abstractmethod
+    def url(self, key):
+        pass
+
+    @abstractmethod
+    def key_from_url(self, url):
+        """Inverse of url(); None for URLs this backend does not own"""
+
+    @abstractmethod
+    def iter_keys(self):
+        """Yield (key, modified_timestamp) for every stored blob"""
+
+class LocalDiskStorage(StorageBackend):
+    """Blobs under a local directory, served by the /uploads static mount"""
+
+    def __init__(self, root, url_prefix):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip("/")
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def put_file(self, key, source_path):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, path)  # readers never see half a file
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def touch(self, key):
+        try:
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key):
+        return f"{self.url_prefix}/{key}"
+
+    def key_from_url(self, url):
+        if not url or not url.startswith(self.url_prefix + "/"):
+            return None
+        return url[len(self.url_prefix) + 1:]
+
+    def iter_keys(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if CONTENT_KEY_RE.match(key):
+                    yield key, os.path.getmtime(path)
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles that marks content-addressed files as immutable so browsers
+    and proxies cache them indefinitely; anything else gets a short max-age.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        path = str(full_path).replace(os.sep, "/")
+        if CONTENT_FILENAME_RE.search(path):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers["Cache-Control"] = MUTABLE_CACHE_CONTROL
+        return response
+
+_avatar_storage = None
+
+def get_avatar_storage():
+    global _avatar_storage
+    if _avatar_storage is None:
+        if AVATAR_STORAGE != "local":
+            raise ValueError(f"Unknown AVATAR_STORAGE backend: {AVATAR_STORAGE}")
+        _avatar_storage = LocalDiskStorage("uploads/avatars", "/uploads/avatars")
+    return _avatar_storage
+
+def collect_garbage(storage, referenced_urls, grace_seconds=3600, dry_run=False):
+    """
+    Delete content-addressed blobs whose hash is not referenced by any URL
+    in referenced_urls. Blobs younger than grace_seconds are kept so that
+    uploads in flight (stored but not yet committed to a profile) survive;
+    re-uploads touch() the blobs they reuse for the same reason. Keys are
+    deleted as they are listed, so a blob's age is read just before it goes.
+    Returns the list of deleted keys.
+    """
+    referenced = set()
+    for url in referenced_urls:
+        digest = digest_from_key(storage.key_from_url(url) or "")
+        if digest:
+            referenced.add(digest)
+
+    cutoff = time.time() - grace_seconds
+    deleted = []
+    for key, modified in storage.iter_keys():
+        if digest_from_key(key) in referenced or modified > cutoff:
+            continue
+        if not dry_run:
+            storage.delete(key)
+        deleted.append(key)
+    return deleted
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: how long a fresh worker takes to import the app and
+how much memory it holds afterwards.
+
+Each run imports the target module in a new interpreter, so nothing is
+shared between runs. With --top, one extra run uses `python -X importtime`
+and lists the slowest modules (cumulative time, including their imports).
+With --first-request, the child also serves one request through the test
+client so the cost of lazily loaded modules is visible separately.
+
+Usage:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --runs 10 --top 15
+    python -m benchmarks.import_time --first-request /api/recommendations/?limit=10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executed in the child interpreter; prints one JSON line
+CHILD_SCRIPT = """
+import json, resource, sys, time
+started = time.perf_counter()
+module = __import__({module!r}, fromlist=["_"])
+imported = time.perf_counter() - started
+result = {{
+    "import_seconds": imported,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules_loaded": len(sys.modules),
+    "sklearn_loaded": "sklearn" in sys.modules,
+}}
+path = {first_request!r}
+if path:
+    from fastapi.testclient import TestClient
+    started = time.perf_counter()
+    response = TestClient(module.app).get(path)
+    result["first_request_seconds"] = time.perf_counter() - started
+    result["first_request_status"] = response.status_code
+    result["max_rss_after_request_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps(result))
+"""
+
+def run_child(module, first_request=None):
+    script = CHILD_SCRIPT.format(module=module, first_request=first_request)
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=BACKEND_DIR,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def slowest_imports(module, top):
+    """(cumulative_us, module_name) of the slowest imports under -X importtime"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=BACKEND_DIR,
+        capture_output=True, text=True, check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.rstrip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app import time and memory per worker")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list (0 to skip)")
+    parser.add_argument("--first-request", help="path to GET once after import, e.g. /health")
+    parser.add_argument("--output", help="write the summary as JSON to this path")
+    args = parser.parse_args()
+
+    runs = [run_child(args.module, args.first_request) for _ in range(args.runs)]
+    import_times = [r["import_seconds"] * 1000 for r in runs]
+    summary = {
+        "module": args.module,
+        "runs": args.runs,
+        "import_ms_median": statistics.median(import_times),
+        "import_ms_min": min(import_times),
+        "max_rss_mb_median": statistics.median(r["max_rss_kb"] for r in runs) / 1024,
+        "modules_loaded": runs[-1]["modules_loaded"],
+        "sklearn_loaded_at_import": runs[-1]["sklearn_loaded"],
+    }
+    if args.first_request:
+        summary["first_request_ms_median"] = statistics.median(
+            r["first_request_seconds"] * 1000 for r in runs
+        )
+        summary["first_request_status"] = runs[-1]["first_request_status"]
+        summary["max_rss_after_request_mb_median"] = statistics.median(
+            r["max_rss_after_request_kb"] for r in runs
+        ) / 1024
+
+    print(f"🚀 import {args.module}: median {summary['import_ms_median']:.0f}ms "
+          f"(min {summary['import_ms_min']:.0f}ms), "
+          f"RSS {summary['max_rss_mb_median']:.1f}MB, {summary['modules_loaded']} modules, "
+          f"sklearn loaded: {summary['sklearn_loaded_at_import']}")
+    if args.first_request:
+        print(f"   first GET {args.first_request}: {summary['first_request_ms_median']:.0f}ms "
+              f"(status {summary['first_request_status']}), "
+              f"RSS {summary['max_rss_after_request_mb_median']:.1f}MB")
+
+    if args.top:
+        summary["slowest_imports"] = []
+        print("   slowest imports (cumulative):")
+        for cumulative, name in slowest_imports(args.module, args.top):
+            summary["slowest_imports"].append({"module": name.strip(), "cumulative_ms": cumulative / 1000})
+            print(f"   {cumulative / 1000:9.1f}ms {name}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(summary, fh, indent=2)
+        print(f"📄 Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
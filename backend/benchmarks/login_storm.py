@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Login storm benchmark: many concurrent logins while a probe keeps calling
+cheap endpoints, to check that password hashing does not stall the event
+loop for everyone else.
+
+The app runs in-process (one event loop, like one worker) behind an ASGI
+transport. Probe latency is measured alone first, then during the storm.
+With --inline, verification runs on the event loop instead of the hashing
+threads of app/auth.py, which shows what the executor protects against.
+
+Logins use the synthetic users (benchmarks/synthetic_data.py); the first
+login of a user with a legacy hash rewrites it, so use a scratch database.
+
+Usage:
+    python -m benchmarks.login_storm
+    python -m benchmarks.login_storm --concurrency 64 --seconds 10 --output storm.json
+    python -m benchmarks.login_storm --inline
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app import auth
+from app.database import SessionLocal
+from app.main import app
+from app.models import User
+from app.routers import auth as auth_router
+from benchmarks.synthetic_data import SYNTHETIC_PASSWORD
+
+PROBE_PATHS = ("/health", "/api/users/interests")
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def summarize(latencies):
+    return {
+        "calls": len(latencies),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": max(latencies) if latencies else None,
+    }
+
+async def probe(client, stop, latencies, interval):
+    """Call the probe endpoints in turn until `stop` is set"""
+    calls = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get(PROBE_PATHS[calls % len(PROBE_PATHS)])
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise SystemExit(f"❌ Probe {response.request.url.path} returned {response.status_code}")
+        calls += 1
+        await asyncio.sleep(interval)
+
+async def log_in(client, emails, stop, outcomes, latencies):
+    """Log in as the given users in turn until `stop` is set"""
+    index = 0
+    while not stop.is_set():
+        email = emails[index % len(emails)]
+        index += 1
+        started = time.perf_counter()
+        response = await client.post("/api/auth/login", json={"email": email, "password": SYNTHETIC_PASSWORD})
+        latencies.append((time.perf_counter() - started) * 1000)
+        outcomes[response.status_code] = outcomes.get(response.status_code, 0) + 1
+
+async def run(args, emails):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        baseline = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, stop, baseline, args.probe_interval))
+        await asyncio.sleep(args.seconds / 2)
+        stop.set()
+        await task
+
+        during, login_latencies, outcomes = [], [], {}
+        stop = asyncio.Event()
+        tasks = [asyncio.create_task(probe(client, stop, during, args.probe_interval))]
+        tasks += [asyncio.create_task(log_in(client, emails[i::args.concurrency], stop, outcomes, login_latencies))
+                  for i in range(args.concurrency)]
+        started = time.perf_counter()
+        await asyncio.sleep(args.seconds)
+        stop.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    return baseline, during, login_latencies, outcomes, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Probe endpoint latency during a login storm")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent login loops")
+    parser.add_argument("--seconds", type=float, default=8, help="length of the storm")
+    parser.add_argument("--users", type=int, default=200, help="synthetic users to log in as")
+    parser.add_argument("--probe-interval", type=float, default=0.01, help="pause between probe calls (s)")
+    parser.add_argument("--inline", action="store_true",
+                        help="verify passwords on the event loop instead of the hashing threads")
+    parser.add_argument("--output", help="write the summary as JSON to this path")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        emails = [email for (email,) in db.query(User.email).filter(
+            User.email.like("%@synthetic.example.com")
+        ).order_by(User.id).limit(args.users)]
+    finally:
+        db.close()
+    if len(emails) < args.concurrency:
+        raise SystemExit("❌ Not enough synthetic users; run python -m benchmarks.synthetic_data first")
+
+    if args.inline:
+        async def verify_inline(plain_password, hashed_password):
+            if hashed_password is None:
+                return auth._verify_unknown(plain_password)
+            return auth.verify_and_update_password(plain_password, hashed_password)
+        auth_router.verify_password_async = verify_inline
+
+    mode = "inline" if args.inline else f"executor ({auth.PASSWORD_HASH_WORKERS} threads)"
+    print(f"🔐 {args.concurrency} concurrent logins for {args.seconds:g}s, "
+          f"bcrypt cost {auth.PASSWORD_HASH_ROUNDS}, hashing {mode}")
+    baseline, during, login_latencies, outcomes, elapsed = asyncio.run(run(args, emails))
+
+    summary = {
+        "mode": "inline" if args.inline else "executor",
+        "rounds": auth.PASSWORD_HASH_ROUNDS,
+        "workers": auth.PASSWORD_HASH_WORKERS,
+        "concurrency": args.concurrency,
+        "probe_baseline": summarize(baseline),
+        "probe_during_storm": summarize(during),
+        "logins": {**summarize(login_latencies), "per_second": len(login_latencies) / elapsed,
+                   "status_codes": {str(code): count for code, count in sorted(outcomes.items())}},
+    }
+    for label, key in (("probe alone", "probe_baseline"), ("probe in storm", "probe_during_storm"),
+                       ("logins", "logins")):
+        stats = summary[key]
+        print(f"   {label:15s} {stats['calls']:6d} calls  p50 {stats['p50_ms']:8.1f}ms  "
+              f"p99 {stats['p99_ms']:8.1f}ms  max {stats['max_ms']:8.1f}ms")
+    print(f"   {summary['logins']['per_second']:.1f} logins/s, status codes {summary['logins']['status_codes']}")
+    if summary["probe_baseline"]["p50_ms"]:
+        print(f"   Probe p99 during the storm: "
+              f"{summary['probe_during_storm']['p99_ms'] / summary['probe_baseline']['p99_ms']:.1f}x alone")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(summary, fh, indent=2)
+        print(f"📄 Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
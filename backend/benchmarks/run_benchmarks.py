@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Latency / throughput benchmark for the hot API handlers.
+
+Calls the router functions directly (no HTTP layer) against the configured
+database and reports p50/p95/p99 latency, throughput, SQL statements issued
+and, on PostgreSQL, rows scanned per call. Results are written as JSON so
+runs can be compared with --compare.
+
+Run it against a scratch database: like_user writes match rows.
+
+Usage:
+    python -m benchmarks.synthetic_data --users 10000
+    python -m benchmarks.run_benchmarks --iterations 50 --output before.json
+    python -m benchmarks.run_benchmarks --iterations 50 --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, text
+
+from app.database import SessionLocal, engine
+from app.models import User, Profile
+from app.schemas import UserSearchRequest
+
+DEFAULT_RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+REGRESSION_THRESHOLD = 0.10  # 10% slower p50/p99 counts as a regression
+
+class SQLCounter:
+    """Counts statements and time spent in the database driver"""
+
+    def __init__(self, bind):
+        self.bind = bind
+        self.statements = 0
+        self.sql_time = 0.0
+        self._started = {}
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self._started[id(cursor)] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+        started = self._started.pop(id(cursor), None)
+        if started is not None:
+            self.sql_time += time.perf_counter() - started
+
+    def __enter__(self):
+        event.listen(self.bind, "before_cursor_execute", self._before)
+        event.listen(self.bind, "after_cursor_execute", self._after)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.bind, "before_cursor_execute", self._before)
+        event.remove(self.bind, "after_cursor_execute", self._after)
+
+def rows_scanned_total():
+    """Total tuples read by sequential and index scans (PostgreSQL only)"""
+    if engine.dialect.name != "postgresql":
+        return None
+    with engine.connect() as conn:
+        # Statistics are flushed lazily; force it where supported (PG15+)
+        try:
+            conn.execute(text("SELECT pg_stat_force_next_flush()"))
+        except Exception:
+            conn.rollback()
+        row = conn.execute(text(
+            "SELECT coalesce(sum(seq_tup_read), 0) + coalesce(sum(idx_tup_fetch), 0) "
+            "FROM pg_stat_user_tables"
+        )).scalar()
+        return int(row)
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def _load_caller(db, user_id, kind):
+    """Resolve the caller the way the endpoint's auth dependency does"""
+    if kind == "principal":
+        from app.auth import load_principal
+        return load_principal(db, user_id)
+    return db.query(User).filter(User.id == user_id).first()
+
+def build_scenarios():
+    """
+    Map endpoint name -> (caller kind, coroutine factory taking
+    (db, current_user, rng, user_ids)). The caller kind says whether the
+    handler depends on get_current_user ("user") or get_current_principal.
+    """
+    from fastapi import Request, Response
+    from app.routers import recommendations, ai_search, users, chat, matches
+    from app.admission import Admission, admission_controllers
+    from app.ml_engine import get_engine
+
+    ml_engine = get_engine()
+    # List endpoints read Accept-Encoding (fast JSON path) and the URL (next-page link) from it
+    request = Request({"type": "http", "path": "/", "headers": []})
+
+    queries = [
+        "developers in san francisco",
+        "musician who likes gaming",
+        "fitness people age 30",
+        "startup founders in new york",
+        "designers interested in photography",
+    ]
+    names = ["john", "smi", "anna", "lee", "mar", "ivan"]
+
+    def admitted(name):
+        # The handlers' own cost: admission control always lets the call through
+        return Admission(admission_controllers[name], Response())
+
+    def get_recommendations(db, current_user, rng, user_ids):
+        return recommendations.get_recommendations(
+            request=request, response=Response(), limit=10, admission=admitted("recommendations"),
+            current_user=current_user, db=db, ml_engine=ml_engine
+        )
+
+    def ai_search_people(db, current_user, rng, user_ids):
+        search = UserSearchRequest(query=rng.choice(queries), limit=10)
+        return ai_search.ai_search_people(
+            search_request=search, request=request, response=Response(), admission=admitted("ai_search"),
+            current_user=current_user, db=db, ml_engine=ml_engine
+        )
+
+    def search_users(db, current_user, rng, user_ids):
+        return users.search_users(
+            query=rng.choice(names), request=request, response=Response(), limit=10,
+            current_user=current_user, db=db
+        )
+
+    def get_conversations(db, current_user, rng, user_ids):
+        return chat.get_conversations(request=request, current_user=current_user, db=db)
+
+    def like_user(db, current_user, rng, user_ids):
+        target = rng.choice(user_ids)
+        while target == current_user.id:
+            target = rng.choice(user_ids)
+        return matches.like_user(
+            matched_user_id=target, current_user=current_user, db=db, ml_engine=ml_engine
+        )
+
+    return {
+        "get_recommendations": ("principal", get_recommendations),
+        "ai_search_people": ("user", ai_search_people),
+        "search_users": ("principal", search_users),
+        "get_conversations": ("principal", get_conversations),
+        "like_user": ("principal", like_user),
+    }
+
+def run_endpoint(name, scenario, user_ids, iterations, warmup, seed, warm_cache=False):
+    from app.result_cache import result_cache
+
+    caller_kind, factory = scenario
+    rng = random.Random(seed)
+    latencies = []
+    statements = []
+    sql_times = []
+    rows_before = rows_scanned_total()
+
+    for i in range(warmup + iterations):
+        db = SessionLocal()
+        try:
+            current_user = _load_caller(db, rng.choice(user_ids), caller_kind)
+            if not warm_cache:
+                result_cache.clear()  # measure the ranking, not cache hits
+            with SQLCounter(engine) as counter:
+                started = time.perf_counter()
+                asyncio.run(factory(db, current_user, rng, user_ids))
+                elapsed = time.perf_counter() - started
+        finally:
+            db.close()
+        if i >= warmup:
+            latencies.append(elapsed)
+            statements.append(counter.statements)
+            sql_times.append(counter.sql_time)
+
+    rows_after = rows_scanned_total()
+    latencies.sort()
+    total = sum(latencies)
+    result = {
+        "iterations": iterations,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": total / len(latencies) * 1000,
+        "throughput_rps": len(latencies) / total if total else 0.0,
+        "sql_statements_per_call": sum(statements) / len(statements),
+        "sql_time_ms_per_call": sum(sql_times) / len(sql_times) * 1000,
+        "rows_scanned_per_call": None,
+    }
+    if rows_before is not None and rows_after is not None:
+        # Includes warm-up calls and the user loads done by the harness
+        result["rows_scanned_per_call"] = (rows_after - rows_before) / (warmup + iterations)
+    return result
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+def compare(results, baseline_path):
+    """Print per-endpoint deltas against a previous run; return True on regression"""
+    with open(baseline_path, encoding="utf-8") as fh:
+        baseline = json.load(fh)
+
+    regressed = False
+    print(f"\n📊 Comparison with {baseline_path}")
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            print(f"   {name}: no baseline")
+            continue
+        for metric in ("p50_ms", "p99_ms", "sql_statements_per_call"):
+            before, after = previous[metric], current[metric]
+            change = (after - before) / before if before else 0.0
+            flag = ""
+            if metric != "sql_statements_per_call" and change > REGRESSION_THRESHOLD:
+                flag = "  ⚠️ regression"
+                regressed = True
+            elif metric == "sql_statements_per_call" and after > before:
+                flag = "  ⚠️ more queries"
+                regressed = True
+            print(f"   {name:22s} {metric:24s} {before:10.2f} -> {after:10.2f} ({change:+.1%}){flag}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hot API handlers")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--endpoints", help="comma-separated subset of endpoints to run")
+    parser.add_argument("--output", help="path of the JSON results file")
+    parser.add_argument("--compare", help="baseline JSON results to compare against")
+    parser.add_argument("--warm-cache", action="store_true",
+                        help="keep the search result cache between calls (default: cleared)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        user_ids = [row[0] for row in db.query(User.id).join(Profile).filter(
+            Profile.is_profile_complete == True
+        ).all()]
+    finally:
+        db.close()
+
+    if len(user_ids) < 2:
+        print("❌ Not enough users with complete profiles. Seed some first:")
+        print("   python -m benchmarks.synthetic_data --users 10000")
+        sys.exit(1)
+
+    # Same engine state the app builds on startup
+    from app.ml_engine import engine_registry
+    engine_registry.warm_up(SessionLocal)
+
+    scenarios = build_scenarios()
+    if args.endpoints:
+        wanted = [e.strip() for e in args.endpoints.split(",")]
+        scenarios = {name: scenarios[name] for name in wanted}
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "database": engine.dialect.name,
+            "users_with_profiles": len(user_ids),
+            "python": platform.python_version(),
+            "iterations": args.iterations,
+        },
+        "endpoints": {},
+        "errors": {},
+    }
+
+    print(f"🚀 Benchmarking against {engine.dialect.name} with {len(user_ids)} profiles")
+    for name, scenario in scenarios.items():
+        try:
+            stats = run_endpoint(name, scenario, user_ids, args.iterations, args.warmup, args.seed,
+                                 warm_cache=args.warm_cache)
+        except Exception as e:
+            results["errors"][name] = repr(e)
+            print(f"   {name:22s} ❌ failed: {e!r}")
+            continue
+        results["endpoints"][name] = stats
+        print(
+            f"   {name:22s} p50={stats['p50_ms']:8.2f}ms p99={stats['p99_ms']:8.2f}ms "
+            f"{stats['throughput_rps']:8.1f} req/s  {stats['sql_statements_per_call']:.1f} queries/call"
+        )
+
+    output = args.output
+    if not output:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"benchmark-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as fh:
+        json.dump(results, fh, indent=2)
+    print(f"✅ Results written to {output}")
+
+    if args.compare and compare(results, args.compare):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Serialization benchmark for list endpoints: the default path (a Pydantic
+model per row, validated again through response_model by FastAPI and
+rendered by JSONResponse) against the fast path of app/fast_json.py
+(dicts from row tuples, one orjson call), plus bytes over the wire
+uncompressed, gzipped and, when brotli is installed, brotli-compressed.
+
+Rows are synthetic, so no database is needed.
+
+Usage:
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --rows 1000 --runs 50 --output serialization.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from starlette.requests import Request
+
+from app import fast_json
+from app.schemas import Recommendation, InterestSchema, Chat, Message
+
+WORDS = ("music travel python hiking design startup coffee photography running chess "
+         "cooking yoga data science film guitar painting climbing reading").split()
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def make_rows(shape, count, rng):
+    """`count` dicts shaped like the endpoint's response rows"""
+    now = datetime(2024, 6, 1, 12, 0, 0)
+    if shape == "recommendations":
+        return [{
+            "user_id": i, "first_name": f"First{i}", "last_name": f"Last{i}",
+            "age": rng.randint(18, 65), "city": rng.choice(["Berlin", "Paris", "New York", None]),
+            "bio": _text(rng, 30), "profile_picture": f"/uploads/avatars/{i:08x}_sm.webp",
+            # Scores come as floats or, from the cold engine path, numpy floats
+            "compatibility_score": np.float64(rng.random()) if i % 2 else rng.random(),
+            "common_interests": rng.sample(WORDS, 3), "common_skills": rng.sample(WORDS, 2),
+        } for i in range(count)]
+    if shape == "interests":
+        return [{"id": i, "name": f"{rng.choice(WORDS)} {i}", "category": rng.choice(["Custom", "Sports", None]),
+                 "created_at": now - timedelta(minutes=i)} for i in range(count)]
+    if shape == "conversations":
+        return [{"user_id": i, "first_name": f"First{i}", "last_name": f"Last{i}",
+                 "last_message": _text(rng, 12), "last_message_time": now - timedelta(seconds=i * 37),
+                 "unread_count": rng.randint(0, 5)} for i in range(count)]
+    return [{"id": i, "sender_id": rng.choice([1, 2]), "recipient_id": rng.choice([1, 2]),
+             "content": _text(rng, 15), "created_at": now + timedelta(seconds=i * 11, microseconds=i),
+             "is_read": rng.random() < 0.5} for i in range(count)]
+
+SHAPES = {
+    "recommendations": Recommendation,
+    "interests": InterestSchema,
+    "conversations": Chat,
+    "messages": Message,
+}
+
+def default_path(model, field, rows):
+    """What the endpoints did: models per row, response_model validation, JSONResponse"""
+    items = [model(**row) for row in rows]
+    content = asyncio.run(serialize_response(field=field, response_content=items))
+    return JSONResponse(content).body
+
+def timed(fn, runs):
+    """(median ms, result of the last run)"""
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare list response serialization paths")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the summary as JSON to this path")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    plain = Request({"type": "http", "headers": []})
+    summary = {"rows": args.rows, "runs": args.runs, "orjson": fast_json.orjson is not None,
+               "brotli": fast_json.brotli is not None, "shapes": {}}
+    print(f"📦 {args.rows}-row responses, median of {args.runs} runs "
+          f"(orjson: {summary['orjson']}, brotli: {summary['brotli']})")
+
+    for shape, model in SHAPES.items():
+        rows = make_rows(shape, args.rows, rng)
+        field = create_response_field(name=f"Response_{shape}", type_=List[model])
+        default_ms, default_body = timed(lambda: default_path(model, field, rows), args.runs)
+        fast_ms, fast_body = timed(lambda: fast_json.FastJSONResponse(rows, plain).body, args.runs)
+        if json.loads(default_body) != json.loads(fast_body):
+            raise SystemExit(f"❌ {shape}: fast path output differs from the default path")
+
+        gzip_ms, gzipped = timed(lambda: fast_json.compress(fast_body, "gzip"), args.runs)
+        result = {
+            "default_ms": default_ms,
+            "fast_ms": fast_ms,
+            "speedup": default_ms / fast_ms if fast_ms else None,
+            "bytes": len(fast_body),
+            "default_bytes": len(default_body),
+            "gzip_bytes": len(gzipped),
+            "gzip_ms": gzip_ms,
+        }
+        line = (f"   {shape:16s} default {default_ms:7.2f}ms  fast {fast_ms:6.2f}ms "
+                f"({result['speedup']:.1f}x)  {len(fast_body) / 1024:7.1f}KB raw, "
+                f"{len(gzipped) / 1024:6.1f}KB gzip ({gzip_ms:.2f}ms)")
+        if fast_json.brotli is not None:
+            brotli_ms, compressed = timed(lambda: fast_json.compress(fast_body, "br"), args.runs)
+            result.update(brotli_bytes=len(compressed), brotli_ms=brotli_ms)
+            line += f", {len(compressed) / 1024:6.1f}KB br ({brotli_ms:.2f}ms)"
+        summary["shapes"][shape] = result
+        print(line)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(summary, fh, indent=2)
+        print(f"📄 Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Synthetic profile generator for benchmarks and load tests.
+
+Generates users with realistic (long-tailed) interest, skill and city
+distributions and seeds them into the configured database in batches.
+
+Usage:
+    python -m benchmarks.synthetic_data --users 100000
+    python -m benchmarks.synthetic_data --users 10000 --jsonl profiles.jsonl
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from functools import lru_cache
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SYNTHETIC_EMAIL_DOMAIN = "synthetic.example.com"
+SYNTHETIC_PASSWORD = "password123"
+
+# Interest and skill vocabularies, grouped by persona so that generated users
+# have correlated interests (a developer is more likely to like hiking and AI
+# than a random draw would suggest).
+PERSONAS = {
+    "developer": {
+        "interests": ["Programming", "Technology", "Gaming", "Artificial Intelligence",
+                      "Web Development", "Hiking", "Reading", "Movies"],
+        "skills": ["Python", "JavaScript", "React", "Node.js", "Git", "Docker", "SQL",
+                   "Java", "C++", "Kotlin", "Swift", "Problem Solving"],
+        "phrases": ["full-stack developer", "love building software", "open source contributor",
+                    "exploring machine learning", "backend engineer", "tech meetups"],
+    },
+    "designer": {
+        "interests": ["Art", "Graphic Design", "Photography", "Painting", "Traveling",
+                      "Movies", "Cooking", "Writing"],
+        "skills": ["Figma", "Adobe Photoshop", "Adobe Illustrator", "UI/UX Design",
+                   "Brand Design", "Content Creation", "Communication"],
+        "phrases": ["creative designer", "digital artist", "passionate about beautiful design",
+                    "capturing moments through photography", "visual storyteller"],
+    },
+    "athlete": {
+        "interests": ["Weightlifting", "Running", "Swimming", "Basketball", "Soccer",
+                      "Tennis", "Yoga", "Hiking"],
+        "skills": ["Leadership", "Teamwork", "Communication", "Public Speaking",
+                   "Project Management"],
+        "phrases": ["fitness enthusiast", "personal trainer", "marathon runner",
+                    "looking for workout partners", "healthy lifestyle"],
+    },
+    "scientist": {
+        "interests": ["Data Science", "Research", "Reading", "Artificial Intelligence",
+                      "Technology", "Writing"],
+        "skills": ["Python", "Machine Learning", "Data Analysis", "SQL", "Problem Solving",
+                   "Communication"],
+        "phrases": ["data scientist", "AI researcher", "using data to solve real problems",
+                    "PhD in computer science", "statistics nerd"],
+    },
+    "musician": {
+        "interests": ["Music", "Dancing", "Movies", "Video Editing", "Art", "Gaming"],
+        "skills": ["Music Production", "Audio Engineering", "Sound Design",
+                   "Content Creation", "Teamwork"],
+        "phrases": ["professional musician", "music producer", "guitar and piano",
+                    "electronic music", "looking for bandmates"],
+    },
+    "entrepreneur": {
+        "interests": ["Entrepreneurship", "Marketing", "Traveling", "Reading",
+                      "Technology", "Cooking"],
+        "skills": ["Leadership", "Project Management", "Public Speaking", "Communication",
+                   "Brand Design", "Problem Solving"],
+        "phrases": ["startup founder", "business strategist", "marketing specialist",
+                    "seeking co-founders", "growing online presence"],
+    },
+    "outdoors": {
+        "interests": ["Hiking", "Photography", "Traveling", "Gardening", "Swimming",
+                      "Running", "Cooking"],
+        "skills": ["Adobe Photoshop", "Content Creation", "Teamwork", "Problem Solving"],
+        "phrases": ["outdoor enthusiast", "nature photographer", "love the mountains",
+                    "weekend camping trips", "adventure seeker"],
+    },
+}
+
+PERSONA_WEIGHTS = {
+    "developer": 0.24, "designer": 0.14, "athlete": 0.16, "scientist": 0.10,
+    "musician": 0.10, "entrepreneur": 0.14, "outdoors": 0.12,
+}
+
+# Cities with rough relative population weights
+CITIES = [
+    ("New York", 8.3), ("Los Angeles", 3.9), ("Chicago", 2.7), ("Houston", 2.3),
+    ("Phoenix", 1.6), ("Philadelphia", 1.6), ("San Antonio", 1.5), ("San Diego", 1.4),
+    ("Dallas", 1.3), ("Austin", 1.0), ("San Francisco", 0.9), ("Seattle", 0.75),
+    ("Denver", 0.72), ("Boston", 0.68), ("Nashville", 0.68), ("Portland", 0.65),
+    ("Las Vegas", 0.64), ("Miami", 0.44), ("Atlanta", 0.5), ("Minneapolis", 0.43),
+    ("London", 9.0), ("Berlin", 3.6), ("Paris", 2.1), ("Moscow", 12.0),
+    ("Saint Petersburg", 5.4), ("Toronto", 2.8), ("Amsterdam", 0.9), ("Munich", 1.5),
+]
+
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda",
+    "William", "Elizabeth", "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+    "Thomas", "Sarah", "Charles", "Karen", "Daniel", "Nancy", "Matthew", "Lisa",
+    "Anthony", "Betty", "Mark", "Sophia", "Alex", "Olivia", "Ivan", "Anna", "Dmitry",
+    "Maria", "Lukas", "Emma", "Noah", "Mia", "Liam", "Ava",
+]
+
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Wilson", "Anderson", "Taylor",
+    "Thomas", "Moore", "Jackson", "Martin", "Lee", "Ivanov", "Petrov", "Muller",
+    "Schmidt", "Dubois", "Kim", "Nguyen", "Chen", "Patel", "Cohen",
+]
+
+def zipf_weights(n, s=1.1):
+    """Long-tailed weights: the first items are much more popular than the last"""
+    return [1.0 / (rank + 1) ** s for rank in range(n)]
+
+def all_interest_names():
+    return sorted({name for p in PERSONAS.values() for name in p["interests"]})
+
+def all_skill_names():
+    return sorted({name for p in PERSONAS.values() for name in p["skills"]})
+
+def _weighted_sample(rng, population, weights, k):
+    """Sample k distinct items, favouring items with a higher weight"""
+    k = min(k, len(population))
+    chosen = []
+    pool = list(zip(population, weights))
+    for _ in range(k):
+        total = sum(w for _, w in pool)
+        pick = rng.random() * total
+        acc = 0.0
+        for i, (item, w) in enumerate(pool):
+            acc += w
+            if acc >= pick:
+                chosen.append(item)
+                pool.pop(i)
+                break
+    return chosen
+
+def generate_profiles(count, seed=42, start_id=1):
+    """
+    Yield `count` synthetic profile dicts.
+
+    Each dict is a bulk_import profile record: email, password, first_name,
+    last_name, age, city, bio, search_goals, interests, skills (plus the
+    id used to build the email).
+    Generation is deterministic for a given seed.
+    """
+    rng = random.Random(seed)
+    persona_names = list(PERSONA_WEIGHTS)
+    persona_weights = [PERSONA_WEIGHTS[p] for p in persona_names]
+    city_names = [c for c, _ in CITIES]
+    city_weights = [w for _, w in CITIES]
+    global_interests = all_interest_names()
+    global_skills = all_skill_names()
+
+    for user_id in range(start_id, start_id + count):
+        persona_name = rng.choices(persona_names, weights=persona_weights)[0]
+        persona = PERSONAS[persona_name]
+
+        # Most interests come from the persona, the rest from the global pool
+        n_interests = rng.randint(3, 8)
+        n_persona = max(1, int(n_interests * 0.7))
+        interests = _weighted_sample(
+            rng, persona["interests"], zipf_weights(len(persona["interests"])), n_persona
+        )
+        for name in rng.sample(global_interests, n_interests - n_persona):
+            if name not in interests:
+                interests.append(name)
+
+        n_skills = rng.randint(2, 7)
+        skills = _weighted_sample(
+            rng, persona["skills"], zipf_weights(len(persona["skills"])), max(1, n_skills - 1)
+        )
+        extra_skill = rng.choice(global_skills)
+        if extra_skill not in skills:
+            skills.append(extra_skill)
+
+        age = int(min(65, max(18, rng.gauss(31, 8))))
+        city = rng.choices(city_names, weights=city_weights)[0]
+        phrases = rng.sample(persona["phrases"], min(3, len(persona["phrases"])))
+        bio = ". ".join(p.capitalize() for p in phrases) + ". Into " + ", ".join(
+            i.lower() for i in interests[:3]
+        ) + "."
+
+        yield {
+            "id": user_id,
+            "email": f"user{user_id}@{SYNTHETIC_EMAIL_DOMAIN}",
+            "password": SYNTHETIC_PASSWORD,
+            "first_name": rng.choice(FIRST_NAMES),
+            "last_name": rng.choice(LAST_NAMES),
+            "age": age,
+            "city": city,
+            "bio": bio,
+            "search_goals": f"Looking for people interested in {interests[0].lower()}.",
+            "interests": interests,
+            "skills": skills,
+        }
+
+def seed_database(count, seed=42, batch_size=10000, engine=None):
+    """
+    Insert `count` synthetic users with complete profiles.
+
+    Goes through the bulk importer (COPY on PostgreSQL, batched inserts
+    elsewhere). Returns the number of users created.
+    """
+    from sqlalchemy import select, func
+    from app.database import engine as default_engine
+    from app.models import User
+    from bulk_import import import_profiles
+
+    engine = engine or default_engine
+    with engine.connect() as conn:
+        start_id = (conn.execute(select(func.max(User.id))).scalar() or 0) + 1
+
+    # Every synthetic user has SYNTHETIC_PASSWORD: one hash (one salt) is
+    # shared by all of them, as bcrypt per account would dominate seeding.
+    # Never do this for real accounts.
+    from app.auth import get_password_hash
+
+    records = generate_profiles(count, seed=seed, start_id=start_id)
+    return import_profiles(records, engine=engine, batch_size=batch_size,
+                           hash_password=lru_cache(maxsize=None)(get_password_hash))
+
+def write_jsonl(path, count, seed=42):
+    """Write synthetic profiles to a JSONL file instead of the database"""
+    with open(path, "w", encoding="utf-8") as fh:
+        for profile in generate_profiles(count, seed=seed):
+            fh.write(json.dumps(profile) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed synthetic users for benchmarks")
+    parser.add_argument("--users", type=int, default=10000, help="number of users to generate")
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+    parser.add_argument("--batch-size", type=int, default=10000, help="rows per insert batch")
+    parser.add_argument("--jsonl", help="write profiles to this JSONL file instead of the database")
+    args = parser.parse_args()
+
+    if args.jsonl:
+        write_jsonl(args.jsonl, args.users, seed=args.seed)
+        print(f"✅ Wrote {args.users} profiles to {args.jsonl}")
+        return
+
+    from app.database import Base, engine
+    import app.models  # noqa: F401 - registers the tables on Base.metadata
+    Base.metadata.create_all(bind=engine)
+
+    started = time.perf_counter()
+    created = seed_database(args.users, seed=args.seed, batch_size=args.batch_size)
+    print(f"🎉 Seeded {created} synthetic users in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Build the compatibility engine state from the database and publish it as
+a memory-mappable snapshot (see app/snapshot.py). Workers started with
+ENGINE_SNAPSHOT_DIR pointing at the same directory pick it up within
+ENGINE_SNAPSHOT_POLL seconds.
+
+Usage:
+    python build_snapshot.py                      # into $ENGINE_SNAPSHOT_DIR or ./snapshots
+    python build_snapshot.py --dir /var/lib/app/snapshots --keep 5
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and publish an engine state snapshot")
+    parser.add_argument("--dir", default=os.getenv("ENGINE_SNAPSHOT_DIR") or "snapshots",
+                        help="snapshot root directory")
+    parser.add_argument("--keep", type=int, default=3, help="number of snapshots to keep")
+    args = parser.parse_args()
+
+    from app.database import SessionLocal
+    from app.ml_engine import EngineState
+    from app.snapshot import write_snapshot
+
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        state = EngineState.build(db, version=0)
+    finally:
+        db.close()
+    print(f"⏳ Built state for {len(state.features)} profiles in {state.build_seconds:.1f}s", flush=True)
+
+    version = write_snapshot(args.dir, state.vectorizer, state.features, keep=args.keep)
+    print(f"✅ Published snapshot v{version} in {args.dir} "
+          f"({state.features.memory_bytes() / 1e6:.1f} MB, {time.perf_counter() - started:.1f}s total)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Bulk import of users, profiles, interests, skills and their associations.
+
+Input is streamed in fixed-size chunks so memory stays bounded regardless of
+file size. Interest and skill names are resolved through an in-memory
+name -> id map (one SELECT up front, one batched INSERT per chunk for new
+names) instead of a lookup per row. On PostgreSQL rows are loaded with COPY;
+other databases use executemany inserts, one transaction per chunk.
+
+Profile records (CSV or JSONL) use these fields:
+    email, password | hashed_password, first_name, last_name, age, city,
+    bio, search_goals, profile_picture, interests, skills
+In CSV, interests and skills are ";"-separated lists. Records with neither
+password nor hashed_password are skipped (and counted): no account is
+created with a default password.
+
+Plain passwords get a salted bcrypt hash each (PASSWORD_HASH_ROUNDS),
+hashed per chunk in a process pool over all cores (--hash-workers). At
+about a quarter second per hash and core that is hours for millions of
+records, so large exports should carry hashed_password (any scheme
+app/auth.py verifies), which is stored as is.
+
+Interest / skill files have the columns: name, category.
+
+Usage:
+    python bulk_import.py profiles.jsonl
+    python bulk_import.py profiles.csv --batch-size 20000
+    python bulk_import.py profiles.jsonl --hash-workers 4
+    python bulk_import.py --interests interests.csv --skills skills.csv
+
+Run a single import at a time: user and profile ids are allocated by the
+importer from the current maximum.
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import select, insert, func, text
+
+from app.database import engine as default_engine
+from app.geo import get_gazetteer
+from app.models import User, Profile, Interest, Skill, user_interests, user_skills
+
+DEFAULT_BATCH_SIZE = 10000
+LIST_SEPARATOR = ";"
+
+USER_COLUMNS = ["id", "email", "hashed_password", "is_active"]
+PROFILE_COLUMNS = [
+    "id", "user_id", "first_name", "last_name", "age", "city", "bio",
+    "profile_picture", "search_goals", "is_profile_complete",
+    "city_id", "latitude", "longitude",
+]
+
+def read_records(path, fmt=None):
+    """Yield dict records from a CSV or JSONL file, one at a time"""
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    with open(path, newline="", encoding="utf-8") as fh:
+        if fmt == "csv":
+            for row in csv.DictReader(fh):
+                yield {k: (v if v != "" else None) for k, v in row.items()}
+        else:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(LIST_SEPARATOR) if v.strip()]
+    return list(value)
+
+def _hash_password(password):
+    # A salted hash per account; imported lazily so the module can be used
+    # without the auth settings
+    from app.auth import get_password_hash
+    return get_password_hash(password)
+
+class NameResolver:
+    """In-memory name -> id map for the interests or skills table"""
+
+    def __init__(self, conn, table, default_category="General"):
+        self.table = table
+        self.default_category = default_category
+        self.ids = {name: id_ for id_, name in conn.execute(select(table.c.id, table.c.name))}
+
+    def ensure(self, conn, names, categories=None):
+        """Insert names that are not known yet (one batched INSERT) and refresh the map"""
+        categories = categories or {}
+        missing = sorted({n for n in names if n not in self.ids})
+        if not missing:
+            return 0
+        conn.execute(insert(self.table), [
+            {"name": n, "category": categories.get(n) or self.default_category} for n in missing
+        ])
+        rows = conn.execute(select(self.table.c.id, self.table.c.name).where(
+            self.table.c.name.in_(missing)
+        ))
+        self.ids.update({name: id_ for id_, name in rows})
+        return len(missing)
+
+class PasswordHasher:
+    """
+    Hashes a chunk's plain passwords, across `workers` processes once a
+    chunk has enough of them to be worth starting the pool
+    """
+
+    def __init__(self, hash_password, workers=1):
+        self.hash_password = hash_password
+        self.workers = workers
+        self._pool = None
+
+    def hash_all(self, passwords):
+        if self.workers > 1 and len(passwords) >= 4 * self.workers:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            chunksize = max(1, len(passwords) // (4 * self.workers))
+            return list(self._pool.map(self.hash_password, passwords, chunksize=chunksize))
+        return [self.hash_password(password) for password in passwords]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+
+class BulkWriter:
+    """Writes row batches with COPY on PostgreSQL and executemany elsewhere"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.use_copy = engine.dialect.name == "postgresql"
+
+    def write(self, conn, table, columns, rows):
+        if not rows:
+            return
+        if self.use_copy:
+            self._copy(conn, table.name, columns, rows)
+        else:
+            conn.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+
+    def _copy(self, conn, table_name, columns, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(["t" if v is True else "f" if v is False else v for v in row])
+        buffer.seek(0)
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+        finally:
+            cursor.close()
+
+def _reset_sequences(conn, engine):
+    """Move PostgreSQL id sequences past the explicitly allocated ids"""
+    if engine.dialect.name != "postgresql":
+        return
+    for table in ("users", "profiles"):
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"(SELECT coalesce(max(id), 1) FROM {table}))"
+        ))
+
+def import_named(records, table, engine=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Import interest or skill records (name, category); returns rows created"""
+    engine = engine or default_engine
+    created = 0
+    with engine.connect() as conn:
+        resolver = NameResolver(conn, table)
+    for chunk in chunked(records, batch_size):
+        categories = {r["name"]: r.get("category") for r in chunk if r.get("name")}
+        with engine.begin() as conn:
+            created += resolver.ensure(conn, categories.keys(), categories)
+    return created
+
+def import_profiles(records, engine=None, batch_size=DEFAULT_BATCH_SIZE, progress=True, hash_password=None,
+                    hash_workers=None):
+    """
+    Import users with complete profiles and their interest/skill associations.
+
+    Records whose email already exists are skipped. Plain passwords are
+    hashed with `hash_password` in this process, or by default with a
+    salted bcrypt hash per account in a pool of `hash_workers` processes
+    (all cores if None). Returns the number of users created.
+    """
+    engine = engine or default_engine
+    if hash_password is None:
+        hasher = PasswordHasher(_hash_password, hash_workers or os.cpu_count() or 1)
+    else:
+        hasher = PasswordHasher(hash_password, 1)
+    try:
+        return _import_profiles(records, engine, batch_size, progress, hasher)
+    finally:
+        hasher.close()
+
+def _import_profiles(records, engine, batch_size, progress, hasher):
+    writer = BulkWriter(engine)
+
+    with engine.connect() as conn:
+        interests = NameResolver(conn, Interest.__table__)
+        skills = NameResolver(conn, Skill.__table__)
+        next_user_id = (conn.execute(select(func.max(User.id))).scalar() or 0) + 1
+        next_profile_id = (conn.execute(select(func.max(Profile.id))).scalar() or 0) + 1
+
+    gazetteer = get_gazetteer()
+    created = 0
+    without_password = 0
+    started = time.perf_counter()
+    for chunk in chunked(records, batch_size):
+        with engine.begin() as conn:
+            emails = [r["email"] for r in chunk]
+            existing = set(conn.execute(select(User.email).where(User.email.in_(emails))).scalars())
+
+            interests.ensure(conn, {n for r in chunk for n in _as_list(r.get("interests"))})
+            skills.ensure(conn, {n for r in chunk for n in _as_list(r.get("skills"))})
+
+            new_records = []
+            for record in chunk:
+                email = record["email"]
+                if email in existing:
+                    continue
+                if not (record.get("hashed_password") or record.get("password")):
+                    without_password += 1
+                    continue
+                existing.add(email)
+                new_records.append(record)
+
+            # Hash the chunk's plain passwords together (bcrypt dominates the import)
+            hashes = iter(hasher.hash_all([r["password"] for r in new_records if not r.get("hashed_password")]))
+
+            user_rows, profile_rows, interest_rows, skill_rows = [], [], [], []
+            for record in new_records:
+                email = record["email"]
+                hashed = record.get("hashed_password") or next(hashes)
+                user_id, profile_id = next_user_id, next_profile_id
+                next_user_id += 1
+                next_profile_id += 1
+
+                age = record.get("age")
+                city = gazetteer.resolve(record.get("city"))
+                user_rows.append((user_id, email, hashed, True))
+                profile_rows.append((
+                    profile_id, user_id, record["first_name"], record["last_name"],
+                    int(age) if age not in (None, "") else None, record.get("city"),
+                    record.get("bio"), record.get("profile_picture"),
+                    record.get("search_goals"), True,
+                    city.id if city else None,
+                    city.latitude if city else None,
+                    city.longitude if city else None,
+                ))
+                interest_rows.extend(
+                    (user_id, interests.ids[n]) for n in dict.fromkeys(_as_list(record.get("interests")))
+                )
+                skill_rows.extend(
+                    (user_id, skills.ids[n]) for n in dict.fromkeys(_as_list(record.get("skills")))
+                )
+
+            writer.write(conn, User.__table__, USER_COLUMNS, user_rows)
+            writer.write(conn, Profile.__table__, PROFILE_COLUMNS, profile_rows)
+            writer.write(conn, user_interests, ["user_id", "interest_id"], interest_rows)
+            writer.write(conn, user_skills, ["user_id", "skill_id"], skill_rows)
+
+        created += len(user_rows)
+        if progress:
+            elapsed = time.perf_counter() - started
+            print(f"⏳ Imported {created} users ({created / elapsed:.0f} users/s)", flush=True)
+
+    if without_password:
+        print(f"⚠️  Skipped {without_password} records without a password or hashed_password", flush=True)
+    if created:
+        with engine.begin() as conn:
+            _reset_sequences(conn, engine)
+    return created
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import profiles, interests and skills")
+    parser.add_argument("profiles", nargs="?", help="CSV or JSONL file with profile records")
+    parser.add_argument("--interests", help="CSV or JSONL file with interests (name, category)")
+    parser.add_argument("--skills", help="CSV or JSONL file with skills (name, category)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="override format detection")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--hash-workers", type=int,
+                        help="processes hashing plain passwords (default: one per core)")
+    args = parser.parse_args()
+
+    if not (args.profiles or args.interests or args.skills):
+        parser.error("nothing to import")
+
+    started = time.perf_counter()
+    if args.interests:
+        count = import_named(read_records(args.interests, args.format), Interest.__table__,
+                             batch_size=args.batch_size)
+        print(f"✅ Created {count} interests")
+    if args.skills:
+        count = import_named(read_records(args.skills, args.format), Skill.__table__,
+                             batch_size=args.batch_size)
+        print(f"✅ Created {count} skills")
+    if args.profiles:
+        count = import_profiles(read_records(args.profiles, args.format), batch_size=args.batch_size,
+                                hash_workers=args.hash_workers)
+        print(f"✅ Created {count} users")
+    print(f"🎉 Import finished in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
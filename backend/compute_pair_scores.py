@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Fill and maintain the stored pair scores (see app/pair_scores.py).
+
+A full run replaces the table with every user's best partners; the
+default incremental run applies the profile change feed from the
+"pair_scores" checkpoint, recomputing only the pairs of changed users.
+bulk_import.py writes past the API and records no changes, so follow it
+with a full run. To reapply older changes, use replay_changes.py.
+
+Rebuilding is O(N²) and replaces the whole table, so it is not part of
+the API containers' start-up: the pair-scores service of docker-compose
+runs it once (--full --if-empty rebuilds only while no scores are stored)
+and then stays up applying the feed (--watch).
+
+Usage:
+    python compute_pair_scores.py --full                # rebuild everything
+    python compute_pair_scores.py --full --if-empty     # rebuild only if nothing is stored yet
+    python compute_pair_scores.py                       # catch up with the change feed once
+    python compute_pair_scores.py --watch 30            # keep catching up every 30 seconds
+                                                        # (and prune the applied feed hourly)
+
+In --watch mode the engine state is refreshed between catch-ups on the
+workers' schedule (a new snapshot when ENGINE_SNAPSHOT_DIR is set, else a
+rebuild every ENGINE_REBUILD_INTERVAL seconds), so the TF-IDF vocabulary
+follows the bios and the feature store's delta of applied changes is
+folded back into a fresh base.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds between prunes of the applied change feed in --watch mode
+PRUNE_INTERVAL = 3600
+
+def main():
+    from app.change_feed import CHANGE_FEED_BATCH_SIZE, CHANGE_FEED_RETENTION_DAYS
+    from app.ml_engine import ENGINE_REBUILD_INTERVAL, ENGINE_SNAPSHOT_DIR, ENGINE_SNAPSHOT_POLL
+    from app.pair_scores import PAIR_SCORES_PER_USER
+
+    parser = argparse.ArgumentParser(description="Compute stored pair compatibility scores")
+    parser.add_argument("--full", action="store_true", help="recompute every pair instead of changed users'")
+    parser.add_argument("--if-empty", action="store_true",
+                        help="with --full, skip the rebuild when scores are already stored")
+    parser.add_argument("--per-user", type=int, default=PAIR_SCORES_PER_USER,
+                        help="best partners stored per user")
+    parser.add_argument("--batch-size", type=int, default=CHANGE_FEED_BATCH_SIZE,
+                        help="changes applied per transaction")
+    parser.add_argument("--max-duty", type=float, default=1.0,
+                        help="largest share of time spent applying changes (pauses between batches)")
+    parser.add_argument("--watch", type=float, default=0,
+                        help="keep catching up with the change feed every N seconds")
+    parser.add_argument("--refresh-interval", type=float,
+                        default=ENGINE_SNAPSHOT_POLL if ENGINE_SNAPSHOT_DIR else ENGINE_REBUILD_INTERVAL,
+                        help="with --watch, seconds between engine state refreshes (0 = never)")
+    parser.add_argument("--prune-days", type=float, default=CHANGE_FEED_RETENTION_DAYS,
+                        help="with --watch, hourly delete applied changes older than this (0 = never)")
+    args = parser.parse_args()
+
+    from app.change_feed import prune
+    from app.database import SessionLocal
+    from app.ml_engine import engine_registry
+    from app.models import PairScore
+    from app.pair_scores import rebuild_all, pair_score_consumer
+
+    started = time.perf_counter()
+    engine_registry.warm_up(SessionLocal)
+    engine = engine_registry.compatibility
+    print(f"⏳ Engine state ready for {len(engine.state.features)} profiles "
+          f"in {time.perf_counter() - started:.1f}s", flush=True)
+
+    if args.full and args.if_empty:
+        db = SessionLocal()
+        try:
+            if db.query(PairScore.user_low_id).first() is not None:
+                print("⏭️  Pair scores already stored; catching up with the change feed instead", flush=True)
+                args.full = False
+        finally:
+            db.close()
+
+    if args.full:
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            pairs = rebuild_all(db, engine, engine.state, args.per_user)
+        finally:
+            db.close()
+        print(f"✅ Stored {pairs} pairs in {time.perf_counter() - started:.1f}s", flush=True)
+
+    consumer = pair_score_consumer(engine, args.per_user, args.batch_size)
+    pruned_at = 0.0
+    refreshed_at = time.perf_counter()
+    while True:
+        started = time.perf_counter()
+        if args.watch and args.refresh_interval > 0 and started - refreshed_at >= args.refresh_interval:
+            if engine_registry.refresh(SessionLocal):
+                print(f"🔄 Engine state v{engine.state.version} ready for {len(engine.state.features)} profiles "
+                      f"in {time.perf_counter() - started:.1f}s", flush=True)
+            refreshed_at = started
+        db = SessionLocal()
+        try:
+            applied = consumer.catch_up(db, args.max_duty)
+            if args.watch and args.prune_days > 0 and started - pruned_at >= PRUNE_INTERVAL:
+                deleted = prune(db, args.prune_days)
+                pruned_at = started
+                if deleted:
+                    print(f"🧹 Deleted {deleted} changes older than {args.prune_days:g} days", flush=True)
+        finally:
+            db.close()
+        if applied or not args.watch:
+            print(f"✅ Applied {applied} profile changes in {time.perf_counter() - started:.1f}s", flush=True)
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,9 @@ import os
 # Set SQLite database URL
 os.environ['DATABASE_URL'] = 'sqlite:///./people_search.db'
 
-from sqlalchemy.orm import Session
 from app.database import SessionLocal, engine, Base
-from app.models import User, Profile, Interest, Skill
-from app.auth import get_password_hash
+from app.models import User, Interest, Skill
+from bulk_import import import_named, import_profiles
 
 def setup_database():
     """Create all database tables"""
@@ -39,14 +38,7 @@ def create_10_test_users():
             "Soccer", "Tennis", "Painting", "Writing", "Gardening"
         ]
         
-        created_interests = 0
-        for interest_name in interests_data:
-            existing = db.query(Interest).filter(Interest.name == interest_name).first()
-            if not existing:
-                interest = Interest(name=interest_name, category="General")
-                db.add(interest)
-                created_interests += 1
-        db.commit()
+        created_interests = import_named(({"name": n} for n in interests_data), Interest.__table__)
         print(f"✅ Created {created_interests} new interests")
         
         # Create skills
@@ -60,14 +52,7 @@ def create_10_test_users():
             "Java", "C++", "PHP", "Ruby", "Swift", "Kotlin"
         ]
         
-        created_skills = 0
-        for skill_name in skills_data:
-            existing = db.query(Skill).filter(Skill.name == skill_name).first()
-            if not existing:
-                skill = Skill(name=skill_name, category="General")
-                db.add(skill)
-                created_skills += 1
-        db.commit()
+        created_skills = import_named(({"name": n} for n in skills_data), Skill.__table__)
         print(f"✅ Created {created_skills} new skills")
         
         # Test accounts data
@@ -197,51 +182,18 @@ def create_10_test_users():
         print("\n👥 Creating test accounts...")
         print("=" * 60)
         
+        existing_emails = {
+            email for (email,) in db.query(User.email).filter(
+                User.email.in_([a["email"] for a in test_accounts])
+            )
+        }
+        import_profiles(test_accounts, progress=False)
+        
         for account_data in test_accounts:
-            # Check if user exists
-            existing_user = db.query(User).filter(User.email == account_data["email"]).first()
-            if existing_user:
+            if account_data["email"] in existing_emails:
                 print(f"⚠️  {account_data['first_name']} {account_data['last_name']} ({account_data['email']}) - Already exists")
                 continue
             
-            # Create user
-            user = User(
-                email=account_data["email"],
-                hashed_password=get_password_hash(account_data["password"]),
-                is_active=True
-            )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-            
-            # Create profile
-            profile = Profile(
-                user_id=user.id,
-                first_name=account_data["first_name"],
-                last_name=account_data["last_name"],
-                age=account_data["age"],
-                city=account_data["city"],
-                bio=account_data["bio"],
-                search_goals=account_data["search_goals"],
-                is_profile_complete=True
-            )
-            db.add(profile)
-            db.commit()
-            
-            # Add interests
-            for interest_name in account_data["interests"]:
-                interest = db.query(Interest).filter(Interest.name == interest_name).first()
-                if interest:
-                    user.interests.append(interest)
-            
-            # Add skills
-            for skill_name in account_data["skills"]:
-                skill = db.query(Skill).filter(Skill.name == skill_name).first()
-                if skill:
-                    user.skills.append(skill)
-            
-            db.commit()
-            
             print(f"✅ {account_data['first_name']} {account_data['last_name']} ({account_data['email']})")
             print(f"   📍 {account_data['city']} | 🎂 {account_data['age']} years old")
             print(f"   💡 {len(account_data['interests'])} interests | 🛠️  {len(account_data['skills'])} skills")
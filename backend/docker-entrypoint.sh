@@ -20,6 +20,16 @@ else
     echo ""
 fi
 
+# Publish an engine snapshot for the workers to memory-map
+if [ -n "$ENGINE_SNAPSHOT_DIR" ]; then
+    echo "🧠 Building engine snapshot in $ENGINE_SNAPSHOT_DIR..."
+    python3 build_snapshot.py || echo "⚠️  Snapshot build failed, workers will build state themselves"
+    echo ""
+fi
+
+# Stored pair scores are built and kept up to date by the pair-scores
+# service (compute_pair_scores.py), not on every API start
+
 # Start the main application
 echo "🚀 Starting FastAPI application..."
 echo ""
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Delete avatar blobs that no profile references any more.
+
+Usage:
+    python gc_avatars.py              # delete unreferenced blobs
+    python gc_avatars.py --dry-run    # only list them
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Garbage-collect unreferenced avatar blobs")
+    parser.add_argument("--dry-run", action="store_true", help="list blobs without deleting")
+    parser.add_argument("--grace-seconds", type=int, default=3600,
+                        help="keep blobs newer than this (uploads in flight)")
+    args = parser.parse_args()
+
+    from app.database import SessionLocal
+    from app.models import Profile
+    from app.storage import get_avatar_storage, collect_garbage
+
+    db = SessionLocal()
+    try:
+        urls = [url for (url,) in db.query(Profile.profile_picture).filter(
+            Profile.profile_picture.isnot(None)
+        ).yield_per(10000)]
+    finally:
+        db.close()
+
+    deleted = collect_garbage(get_avatar_storage(), urls, args.grace_seconds, args.dry_run)
+    action = "Would delete" if args.dry_run else "Deleted"
+    for key in deleted:
+        print(f"🗑️  {key}")
+    print(f"✅ {action} {len(deleted)} unreferenced avatar blobs")
+
+if __name__ == "__main__":
+    main()
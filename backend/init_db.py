@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 """
 Initialize database and create test users on first startup
+
+Schema creation lives here rather than in app.main, so importing the app
+never touches the database. Use --schema-only to create the tables
+without seeding test users.
 """
+import argparse
 import os
 import sys
 import time
@@ -35,6 +40,7 @@ def init_database():
     """Initialize database tables"""
     try:
         from app.database import Base, engine
+        import app.models  # noqa: F401 - registers the tables on Base.metadata
         print("📦 Creating database tables...", flush=True)
         Base.metadata.create_all(bind=engine)
         print("✅ Database tables created", flush=True)
@@ -46,10 +52,9 @@ def init_database():
 def create_test_users():
     """Create 10 test users if they don't exist"""
     try:
-        from sqlalchemy.orm import Session
         from app.database import SessionLocal
-        from app.models import User, Profile, Interest, Skill
-        from app.auth import get_password_hash
+        from app.models import User, Interest, Skill
+        from bulk_import import import_named, import_profiles
         
         db = SessionLocal()
         
@@ -72,12 +77,7 @@ def create_test_users():
             "Soccer", "Tennis", "Painting", "Writing", "Gardening"
         ]
         
-        for interest_name in interests_data:
-            existing = db.query(Interest).filter(Interest.name == interest_name).first()
-            if not existing:
-                interest = Interest(name=interest_name, category="General")
-                db.add(interest)
-        db.commit()
+        import_named(({"name": n} for n in interests_data), Interest.__table__)
         
         # Create skills
         skills_data = [
@@ -89,12 +89,7 @@ def create_test_users():
             "Java", "C++", "PHP", "Ruby", "Swift", "Kotlin"
         ]
         
-        for skill_name in skills_data:
-            existing = db.query(Skill).filter(Skill.name == skill_name).first()
-            if not existing:
-                skill = Skill(name=skill_name, category="General")
-                db.add(skill)
-        db.commit()
+        import_named(({"name": n} for n in skills_data), Skill.__table__)
         
         # Test accounts data
         test_accounts = [
@@ -180,52 +175,8 @@ def create_test_users():
             }
         ]
         
-        created_count = 0
-        for account_data in test_accounts:
-            # Check if user exists
-            existing_user = db.query(User).filter(User.email == account_data["email"]).first()
-            if existing_user:
-                continue
-            
-            # Create user
-            user = User(
-                email=account_data["email"],
-                hashed_password=get_password_hash(account_data["password"]),
-                is_active=True
-            )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-            
-            # Create profile
-            profile = Profile(
-                user_id=user.id,
-                first_name=account_data["first_name"],
-                last_name=account_data["last_name"],
-                age=account_data["age"],
-                city=account_data["city"],
-                bio=account_data["bio"],
-                search_goals=account_data["search_goals"],
-                is_profile_complete=True
-            )
-            db.add(profile)
-            db.commit()
-            
-            # Add interests
-            for interest_name in account_data["interests"]:
-                interest = db.query(Interest).filter(Interest.name == interest_name).first()
-                if interest:
-                    user.interests.append(interest)
-            
-            # Add skills
-            for skill_name in account_data["skills"]:
-                skill = db.query(Skill).filter(Skill.name == skill_name).first()
-                if skill:
-                    user.skills.append(skill)
-            
-            db.commit()
-            created_count += 1
-            print(f"✅ Created: {account_data['first_name']} {account_data['last_name']} ({account_data['email']})", flush=True)
+        # Existing emails are skipped; interests and skills are linked in bulk
+        created_count = import_profiles(test_accounts, progress=False)
         
         db.close()
         print(f"🎉 Successfully created {created_count} test users!", flush=True)
@@ -239,6 +190,10 @@ def create_test_users():
         return False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create database tables and test users")
+    parser.add_argument("--schema-only", action="store_true", help="create tables, skip test users")
+    args = parser.parse_args()
+
     print("🚀 Initializing database...", flush=True)
     
     if not wait_for_db():
@@ -247,7 +202,7 @@ if __name__ == "__main__":
     if not init_database():
         sys.exit(1)
     
-    if not create_test_users():
+    if not args.schema_only and not create_test_users():
         sys.exit(1)
     
     print("✅ Database initialization complete!", flush=True)
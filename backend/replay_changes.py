@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Inspect and replay the profile change feed (see app/change_feed.py).
+
+Replaying moves a durable consumer's checkpoint back and applies the feed
+from there, e.g. after restoring derived data from a backup or fixing a
+bug in how changes were applied. Consumers are idempotent, so replaying
+changes that were already applied is safe.
+
+Usage:
+    python replay_changes.py --status                       # positions and lag
+    python replay_changes.py pair_scores --from-id 1200     # reapply changes 1200 onwards
+    python replay_changes.py pair_scores --since 2024-05-01T00:00
+    python replay_changes.py --prune-days 30                # drop old, fully applied changes
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def pair_scores_consumer(args):
+    from app.database import SessionLocal
+    from app.ml_engine import engine_registry
+    from app.pair_scores import pair_score_consumer
+
+    engine_registry.warm_up(SessionLocal)
+    engine = engine_registry.compatibility
+    return pair_score_consumer(engine, batch_size=args.batch_size)
+
+# Durable consumers by checkpoint name
+CONSUMERS = {"pair_scores": pair_scores_consumer}
+
+def main():
+    from app.change_feed import CHANGE_FEED_BATCH_SIZE
+
+    parser = argparse.ArgumentParser(description="Inspect and replay the profile change feed")
+    parser.add_argument("consumer", nargs="?", choices=sorted(CONSUMERS), help="consumer to replay")
+    parser.add_argument("--from-id", type=int, help="first change to reapply")
+    parser.add_argument("--since", type=datetime.fromisoformat,
+                        help="reapply changes recorded at or after this time (ISO format, UTC)")
+    parser.add_argument("--batch-size", type=int, default=CHANGE_FEED_BATCH_SIZE,
+                        help="changes applied per transaction")
+    parser.add_argument("--max-duty", type=float, default=1.0,
+                        help="largest share of time spent applying changes (pauses between batches)")
+    parser.add_argument("--status", action="store_true", help="show the feed head and consumer positions")
+    parser.add_argument("--prune-days", type=float,
+                        help="delete changes older than this that every consumer has applied")
+    args = parser.parse_args()
+
+    from sqlalchemy import func
+    from app.change_feed import head, prune, read_checkpoint, write_checkpoint
+    from app.database import SessionLocal
+    from app.models import ProfileChange
+
+    db = SessionLocal()
+    try:
+        if args.status:
+            oldest = db.query(func.min(ProfileChange.id)).scalar()
+            print(f"📜 Change feed head {head(db)}, oldest retained change {oldest or '-'}")
+            for name in sorted(CONSUMERS):
+                position = read_checkpoint(db, name)
+                print(f"   {name}: position {position}, {max(0, head(db) - position)} changes behind")
+
+        if args.prune_days is not None:
+            deleted = prune(db, args.prune_days)
+            print(f"🧹 Deleted {deleted} changes older than {args.prune_days:g} days")
+
+        if args.consumer is None:
+            if not (args.status or args.prune_days is not None):
+                parser.error("name a consumer to replay, or use --status / --prune-days")
+            return
+        if (args.from_id is None) == (args.since is None):
+            parser.error("replaying needs exactly one of --from-id / --since")
+
+        if args.since is not None:
+            since = args.since if args.since.tzinfo else args.since.replace(tzinfo=timezone.utc)
+            first = db.query(func.min(ProfileChange.id)).filter(ProfileChange.created_at >= since).scalar()
+            position = (first or head(db) + 1) - 1
+        else:
+            position = max(0, args.from_id - 1)
+        write_checkpoint(db, args.consumer, position)
+        db.commit()
+        print(f"⏪ {args.consumer} moved back to position {position}", flush=True)
+
+        consumer = CONSUMERS[args.consumer](args)
+        started = time.perf_counter()
+        applied = consumer.catch_up(db, args.max_duty)
+        print(f"✅ Replayed {applied} changes in {time.perf_counter() - started:.1f}s")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
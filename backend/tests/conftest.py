@@ -0,0 +1,43 @@
+"""
+Test setup: two SQLite files stand in for the primary database and a read
+replica. The environment is set before any app module is imported, since
+app.database builds its engines (and the replica router) at import time.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.mkdtemp(prefix="people_search_tests_")
+PRIMARY_PATH = os.path.join(_tmp, "primary.db")
+REPLICA_PATH = os.path.join(_tmp, "replica.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{PRIMARY_PATH}"
+os.environ["DATABASE_REPLICA_URLS"] = f"sqlite:///{REPLICA_PATH}"
+
+from app import models  # noqa: E402,F401  (registers the tables)
+from app.database import Base, engine, replica_router  # noqa: E402
+
+def replicate():
+    """Make the replica an exact copy of the primary, as replication would"""
+    engine.dispose()
+    for replica in replica_router.replicas:
+        replica.engine.dispose()
+    shutil.copyfile(PRIMARY_PATH, REPLICA_PATH)
+
+@pytest.fixture
+def databases():
+    """Empty primary and (replicated) replica; replicas healthy, no recent writers"""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    replicate()
+    for replica in replica_router.replicas:
+        replica.healthy = True
+    replica_router._recent_writers.clear()
+    yield
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_tmp, ignore_errors=True)
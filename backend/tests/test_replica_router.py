@@ -0,0 +1,95 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import database
+from app.auth import create_access_token
+from app.database import LAST_WRITE_HEADER, ReplicaRouter, SessionLocal, replica_router
+from app.main import app
+from app.models import Profile, User
+from conftest import PRIMARY_PATH, REPLICA_PATH, replicate
+
+def database_path(session):
+    return session.get_bind().url.database
+
+def test_reads_go_to_the_replica(databases):
+    with replica_router.read_session() as session:
+        assert database_path(session) == REPLICA_PATH
+        assert session.info["replica"] == replica_router.replicas[0].url
+
+def test_writer_reads_from_the_primary_within_the_window(databases):
+    replica_router.record_write(7)
+    with replica_router.read_session(7) as session:
+        assert database_path(session) == PRIMARY_PATH
+    with replica_router.read_session(8) as session:
+        assert database_path(session) == REPLICA_PATH
+
+def test_writer_reads_from_the_replica_after_the_window(databases, monkeypatch):
+    monkeypatch.setattr(database, "READ_YOUR_WRITES_WINDOW", 0)
+    replica_router.record_write(7)
+    with replica_router.read_session(7) as session:
+        assert database_path(session) == REPLICA_PATH
+
+def test_last_write_sent_by_the_client_pins_reads_to_the_primary(databases):
+    # No write recorded in this worker: only the client knows about it
+    with replica_router.read_session(7, last_write=time.time() - 1) as session:
+        assert database_path(session) == PRIMARY_PATH
+    with replica_router.read_session(7, last_write=time.time() - 3600) as session:
+        assert database_path(session) == REPLICA_PATH
+
+def test_unreachable_replica_falls_back_to_the_primary(databases, monkeypatch):
+    router = ReplicaRouter(SessionLocal, ["sqlite:////nonexistent-directory/replica.db"])
+    with router.read_session() as session:
+        with pytest.raises(OperationalError):
+            session.execute(text("SELECT 1"))
+    assert not router.replicas[0].healthy
+
+    with router.read_session() as session:
+        assert database_path(session) == PRIMARY_PATH
+    # Health checks after the retry interval keep failing
+    monkeypatch.setattr(database, "REPLICA_RETRY_INTERVAL", 0)
+    router.replicas[0].retry_at = 0.0
+    assert router.choose() is None
+
+def test_replica_is_used_again_once_healthy(databases):
+    replica = replica_router.replicas[0]
+    replica.mark_down()
+    with replica_router.read_session() as session:
+        assert database_path(session) == PRIMARY_PATH
+    replica.retry_at = 0.0
+    with replica_router.read_session() as session:
+        assert database_path(session) == REPLICA_PATH
+    assert replica.healthy
+
+def test_profile_update_is_read_back_from_any_worker(databases):
+    with SessionLocal() as db:
+        user = User(email="ada@example.com", hashed_password="x")
+        user.profile = Profile(first_name="Ada", last_name="L", bio="before")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+    replicate()
+
+    client = TestClient(app)
+    auth = {"Authorization": "Bearer " + create_access_token({"sub": str(user_id)})}
+    response = client.put("/api/users/profile", headers=auth,
+                          json={"first_name": "Ada", "last_name": "L", "bio": "after"})
+    assert response.status_code == 200
+    last_write = response.headers[LAST_WRITE_HEADER]
+    assert abs(float(last_write) - time.time()) < 60
+
+    # Same worker: it remembers the write
+    assert client.get("/api/users/profile", headers=auth).json()["bio"] == "after"
+
+    # Another worker knows nothing of it: without the header it reads the
+    # (not yet replicated) replica, with it the primary
+    replica_router._recent_writers.clear()
+    assert client.get("/api/users/profile", headers=auth).json()["bio"] == "before"
+    response = client.get("/api/users/profile", headers={**auth, LAST_WRITE_HEADER: last_write})
+    assert response.json()["bio"] == "after"
+
+    # Reads do not hand out a last-write time
+    assert LAST_WRITE_HEADER not in response.headers
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import api from '../config/axios';
+import api, { getAllPages } from '../config/axios';
 import toast from 'react-hot-toast';
 import { Send, ArrowLeft, MessageCircle, User } from 'lucide-react';
 
@@ -13,6 +13,8 @@ function Chat() {
   const [sending, setSending] = useState(false);
   const [conversations, setConversations] = useState([]);
   const [activeChat, setActiveChat] = useState(null);
+  // Cursor of the next older page of messages (null when all are loaded)
+  const [olderCursor, setOlderCursor] = useState(null);
   const messagesEndRef = useRef(null);
 
   const scrollToBottom = () => {
@@ -32,8 +34,7 @@ function Chat() {
 
   const fetchConversations = async () => {
     try {
-      const response = await api.get('/api/chat/conversations');
-      setConversations(response.data);
+      setConversations(await getAllPages('/api/chat/conversations'));
     } catch (error) {
       console.error('Failed to load conversations:', error);
     }
@@ -42,8 +43,10 @@ function Chat() {
   const fetchMessages = async (targetUserId) => {
     try {
       setLoading(true);
+      // Pages come newest first; the chat shows them oldest first
       const response = await api.get(`/api/chat/messages/${targetUserId}`);
-      setMessages(response.data);
+      setMessages([...response.data].reverse());
+      setOlderCursor(response.headers['x-next-cursor'] || null);
       setActiveChat(targetUserId);
     } catch (error) {
       toast.error('Failed to load messages');
@@ -52,6 +55,16 @@ function Chat() {
     }
   };
 
+  const fetchOlderMessages = async () => {
+    try {
+      const response = await api.get(`/api/chat/messages/${activeChat}`, { params: { cursor: olderCursor } });
+      setMessages([...[...response.data].reverse(), ...messages]);
+      setOlderCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      toast.error('Failed to load messages');
+    }
+  };
+
   const sendMessage = async (e) => {
     e.preventDefault();
     if (!newMessage.trim() || !activeChat) return;
@@ -182,6 +195,11 @@ function Chat() {
           ) : (
             <>
               <div className="messages-container">
+                {olderCursor && (
+                  <button onClick={fetchOlderMessages} className="btn btn-secondary">
+                    Load earlier messages
+                  </button>
+                )}
                 {messages.length === 0 ? (
                   <div className="empty-messages">
                     <MessageCircle size={48} className="text-muted mb-2" />
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import api from '../config/axios';
+import { getAllPages } from '../config/axios';
 import { Heart, MessageCircle, MapPin, Calendar } from 'lucide-react';
 
 function Matches() {
@@ -14,13 +14,13 @@ function Matches() {
 
   const fetchMatches = async () => {
     try {
-      const [allMatchesResponse, mutualMatchesResponse] = await Promise.all([
-        api.get('/api/matches/'),
-        api.get('/api/matches/mutual')
+      const [allMatches, allMutualMatches] = await Promise.all([
+        getAllPages('/api/matches/'),
+        getAllPages('/api/matches/mutual')
       ]);
       
-      setMatches(allMatchesResponse.data);
-      setMutualMatches(mutualMatchesResponse.data);
+      setMatches(allMatches);
+      setMutualMatches(allMutualMatches);
     } catch (error) {
       console.error('Failed to load matches:', error);
     } finally {
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import api from '../config/axios';
+import api, { getAllPages } from '../config/axios';
 import { useForm } from 'react-hook-form';
 import toast from 'react-hot-toast';
 import { MapPin, Calendar, Edit3, Save, X, Upload, Plus } from 'lucide-react';
@@ -42,8 +42,7 @@ function Profile() {
 
   const fetchInterests = async () => {
     try {
-      const response = await api.get('/api/users/interests');
-      setInterests(response.data);
+      setInterests(await getAllPages('/api/users/interests'));
     } catch (error) {
       toast.error('Failed to load interests');
     }
@@ -51,8 +50,7 @@ function Profile() {
 
   const fetchSkills = async () => {
     try {
-      const response = await api.get('/api/users/skills');
-      setSkills(response.data);
+      setSkills(await getAllPages('/api/users/skills'));
     } catch (error) {
       toast.error('Failed to load skills');
     }
@@ -157,9 +155,9 @@ function Profile() {
     if (!file) return;
 
     // Validate file type - accept common image formats
-    const allowedTypes = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'image/svg+xml'];
+    const allowedTypes = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp', 'image/bmp'];
     if (!allowedTypes.includes(file.type)) {
-      toast.error('Please select a valid image file (JPG, PNG, GIF, WebP, BMP, SVG)');
+      toast.error('Please select a valid image file (JPG, PNG, GIF, WebP, BMP)');
       return;
     }
 
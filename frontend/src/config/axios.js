@@ -12,6 +12,11 @@ const api = axios.create({
   },
 });
 
+// Time of our last write (X-Last-Write of the response that made it), sent
+// back so reads right after it are served from the primary database by any
+// backend worker
+let lastWrite = null;
+
 // Request interceptor to add auth token
 api.interceptors.request.use(
   (config) => {
@@ -19,6 +24,9 @@ api.interceptors.request.use(
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
     }
+    if (lastWrite) {
+      config.headers['X-Last-Write'] = lastWrite;
+    }
     return config;
   },
   (error) => {
@@ -29,6 +37,9 @@ api.interceptors.request.use(
 // Response interceptor to handle errors
 api.interceptors.response.use(
   (response) => {
+    if (response.headers['x-last-write']) {
+      lastWrite = response.headers['x-last-write'];
+    }
     return response;
   },
   (error) => {
@@ -41,4 +52,17 @@ api.interceptors.response.use(
   }
 );
 
+// GET every page of a paginated list endpoint (the next page's cursor is in
+// the X-Next-Cursor header) and return all the items
+export const getAllPages = async (url, params = {}) => {
+  const items = [];
+  let cursor = null;
+  do {
+    const response = await api.get(url, { params: cursor ? { ...params, cursor } : params });
+    items.push(...response.data);
+    cursor = response.headers['x-next-cursor'];
+  } while (cursor);
+  return items;
+};
+
 export default api;